@@ -0,0 +1,171 @@
+"""Bảng tổng hợp (rollup) của lịch sử dự đoán theo ngày, mô hình, vùng và hút thuốc.
+
+prediction_rollup_daily giữ count/sum/min/max của mỗi nhóm và được cập nhật trong cùng giao dịch
+với lô ghi vào predictions (history_writer.write_predictions), nên truy vấn tổng hợp chỉ đọc số
+nhóm chứ không quét bảng predictions. Các dòng có từ trước khi bật rollup (id < maintained_from_id)
+được cộng vào một lần bằng backfill, theo từng khoảng id và ghi tiến độ nên chạy lại được.
+Chạy: python analytics.py backfill | python analytics.py status
+"""
+import argparse
+import time
+from collections import defaultdict
+
+GROUP_COLUMNS = ('day', 'model', 'region', 'smoker')
+# Giá trị thay cho NULL ở bản ghi cũ thiếu cột (khóa chính không nhận NULL)
+UNKNOWN_MODEL = 'unknown'
+UNKNOWN_CODE = -1
+BACKFILL_CHUNK_ROWS = 1000000
+
+CREATE_ROLLUP_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS prediction_rollup_daily (
+        day TEXT NOT NULL,
+        model TEXT NOT NULL,
+        region INTEGER NOT NULL,
+        smoker INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        sum_prediction REAL NOT NULL,
+        min_prediction REAL,
+        max_prediction REAL,
+        PRIMARY KEY (day, model, region, smoker)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """,
+]
+UPSERT_ROLLUP = """
+    INSERT INTO prediction_rollup_daily (day, model, region, smoker, count, sum_prediction, min_prediction, max_prediction)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (day, model, region, smoker) DO UPDATE SET
+        count = count + excluded.count,
+        sum_prediction = sum_prediction + excluded.sum_prediction,
+        min_prediction = MIN(min_prediction, excluded.min_prediction),
+        max_prediction = MAX(max_prediction, excluded.max_prediction)
+"""
+BACKFILL_CHUNK = f"""
+    SELECT substr(timestamp, 1, 10), COALESCE(model, '{UNKNOWN_MODEL}'), COALESCE(region, {UNKNOWN_CODE}),
+           COALESCE(smoker, {UNKNOWN_CODE}), COUNT(*), SUM(prediction), MIN(prediction), MAX(prediction)
+    FROM predictions
+    WHERE id > ? AND id <= ? AND prediction IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+def init_rollups(cursor):
+    """Tạo bảng rollup; lần đầu ghi lại id đầu tiên sẽ được cập nhật trực tiếp (phần trước đó chờ backfill)."""
+    for sql in CREATE_ROLLUP_TABLES:
+        cursor.execute(sql)
+    cursor.execute("""
+        INSERT OR IGNORE INTO rollup_state (name, value)
+        SELECT 'maintained_from_id', COALESCE(MAX(id), 0) + 1 FROM predictions
+    """)
+    cursor.execute("INSERT OR IGNORE INTO rollup_state (name, value) VALUES ('backfilled_through_id', 0)")
+
+
+def rollup_rows(records):
+    """Gộp các bản ghi INSERT_PREDICTION theo nhóm; trả về tham số cho UPSERT_ROLLUP."""
+    groups = defaultdict(lambda: [0, 0.0, float('inf'), float('-inf')])
+    for record in records:
+        # (user_id, age, sex, height, weight, children, smoker, region, model, prediction, timestamp)
+        prediction = record[9]
+        group = groups[(record[10][:10], record[8], record[7], record[6])]
+        group[0] += 1
+        group[1] += prediction
+        group[2] = min(group[2], prediction)
+        group[3] = max(group[3], prediction)
+    return [key + tuple(values) for key, values in groups.items()]
+
+
+def update_rollups(conn, records):
+    """Cộng một lô bản ghi vào rollup; gọi trong giao dịch ghi lô đó vào predictions."""
+    conn.executemany(UPSERT_ROLLUP, rollup_rows(records))
+
+
+def read_state(conn):
+    return dict(conn.execute("SELECT name, value FROM rollup_state"))
+
+
+def backfill(conn, chunk_rows=BACKFILL_CHUNK_ROWS, progress=None):
+    """Cộng các dòng predictions có trước khi bật rollup, mỗi khoảng chunk_rows id một giao dịch."""
+    state = read_state(conn)
+    end = state['maintained_from_id'] - 1
+    done = state['backfilled_through_id']
+    while done < end:
+        upper = min(done + chunk_rows, end)
+        rows = conn.execute(BACKFILL_CHUNK, (done, upper)).fetchall()
+        conn.executemany(UPSERT_ROLLUP, rows)
+        conn.execute("UPDATE rollup_state SET value = ? WHERE name = 'backfilled_through_id'", (upper,))
+        conn.commit()
+        done = upper
+        if progress is not None:
+            progress(done, end)
+    return end
+
+
+def backfill_complete(state):
+    return state['backfilled_through_id'] >= state['maintained_from_id'] - 1
+
+
+def query_sql(group_by):
+    """Câu truy vấn tổng hợp theo các cột group_by (tập con của GROUP_COLUMNS, đã kiểm tra)."""
+    dimensions = ", ".join(group_by)
+    select = f"{dimensions}, " if group_by else ""
+    return f"""
+        SELECT {select}SUM(count), SUM(sum_prediction), MIN(min_prediction), MAX(max_prediction)
+        FROM prediction_rollup_daily
+        WHERE day >= ? AND day <= ?
+          AND (? IS NULL OR model = ?) AND (? IS NULL OR region = ?) AND (? IS NULL OR smoker = ?)
+        {f"GROUP BY {dimensions} ORDER BY {dimensions}" if group_by else ""}
+    """
+
+
+def query_params(start, end, model=None, region=None, smoker=None):
+    return (start or '0000-00-00', end or '9999-99-99', model, model, region, region, smoker, smoker)
+
+
+def format_groups(rows, group_by):
+    groups = []
+    for row in rows:
+        count, total, low, high = row[len(group_by):]
+        if not count:
+            continue
+        groups.append({
+            **dict(zip(group_by, row)),
+            "count": count,
+            "mean_prediction": total / count,
+            "min_prediction": low,
+            "max_prediction": high,
+        })
+    return groups
+
+
+if __name__ == '__main__':
+    import sqlite3
+    from db import DATABASE_PATH
+
+    parser = argparse.ArgumentParser(description="Maintain the prediction analytics rollups.")
+    parser.add_argument('command', choices=['backfill', 'status'])
+    parser.add_argument('--database', default=DATABASE_PATH)
+    parser.add_argument('--chunk-rows', type=int, default=BACKFILL_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(predictions)")}
+    if not {'model', 'region', 'smoker'} <= columns:
+        parser.exit(1, "predictions has no typed input columns yet: start the app once to migrate the database\n")
+    init_rollups(conn.cursor())
+    conn.commit()
+    if args.command == 'backfill':
+        start = time.perf_counter()
+        end = backfill(conn, args.chunk_rows,
+                       progress=lambda done, end: print(f"  backfilled ids up to {done}/{end}", flush=True))
+        print(f"Backfill complete through id {end} in {time.perf_counter() - start:.1f}s")
+    state = read_state(conn)
+    groups = conn.execute("SELECT COUNT(*), COALESCE(SUM(count), 0) FROM prediction_rollup_daily").fetchone()
+    print(f"maintained_from_id={state['maintained_from_id']} backfilled_through_id={state['backfilled_through_id']} "
+          f"complete={backfill_complete(state)} groups={groups[0]} predictions={groups[1]}")
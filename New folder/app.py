@@ -1,28 +1,86 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, Field, EmailStr
-import joblib
 import numpy as np
-import pandas as pd
 import sqlite3
 import logging
 from typing import Literal, Optional
-from starlette.responses import FileResponse, JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import os
 import time
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
+from contextlib import asynccontextmanager
 from jose import JWTError, jwt
+from metrics import Histogram, MetricsMiddleware, MetricsRegistry, SlowRequestProfiler, process_memory, stage
+from tree_engine import FlatForest
+from compress_forest import compact_paths, read_compact_metadata
+from model_registry import ModelRegistry
+from lookup_table import LookupTable, file_sha256, read_metadata
+from db import Database
+from auth_cache import TTLCache
+from password_hashing import PasswordHasher, PasswordHasherBusy
+from history_writer import PredictionWriter, prediction_record, write_predictions
+from log_pipeline import LogPipeline
+from static_assets import StaticAssets, asset_response, make_asset
+from analytics import GROUP_COLUMNS, backfill_complete, format_groups, init_rollups, query_params, query_sql, read_state
+from profile_scoring import SELECT_PROFILE_PREDICTION, ProfileScorer, profile_features
 import json
 import traceback
+import asyncio
+import base64
+import csv
+import hmac
+import io
+import itertools
+import tempfile
 
-# Thiết lập logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Thiết lập logging (LOG_MODE=async ghi ở luồng nền, LOG_FORMAT=json, LOG_SAMPLE_RATES; xem log_pipeline.py)
+log_pipeline = LogPipeline.from_env(os.environ)
+log_pipeline.install()
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Vòng đời ứng dụng: khởi động và xả các tác vụ nền
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    password_hasher.start()
+    await run_in_threadpool(init_db)
+    prediction_writer.start()
+    profile_scorer.start()
+    if slow_request_profiler is not None:
+        slow_request_profiler.start()
+    # Chế độ lazy: nhận kết nối ngay, mô hình được nạp và làm nóng ở nền (/readyz báo khi xong)
+    warm_up_task = asyncio.create_task(warm_up())
+    if STARTUP_MODE == "eager":
+        await warm_up_task
+        if startup_state["status"] != "ready":
+            raise RuntimeError(f"Không thể tải mô hình: {startup_state['error']}")
+    yield
+    if not warm_up_task.done():
+        warm_up_task.cancel()
+        await asyncio.gather(warm_up_task, return_exceptions=True)
+    await prediction_batcher.stop()
+    models.stop()
+    await profile_scorer.stop()
+    await prediction_writer.stop()
+    logger.info("Đã ghi hết lịch sử dự đoán còn trong hàng đợi")
+    password_hasher.shutdown()
+    if slow_request_profiler is not None:
+        slow_request_profiler.stop()
+    await run_in_threadpool(log_pipeline.flush)
+
+app = FastAPI(lifespan=lifespan)
+
+# Số liệu theo route/bước xử lý cho /metrics (Prometheus); profiler request chậm bật bằng biến môi trường
+metrics_registry = MetricsRegistry()
+PROFILE_SLOWEST_REQUESTS = int(os.getenv("PROFILE_SLOWEST_REQUESTS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+slow_request_profiler = (SlowRequestProfiler(PROFILE_SLOWEST_REQUESTS, PROFILE_INTERVAL_MS / 1000)
+                         if PROFILE_SLOWEST_REQUESTS > 0 else None)
+app.add_middleware(MetricsMiddleware, registry=metrics_registry, profiler=slow_request_profiler)
+unhandled_errors = metrics_registry.counter(
+    "app_unhandled_errors_total", "Exceptions that reached the 500 handler, by route and type.", ("route", "exception"))
 
 # Custom 500 handler
 @app.exception_handler(Exception)
@@ -30,6 +88,8 @@ async def custom_500_handler(request: Request, exc: Exception):
     error_msg = f"Internal Server Error: {str(exc)}"
     stack_trace = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
     logger.error(f"{error_msg}\n{stack_trace}")
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    unhandled_errors.inc(route, type(exc).__name__)
     return JSONResponse(
         status_code=500,
         content={"detail": "Lỗi server, vui lòng thử lại sau."}
@@ -42,42 +102,91 @@ for dir_path in required_dirs:
         logger.error(f"Thư mục '{dir_path}' không tồn tại.")
         raise FileNotFoundError(f"Thư mục '{dir_path}' không tồn tại.")
 
-# Tùy chỉnh StaticFiles
-class CustomStaticFiles(StaticFiles):
-    async def get_response(self, path: str, scope):
-        full_path = os.path.join(self.directory, path)
-        logger.debug(f"Yêu cầu tệp tĩnh: {path}, đường dẫn thực: {full_path}")
-        if not os.path.exists(full_path):
-            logger.warning(f"Tệp tĩnh không tồn tại: {full_path}")
-        response = await super().get_response(path, scope)
-        if isinstance(response, FileResponse):
-            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response.headers["Pragma"] = "no-cache"
-            response.headers["Expires"] = "0"
-        return response
-
-# Mount static files
-app.mount("/static", CustomStaticFiles(directory="static"), name="static")
+# Tệp tĩnh: dấu vân tay nội dung, nén sẵn, phục vụ từ bộ nhớ (xem static_assets.py)
+static_assets = StaticAssets("static")
+app.mount("/static", static_assets, name="static")
 logger.info("Mounted static files at /static")
 
 # Thiết lập templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_assets.url
 
 # Cấu hình JWT
 SECRET_KEY = "your-secret-key-please-change-this-in-production"  # Thay đổi trong production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Cấu hình mã hóa mật khẩu
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cấu hình mã hóa mật khẩu (bcrypt chạy trên pool tiến trình riêng, tạo trong lifespan)
+password_hasher = PasswordHasher()
 
 # OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
+# Cache người dùng đã xác thực: token -> payload JWT (bỏ qua kiểm tra HMAC), user id -> thông tin user
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+def invalidate_user(user_id: int):
+    """Gọi mỗi khi bản ghi users thay đổi để request sau đọc lại từ CSDL."""
+    user_cache.pop(user_id)
+
+# Email quản trị viên (phân tách bằng dấu phẩy); chỉ họ được xem số liệu gộp của mọi người dùng
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+def is_admin(user: dict) -> bool:
+    return user["email"].lower() in ADMIN_EMAILS
+
 # Khởi tạo CSDL
+db = Database()
+
+PREDICTION_INPUT_COLUMNS = {
+    'age': 'INTEGER',
+    'sex': 'INTEGER',
+    'height': 'REAL',
+    'weight': 'REAL',
+    'children': 'INTEGER',
+    'smoker': 'INTEGER',
+    'region': 'INTEGER',
+    'model': 'TEXT',
+}
+
+# Đặt 1 để xóa JSON gốc của các dòng đã chuyển sang cột có kiểu (không hoàn tác được; nên sao lưu CSDL trước)
+PREDICTIONS_DROP_INPUT_JSON = os.getenv("PREDICTIONS_DROP_INPUT_JSON", "0") == "1"
+
+def migrate_predictions(cursor, drop_input_json=False):
+    """Chép dữ liệu đầu vào từ cột JSON sang các cột có kiểu và thêm index cho /history.
+
+    JSON gốc được giữ nguyên trừ khi drop_input_json=True (PREDICTIONS_DROP_INPUT_JSON=1).
+    """
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(predictions)")}
+    for name, sql_type in PREDICTION_INPUT_COLUMNS.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE predictions ADD COLUMN {name} {sql_type}")
+    # Dòng cũ chỉ có JSON nên age còn NULL; dòng đã chuyển hoặc ghi mới luôn có age
+    assignments = ", ".join(f"{name} = json_extract(input_data, '$.{name}')" for name in PREDICTION_INPUT_COLUMNS)
+    cursor.execute(f"UPDATE predictions SET {assignments} WHERE input_data IS NOT NULL AND age IS NULL")
+    if cursor.rowcount > 0:
+        logger.info(f"Đã chuyển {cursor.rowcount} dự đoán sang cột có kiểu")
+    if drop_input_json:
+        cursor.execute("UPDATE predictions SET input_data = NULL WHERE input_data IS NOT NULL AND age IS NOT NULL")
+        if cursor.rowcount > 0:
+            logger.warning(f"Đã xóa JSON đầu vào gốc của {cursor.rowcount} dự đoán (PREDICTIONS_DROP_INPUT_JSON=1)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_predictions_user_timestamp
+        ON predictions (user_id, timestamp DESC, id DESC)
+    """)
+
+def migrate_profiles(cursor):
+    """Thêm cột revision (tăng mỗi khi đặc trưng của hồ sơ đổi) cho CSDL tạo trước khi có cột này."""
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(profiles)")}
+    if "revision" not in existing:
+        cursor.execute("ALTER TABLE profiles ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
 def init_db():
     try:
-        with sqlite3.connect("database.db") as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -96,6 +205,20 @@ def init_db():
                     children INTEGER,
                     smoker INTEGER,
                     region INTEGER,
+                    revision INTEGER NOT NULL DEFAULT 0,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            """)
+            # Dự đoán chấm sẵn cho hồ sơ (profile_scoring.py), mỗi mô hình một dòng
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS profile_predictions (
+                    user_id INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    profile_revision INTEGER NOT NULL,
+                    prediction REAL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, model),
                     FOREIGN KEY (user_id) REFERENCES users(id)
                 )
             """)
@@ -106,39 +229,203 @@ def init_db():
                     input_data JSON,
                     prediction REAL,
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    age INTEGER,
+                    sex INTEGER,
+                    height REAL,
+                    weight REAL,
+                    children INTEGER,
+                    smoker INTEGER,
+                    region INTEGER,
+                    model TEXT,
                     FOREIGN KEY (user_id) REFERENCES users(id)
                 )
             """)
+            migrate_predictions(cursor, PREDICTIONS_DROP_INPUT_JSON)
+            migrate_profiles(cursor)
+            init_rollups(cursor)
             conn.commit()
         logger.info("Khởi tạo cơ sở dữ liệu thành công")
     except sqlite3.Error as e:
         logger.error(f"Lỗi khởi tạo cơ sở dữ liệu: {e}")
         raise HTTPException(status_code=500, detail="Lỗi khởi tạo cơ sở dữ liệu")
 
-init_db()
+# Ghi lịch sử dự đoán ở nền
+prediction_writer = PredictionWriter(
+    db,
+    max_queue_size=int(os.getenv("PREDICTION_WRITER_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("PREDICTION_WRITER_BATCH_SIZE", "500")),
+    flush_interval_ms=float(os.getenv("PREDICTION_WRITER_FLUSH_MS", "50")),
+    put_timeout_ms=float(os.getenv("PREDICTION_WRITER_PUT_TIMEOUT_MS", "100")),
+    journal_path=os.getenv("PREDICTION_JOURNAL_PATH") or None,
+)
 
 # Tải mô hình
-models = {}
-try:
-    if os.path.exists('model/random_forest_model.pkl'):
-        models['random_forest'] = joblib.load('model/random_forest_model.pkl')
-        logger.info("Đã tải mô hình Random Forest.")
-    else:
-        logger.error("Tệp random_forest_model.pkl không tồn tại.")
-        raise FileNotFoundError("Tệp random_forest_model.pkl không tồn tại.")
-    if os.path.exists('model/decision_tree_model.pkl'):
-        models['decision_tree'] = joblib.load('model/decision_tree_model.pkl')
-        logger.info("Đã tải mô hình Decision Tree.")
+MODEL_FILES = {
+    'random_forest': {
+        'pickle': 'model/random_forest_model.pkl',
+        'flat': 'model/random_forest_flat.joblib',
+        'compact': 'model/random_forest_compact',
+        'lookup': 'model/random_forest',
+    },
+    'decision_tree': {
+        'pickle': 'model/decision_tree_model.pkl',
+        'flat': 'model/decision_tree_flat.joblib',
+        'compact': 'model/decision_tree_compact',
+        'lookup': 'model/decision_tree',
+    },
+}
+
+# 'r': ánh xạ mảng mô hình từ tệp, các worker của serve.py dùng chung trang bộ nhớ; '' để đọc hẳn vào RAM
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE", "r") or None
+
+def load_derived(name: str, source_sha256: str):
+    """Dạng dựng sẵn từ mô hình có sha256 source_sha256: bảng tra cứu, rồi bản nén; None nếu không có.
+
+    Trả về (mô hình, tệp dẫn xuất): bảng tra cứu cho kết quả giống hệt mô hình gốc nên tệp dẫn xuất
+    là None, còn bản nén là một mô hình khác nên là đường dẫn tệp nén. Dùng cho cả các tệp trong
+    model/ lẫn các phiên bản của kho mô hình.
+    """
+    files = MODEL_FILES[name]
+    lookup_metadata = read_metadata(files['lookup'])
+    if lookup_metadata is not None and lookup_metadata.get('source_sha256') == source_sha256:
+        logger.info(f"Dùng bảng tra cứu cho mô hình {name}")
+        return LookupTable.load(files['lookup'], mmap_mode=MODEL_MMAP_MODE), None
+    compact_metadata = read_compact_metadata(files['compact'])
+    if compact_metadata is not None and compact_metadata.get('source_sha256') == source_sha256:
+        return load_compact(name, compact_metadata)
+    return None
+
+def load_compact(name: str, metadata: dict):
+    logger.info(f"Dùng bản nén của mô hình {name}: {metadata['trees']} cây, {metadata['nodes']} nút, "
+                f"RMSE test {metadata['test_rmse']:.2f} (gốc {metadata['base_test_rmse']:.2f})")
+    compact_path = compact_paths(MODEL_FILES[name]['compact'])[0]
+    return FlatForest.load(compact_path, mmap_mode=MODEL_MMAP_MODE), compact_path
+
+def load_model(name: str):
+    """Tải dạng nhanh nhất hiện có: bảng tra cứu, bản nén, mảng phẳng, cuối cùng là tệp pickle.
+
+    Trả về (mô hình, tệp nguồn); bảng tra cứu và mảng phẳng cho kết quả giống hệt pickle nên nguồn
+    là tệp pickle, còn bản nén là một mô hình khác nên nguồn là chính tệp nén.
+    """
+    files = MODEL_FILES[name]
+    model_path, flat_path = files['pickle'], files['flat']
+    if os.path.exists(model_path):
+        derived = load_derived(name, file_sha256(model_path))
+        if derived is not None:
+            model, artifact = derived
+            return model, artifact or model_path
+        if read_metadata(files['lookup']) is not None:
+            logger.warning(f"Bảng tra cứu của {name} đã cũ, bỏ qua.")
+        if read_compact_metadata(files['compact']) is not None:
+            logger.warning(f"Bản nén của {name} đã cũ, bỏ qua.")
     else:
-        logger.error("Tệp decision_tree_model.pkl không tồn tại.")
-        raise FileNotFoundError("Tệp decision_tree_model.pkl không tồn tại.")
-except Exception as e:
-    logger.error(f"Lỗi khi tải mô hình: {e}")
-    raise HTTPException(status_code=500, detail=f"Không thể tải mô hình: {str(e)}")
+        # Chỉ triển khai bản nén, không kèm pickle
+        compact_metadata = read_compact_metadata(files['compact'])
+        if compact_metadata is not None:
+            return load_compact(name, compact_metadata)
+    if os.path.exists(flat_path) and (
+        not os.path.exists(model_path) or os.path.getmtime(flat_path) >= os.path.getmtime(model_path)
+    ):
+        return FlatForest.load(flat_path, mmap_mode=MODEL_MMAP_MODE), model_path
+    if os.path.exists(model_path):
+        import joblib  # kéo theo sklearn khi giải nén pickle, chỉ cần ở nhánh dự phòng này
+        return FlatForest.from_sklearn(joblib.load(model_path)), model_path
+    logger.error(f"Tệp {os.path.basename(model_path)} không tồn tại.")
+    raise FileNotFoundError(f"Tệp {os.path.basename(model_path)} không tồn tại.")
+
+FEATURE_COLUMNS = ['age', 'sex', 'bmi', 'children', 'smoker', 'region']
+# Vài dòng điển hình để làm nóng phiên bản mới trước khi đưa vào phục vụ
+WARMUP_FEATURES = np.array([
+    [18, 0, 22.0, 0, 0, 0],
+    [35, 1, 27.5, 2, 0, 1],
+    [50, 0, 31.0, 1, 1, 2],
+    [64, 1, 45.0, 5, 1, 3],
+], dtype=np.float64)
+
+# Kho mô hình có phiên bản (model/registry), được theo dõi và nạp lại nóng; phiên bản nào có bảng
+# tra cứu hoặc bản nén dựng từ đúng mô hình của nó thì dùng dạng đó (load_derived).
+# Mô hình chưa có trong kho thì dùng các tệp cũ trong model/
+models = ModelRegistry(
+    features=FEATURE_COLUMNS,
+    warmup_rows=WARMUP_FEATURES,
+    poll_interval=float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5")),
+    shadow_fraction=float(os.getenv("MODEL_SHADOW_FRACTION", "0.1")),
+    mmap_mode=MODEL_MMAP_MODE,
+    derived=load_derived,
+)
+
+# Khởi động: nạp và làm nóng mô hình sau khi import, không chặn việc mở cổng
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")  # lazy | eager (nạp xong mới nhận kết nối)
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", "10"))
+startup_state = {
+    "status": "starting",  # starting | ready | failed
+    "mode": STARTUP_MODE,
+    "error": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+}
+
+def load_models():
+    """Nạp mọi mô hình (chặn luồng gọi); serve.py gọi trước khi fork để các worker dùng chung."""
+    if startup_state["load_seconds"] is not None:
+        return
+    start = time.perf_counter()
+    models.refresh()
+    for name in MODEL_FILES:
+        if name not in models:
+            models.set_fallback(name, *load_model(name))
+        logger.info(f"Đã tải mô hình {name} từ {models.stats()['models'][name]['active']['source']}.")
+    startup_state["load_seconds"] = time.perf_counter() - start
+
+async def warm_up():
+    try:
+        await run_in_threadpool(load_models)
+        start = time.perf_counter()
+        # Một dự đoán giả qua đúng đường đi của /predict (batcher, threadpool, mô hình, trang mmap)
+        for name in models:
+            await prediction_batcher.predict(name, WARMUP_FEATURES[0].tolist())
+        startup_state["warmup_seconds"] = time.perf_counter() - start
+        startup_state["status"] = "ready"
+        models.start()
+        profile_scorer.wake()
+        logger.info(f"Sẵn sàng phục vụ: nạp mô hình {startup_state['load_seconds']:.2f}s, "
+                    f"làm nóng {startup_state['warmup_seconds']:.3f}s")
+    except Exception as e:
+        startup_state["status"] = "failed"
+        startup_state["error"] = str(e)
+        logger.error(f"Lỗi khi tải mô hình: {e}")
+
+async def wait_until_ready():
+    """Request đến khi mô hình còn đang nạp được chờ tối đa STARTUP_WAIT_SECONDS, sau đó nhận 503."""
+    deadline = time.monotonic() + STARTUP_WAIT_SECONDS
+    while startup_state["status"] == "starting" and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if startup_state["status"] != "ready":
+        raise HTTPException(
+            status_code=503,
+            detail="Mô hình đang được tải, vui lòng thử lại sau.",
+            headers={"Retry-After": "1"},
+        )
 
 # Tỷ giá USD sang VND
 USD_TO_VND = 25000
 
+# Khoảng hợp lệ của từng đặc trưng đầu vào: dùng cho Field của ProfileInput/PredictionInput
+# và cho kiểm tra cả lô bằng NumPy ở /predict/batch
+INPUT_BOUNDS = {
+    'age': (18, 64),
+    'sex': (0, 1),
+    'height': (1.0, 2.5),
+    'weight': (30, 150),
+    'children': (0, 5),
+    'smoker': (0, 1),
+    'region': (0, 3),
+}
+
+def bounded_field(name):
+    low, high = INPUT_BOUNDS[name]
+    return Field(..., ge=low, le=high)
+
 # Mô hình dữ liệu
 class RegisterInput(BaseModel):
     email: EmailStr
@@ -149,34 +436,47 @@ class LoginInput(BaseModel):
     password: str
 
 class ProfileInput(BaseModel):
-    age: int = Field(..., ge=18, le=64)
-    sex: int = Field(..., ge=0, le=1)
-    height: float = Field(..., ge=1.0, le=2.5)
-    weight: float = Field(..., ge=30, le=150)
-    children: int = Field(..., ge=0, le=5)
-    smoker: int = Field(..., ge=0, le=1)
-    region: int = Field(..., ge=0, le=3)
+    age: int = bounded_field('age')
+    sex: int = bounded_field('sex')
+    height: float = bounded_field('height')
+    weight: float = bounded_field('weight')
+    children: int = bounded_field('children')
+    smoker: int = bounded_field('smoker')
+    region: int = bounded_field('region')
 
 class UserOut(BaseModel):
     id: int
     email: str
 
 class PredictionInput(BaseModel):
-    age: int = Field(..., ge=18, le=64)
-    sex: int = Field(..., ge=0, le=1)
-    height: float = Field(..., ge=1.0, le=2.5)
-    weight: float = Field(..., ge=30, le=150)
-    children: int = Field(..., ge=0, le=5)
-    smoker: int = Field(..., ge=0, le=1)
-    region: int = Field(..., ge=0, le=3)
+    age: int = bounded_field('age')
+    sex: int = bounded_field('sex')
+    height: float = bounded_field('height')
+    weight: float = bounded_field('weight')
+    children: int = bounded_field('children')
+    smoker: int = bounded_field('smoker')
+    region: int = bounded_field('region')
     model: Literal['random_forest', 'decision_tree']
 
 # Hàm xác thực
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(user_id: int, plain_password, hashed_password):
+    """Kiểm tra mật khẩu; nếu hash dùng số vòng bcrypt cũ thì băm lại và lưu."""
+    valid, new_hash = await password_hasher.verify_and_update(plain_password, hashed_password)
+    if valid and new_hash:
+        await db.execute("UPDATE users SET hashed_password = ? WHERE id = ?", (new_hash, user_id))
+        invalidate_user(user_id)
+        logger.info(f"Đã băm lại mật khẩu với {password_hasher.rounds} vòng cho user_id: {user_id}")
+    return valid
+
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def too_many_requests():
+    return HTTPException(
+        status_code=429,
+        detail="Hệ thống đang bận, vui lòng thử lại sau.",
+        headers={"Retry-After": "1"},
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -197,24 +497,33 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme)):
         detail="Not authenticated",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            logger.error("Token missing user_id")
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            with stage("jwt_decode"):
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError as e:
+            logger.error(f"JWT decode failed: {e}")
             raise credentials_exception
-    except JWTError as e:
-        logger.error(f"JWT decode failed: {e}")
+        # Không giữ payload trong cache quá thời điểm token hết hạn
+        expires_in = payload["exp"] - time.time() if "exp" in payload else None
+        token_cache.set(token, payload, ttl=expires_in)
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        logger.error("Token missing user_id")
         raise credentials_exception
+    user = user_cache.get(int(user_id))
+    if user is not None:
+        return dict(user)
     try:
-        with sqlite3.connect("database.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, email FROM users WHERE id = ?", (int(user_id),))
-            user = cursor.fetchone()
-            if user is None:
-                logger.error(f"User not found for id: {user_id}")
-                raise credentials_exception
-        return {"id": user[0], "email": user[1]}
+        with stage("user_lookup"):
+            row = await db.fetchone("SELECT id, email FROM users WHERE id = ?", (int(user_id),))
+        if row is None:
+            logger.error(f"User not found for id: {user_id}")
+            raise credentials_exception
+        user = {"id": row[0], "email": row[1]}
+        user_cache.set(user["id"], user)
+        return dict(user)
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail="Lỗi truy vấn cơ sở dữ liệu")
@@ -224,7 +533,7 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme)):
 async def get_me(current_user: Optional[dict] = Depends(get_current_user)):
     if current_user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    logger.info(f"User authenticated: {current_user['email']}")
+    logger.info("User authenticated: %s", current_user["email"])
     return current_user
 
 # Custom 404 handler
@@ -237,36 +546,46 @@ async def custom_404_handler(request: Request, exc: HTTPException):
     logger.warning(f"404 Not Found: {path}")
     return JSONResponse(status_code=404, content={"detail": f"Resource not found: {path}"})
 
-# Trang chủ
+# Trang chủ: render một lần mỗi lần triển khai (template không phụ thuộc người dùng; menu theo
+# người dùng do script.js dựng từ /me), phục vụ từ bộ nhớ kèm gzip và ETag.
+# Trình duyệt/reverse proxy được lưu nhưng phải kiểm tra lại (304) vì URL không có dấu vân tay.
+HOME_CACHE_CONTROL = "public, no-cache"
+home_page = make_asset("index.html", templates.get_template("index.html").render().encode("utf-8"))
+
 @app.get("/")
-async def home(request: Request, current_user: Optional[dict] = Depends(get_current_user)):
-    try:
-        query_params = dict(request.query_params)
-        if any(key in query_params for key in ['age', 'sex', 'height', 'weight', 'children', 'smoker', 'region', 'model']):
-            logger.warning(f"Nhận GET request với query params dự đoán: {query_params}")
-        logger.info(f"Truy cập trang chủ, user: {current_user['email'] if current_user else 'None'}")
-        return templates.TemplateResponse("index.html", {"request": request, "timestamp": int(time.time()), "user": current_user})
-    except Exception as e:
-        logger.error(f"Lỗi khi truy cập trang chủ: {e}")
-        raise HTTPException(status_code=500, detail="Lỗi khi tải trang chủ")
+async def home(request: Request):
+    query_params = request.query_params
+    if any(key in query_params for key in ['age', 'sex', 'height', 'weight', 'children', 'smoker', 'region', 'model']):
+        logger.warning("Nhận GET request với query params dự đoán: %s", dict(query_params))
+    logger.info("Truy cập trang chủ")
+    status, headers, body = asset_response(home_page, HOME_CACHE_CONTROL, request.headers.get("accept-encoding", ""),
+                                           request.headers.get("if-none-match"))
+    return Response(body, status_code=status, headers={name.decode(): value.decode() for name, value in headers})
 
 # Đăng ký
 @app.post("/register")
 async def register(input_data: RegisterInput):
     try:
-        with sqlite3.connect("database.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE email = ?", (input_data.email,))
-            if cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Email đã được sử dụng")
-            hashed_password = get_password_hash(input_data.password)
-            cursor.execute(
+        with stage("user_lookup"):
+            existing = await db.fetchone("SELECT id FROM users WHERE email = ?", (input_data.email,))
+        if existing:
+            raise HTTPException(status_code=400, detail="Email đã được sử dụng")
+        with stage("password_hash"):
+            hashed_password = await get_password_hash(input_data.password)
+        with stage("user_insert"):
+            await db.execute(
                 "INSERT INTO users (email, hashed_password) VALUES (?, ?)",
                 (input_data.email, hashed_password)
             )
-            conn.commit()
         logger.info(f"Đăng ký thành công cho email: {input_data.email}")
         return {"message": "Đăng ký thành công"}
+    except HTTPException:
+        raise
+    except PasswordHasherBusy:
+        logger.warning("Từ chối đăng ký: hàng đợi băm mật khẩu đầy")
+        raise too_many_requests()
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Email đã được sử dụng")
     except sqlite3.Error as e:
         logger.error(f"Lỗi cơ sở dữ liệu khi đăng ký: {e}")
         raise HTTPException(status_code=500, detail="Lỗi cơ sở dữ liệu khi đăng ký")
@@ -278,16 +597,24 @@ async def register(input_data: RegisterInput):
 @app.post("/login")
 async def login(input_data: LoginInput):
     try:
-        with sqlite3.connect("database.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, hashed_password FROM users WHERE email = ?", (input_data.email,))
-            user = cursor.fetchone()
-            if not user or not verify_password(input_data.password, user[1]):
-                raise HTTPException(status_code=401, detail="Email hoặc mật khẩu không đúng")
+        with stage("user_lookup"):
+            user = await db.fetchone("SELECT id, hashed_password FROM users WHERE email = ?", (input_data.email,))
+        if not user:
+            raise HTTPException(status_code=401, detail="Email hoặc mật khẩu không đúng")
+        with stage("password_verify"):
+            valid = await verify_password(user[0], input_data.password, user[1])
+        if not valid:
+            raise HTTPException(status_code=401, detail="Email hoặc mật khẩu không đúng")
+        with stage("token_create"):
             access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
             access_token = create_access_token(data={"sub": str(user[0])}, expires_delta=access_token_expires)
         logger.info(f"Đăng nhập thành công cho email: {input_data.email}")
         return {"access_token": access_token, "token_type": "bearer"}
+    except HTTPException:
+        raise
+    except PasswordHasherBusy:
+        logger.warning("Từ chối đăng nhập: hàng đợi băm mật khẩu đầy")
+        raise too_many_requests()
     except sqlite3.Error as e:
         logger.error(f"Lỗi cơ sở dữ liệu khi đăng nhập: {e}")
         raise HTTPException(status_code=500, detail="Lỗi cơ sở dữ liệu khi đăng nhập")
@@ -301,25 +628,32 @@ async def update_profile(input_data: ProfileInput, current_user: Optional[dict]
     if current_user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
-        with sqlite3.connect("database.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO profiles (user_id, age, sex, height, weight, children, smoker, region)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    current_user["id"],
-                    input_data.age,
-                    input_data.sex,
-                    input_data.height,
-                    input_data.weight,
-                    input_data.children,
-                    input_data.smoker,
-                    input_data.region
-                )
+        # revision chỉ tăng khi đặc trưng thật sự đổi, để dự đoán chấm sẵn không bị chấm lại thừa
+        await db.execute(
+            """
+            INSERT INTO profiles (user_id, age, sex, height, weight, children, smoker, region)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                age = excluded.age, sex = excluded.sex, height = excluded.height, weight = excluded.weight,
+                children = excluded.children, smoker = excluded.smoker, region = excluded.region,
+                revision = profiles.revision + 1
+            WHERE (profiles.age, profiles.sex, profiles.height, profiles.weight,
+                   profiles.children, profiles.smoker, profiles.region)
+               IS NOT (excluded.age, excluded.sex, excluded.height, excluded.weight,
+                       excluded.children, excluded.smoker, excluded.region)
+            """,
+            (
+                current_user["id"],
+                input_data.age,
+                input_data.sex,
+                input_data.height,
+                input_data.weight,
+                input_data.children,
+                input_data.smoker,
+                input_data.region
             )
-            conn.commit()
+        )
+        profile_scorer.notify(current_user["id"])
         logger.info(f"Cập nhật hồ sơ thành công cho user_id: {current_user['id']}")
         return {"message": "Cập nhật hồ sơ thành công"}
     except sqlite3.Error as e:
@@ -329,98 +663,586 @@ async def update_profile(input_data: ProfileInput, current_user: Optional[dict]
         logger.error(f"Lỗi khi cập nhật hồ sơ: {str(e)}")
         raise HTTPException(status_code=500, detail="Lỗi server")
 
+# Gom các yêu cầu dự đoán đơn lẻ thành lô
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "64"))
+PREDICT_BATCH_MAX_WAIT_MS = float(os.getenv("PREDICT_BATCH_MAX_WAIT_MS", "2"))
+
+model_predict_seconds = metrics_registry.histogram(
+    "model_predict_seconds", "Time of one predict call on a feature matrix, by model.", ("model",))
+model_predict_rows = metrics_registry.counter("model_predict_rows_total", "Rows scored, by model.", ("model",))
+
+def predict_matrix(model_name, features):
+    """Gọi predict một lần cho cả ma trận đặc trưng (mỗi dòng một mẫu)."""
+    start = time.perf_counter()
+    predictions = models[model_name].predict(features)
+    model_predict_seconds.observe(time.perf_counter() - start, model_name)
+    model_predict_rows.inc(model_name, amount=len(features))
+    return predictions
+
+class PredictionBatcher:
+    """Xếp hàng các yêu cầu theo mô hình và dự đoán chúng thành một lô.
+
+    Lô được xả khi đạt max_batch_size hoặc khi yêu cầu đầu tiên đã chờ max_wait_ms.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()   # giữ tham chiếu tới lô đang chạy để không bị thu gom giữa chừng
+        self.queue_depth = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256])
+
+    async def predict(self, model_name: str, features) -> float:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(model_name, [])
+        pending.append((features, future))
+        self.queue_depth.observe(len(pending))
+        if len(pending) >= self.max_batch_size:
+            self._flush(model_name)
+        elif len(pending) == 1:
+            self._timers[model_name] = loop.call_later(self.max_wait, self._flush, model_name)
+        return await future
+
+    def _flush(self, model_name: str):
+        timer = self._timers.pop(model_name, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model_name, None)
+        if not batch:
+            return
+        self.batch_size.observe(len(batch))
+        task = asyncio.create_task(self._run_batch(model_name, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Xả các lô đang chờ hẹn giờ và đợi mọi lô đang chạy trả kết quả cho request."""
+        for model_name in list(self._pending):
+            self._flush(model_name)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run_batch(self, model_name: str, batch):
+        features = np.array([row for row, _ in batch], dtype=np.float64)
+        try:
+            start = time.perf_counter()
+            predictions = await run_in_threadpool(predict_matrix, model_name, features)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            logger.error(f"Lỗi khi dự đoán lô {len(batch)} dòng ({model_name}): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(float(prediction))
+        # Chấm điểm mô hình ứng viên (nếu có) sau khi đã trả kết quả
+        models.maybe_shadow(model_name, features, predictions, elapsed)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
+
+prediction_batcher = PredictionBatcher(PREDICT_BATCH_MAX_SIZE, PREDICT_BATCH_MAX_WAIT_MS)
+
+# Chấm sẵn dự đoán cho hồ sơ đã lưu (đọc qua /predict/me)
+async def predict_profiles(model_name, features):
+    return await run_in_threadpool(predict_matrix, model_name, features)
+
+profile_scorer = ProfileScorer(
+    db, models, predict_profiles,
+    batch_size=int(os.getenv("PROFILE_SCORER_BATCH_SIZE", "500")),
+    poll_interval=float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5")),
+)
+
+# Kiểm tra sống (process và event loop còn phản hồi) và sẵn sàng (mô hình đã nạp và làm nóng)
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    status_code = 200 if startup_state["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=startup_state)
+
+# Endpoint vận hành (/stats, /metrics, /debug/profile) lộ thông tin nội bộ nên cần header
+# "Authorization: Bearer <OPS_TOKEN>"; không đặt OPS_TOKEN thì các endpoint này tắt (404)
+OPS_TOKEN = os.getenv("OPS_TOKEN") or None
+
+async def require_ops_token(request: Request):
+    if OPS_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), OPS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+# Thống kê nội bộ
+@app.get("/stats", dependencies=[Depends(require_ops_token)])
+async def get_stats():
+    return {
+        "startup": startup_state,
+        "predict_batcher": prediction_batcher.stats(),
+        "prediction_writer": prediction_writer.stats(),
+        "auth_cache": {"tokens": token_cache.stats(), "users": user_cache.stats()},
+        "database": db.stats(),
+        "password_hasher": password_hasher.stats(),
+        "profile_scorer": profile_scorer.stats(),
+        "model_registry": models.stats(),
+        "logging": log_pipeline.stats(),
+        "process": {"pid": os.getpid(), **process_memory()},
+    }
+
+# Số liệu của các thành phần (đọc từ bộ đếm sẵn có) cho /metrics
+PREDICTION_WRITER_COUNTERS = {
+    "flushed": "Prediction records written to the database.",
+    "dropped": "Prediction records dropped because the queue stayed full.",
+    "spilled": "Prediction records written to the on-disk journal instead of the database.",
+    "replayed": "Journaled prediction records replayed into the database.",
+    "flush_errors": "Batch writes that failed.",
+}
+
+def collect_component_metrics():
+    writer = prediction_writer.stats()
+    hasher = password_hasher.stats()
+    caches = {"token": token_cache.stats(), "user": user_cache.stats()}
+    registry = models.stats()
+    yield ("app_ready", "gauge", "1 once models are loaded and warmed up.",
+           [({}, int(startup_state["status"] == "ready"))])
+    yield ("db_calls_total", "counter", "Database calls by method.",
+           [({"method": method}, count) for method, count in db.calls.items()])
+    for key in ("hits", "misses", "evictions"):
+        yield (f"auth_cache_{key}_total", "counter", f"Authentication cache {key}.",
+               [({"cache": name}, stats[key]) for name, stats in caches.items()])
+    yield ("prediction_writer_queue_depth", "gauge", "Predictions waiting to be written.",
+           [({}, writer["queue_depth"])])
+    for key, documentation in PREDICTION_WRITER_COUNTERS.items():
+        yield f"prediction_writer_{key}_total", "counter", documentation, [({}, writer[key])]
+    yield ("prediction_writer_flush_seconds", "histogram", "Time to write one batch of predictions.",
+           [({}, prediction_writer.flush_latency)])
+    yield ("predict_batch_size", "histogram", "Requests per model call made by the /predict batcher.",
+           [({}, prediction_batcher.batch_size)])
+    yield ("password_hasher_in_flight", "gauge", "Password hashes queued or running.", [({}, hasher["in_flight"])])
+    for key in ("completed", "failed", "rejected"):
+        yield (f"password_hasher_{key}_total", "counter", f"Password hashing jobs {key}.", [({}, hasher[key])])
+    scorer = profile_scorer.stats()
+    yield ("profile_scorer_pending_users", "gauge", "Updated profiles waiting to be rescored.",
+           [({}, scorer["pending_users"])])
+    yield ("profile_scorer_rescored_total", "counter", "Profile predictions computed in the background.",
+           [({}, scorer["rescored"])])
+    yield ("profile_scorer_errors_total", "counter", "Background profile rescoring passes that failed.",
+           [({}, scorer["errors"])])
+    yield ("profile_scorer_batch_seconds", "histogram", "Time to score and store one batch of profiles.",
+           [({}, profile_scorer.batch_latency)])
+    yield ("model_registry_swaps_total", "counter", "Model versions swapped in.", [({}, registry["swaps"])])
+    yield ("model_registry_load_errors_total", "counter", "Model versions that failed to load.",
+           [({}, registry["load_errors"])])
+    logs = log_pipeline.stats()
+    yield ("log_queue_depth", "gauge", "Log records waiting for the background writer.", [({}, logs["queue_depth"])])
+    yield ("log_records_dropped_total", "counter", "Log records dropped because the log queue was full.",
+           [({}, logs["dropped"])])
+    yield ("log_records_sampled_out_total", "counter", "INFO/DEBUG request log records skipped by sampling.",
+           [({}, logs["sampled_out"])])
+    yield ("process_memory_bytes", "gauge", "Process memory from /proc.",
+           [({"kind": kind.removesuffix("_bytes")}, value) for kind, value in process_memory().items()])
+
+metrics_registry.register_collector(collect_component_metrics)
+
+@app.get("/metrics", dependencies=[Depends(require_ops_token)])
+async def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Stack folded (flamegraph.pl, speedscope) của các request chậm nhất; bật bằng PROFILE_SLOWEST_REQUESTS
+@app.get("/debug/profile", dependencies=[Depends(require_ops_token)])
+async def get_profile():
+    if slow_request_profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler chưa bật (PROFILE_SLOWEST_REQUESTS)")
+    return PlainTextResponse(slow_request_profiler.folded())
+
+def prediction_response(model: str, prediction_usd: float) -> dict:
+    """Đổi dự đoán (USD) của mô hình sang VND cùng câu mô tả trả về cho người dùng."""
+    if prediction_usd < 0:
+        logger.warning("Dự đoán âm: %s", prediction_usd)
+        prediction_usd = 0
+    prediction_vnd = prediction_usd * USD_TO_VND
+    prediction_vnd_formatted = "{:,.0f}".format(prediction_vnd)
+    model_name = "Random Forest" if model == "random_forest" else "Decision Tree"
+    return {
+        "prediction": prediction_vnd,
+        "prediction_text": f"Số tiền bảo hiểm dự đoán (mô hình {model_name}): {prediction_vnd_formatted} VND"
+    }
+
 # Dự đoán
 @app.post("/predict")
 async def predict(input_data: PredictionInput, current_user: Optional[dict] = Depends(get_current_user)):
     if current_user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
-        logger.info(f"Nhận dữ liệu dự đoán: {input_data.dict()}")
-        
+        input_dict = input_data.dict()
+        logger.info("Nhận dữ liệu dự đoán: %s", input_dict)
+
         # Tính BMI
         bmi = input_data.weight / (input_data.height ** 2)
-        logger.debug(f"Tính BMI: {bmi:.2f}")
+        logger.debug("Tính BMI: %.2f", bmi)
         if not (15 <= bmi <= 50):
-            logger.warning(f"BMI ngoài khoảng hợp lệ: {bmi:.2f}")
+            logger.warning("BMI ngoài khoảng hợp lệ: %.2f", bmi)
             raise HTTPException(status_code=400, detail="BMI phải nằm trong khoảng 15-50.")
 
-        # Chuẩn bị dữ liệu đầu vào
-        feature_columns = ['age', 'sex', 'bmi', 'children', 'smoker', 'region']
-        input_df = pd.DataFrame({
-            'age': [input_data.age],
-            'sex': [input_data.sex],
-            'bmi': [bmi],
-            'children': [input_data.children],
-            'smoker': [input_data.smoker],
-            'region': [input_data.region]
-        }, columns=feature_columns)
-        logger.debug(f"Dữ liệu đầu vào mô hình: {input_df.to_dict()}")
-
         # Dự đoán
+        with stage("wait_ready"):
+            await wait_until_ready()
         model = models.get(input_data.model)
         if model is None:
-            logger.error(f"Mô hình không hợp lệ: {input_data.model}")
+            logger.error("Mô hình không hợp lệ: %s", input_data.model)
             raise HTTPException(status_code=400, detail="Mô hình không hợp lệ.")
-        
-        prediction_usd = model.predict(input_df)[0]
-        logger.debug(f"Dự đoán USD: {prediction_usd}")
-        if prediction_usd < 0:
-            logger.warning(f"Dự đoán âm: {prediction_usd}")
-            prediction_usd = 0
-        prediction_vnd = prediction_usd * USD_TO_VND
-        prediction_vnd_formatted = "{:,.0f}".format(prediction_vnd)
-
-        model_name = "Random Forest" if input_data.model == "random_forest" else "Decision Tree"
-        response = {
-            "prediction": prediction_vnd,
-            "prediction_text": f"Số tiền bảo hiểm dự đoán (mô hình {model_name}): {prediction_vnd_formatted} VND"
-        }
 
-        # Lưu vào lịch sử
-        try:
-            with sqlite3.connect("database.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO predictions (user_id, input_data, prediction)
-                    VALUES (?, ?, ?)
-                    """,
-                    (current_user["id"], json.dumps(input_data.dict()), prediction_vnd)
-                )
-                conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Lỗi cơ sở dữ liệu khi lưu dự đoán: {e}")
-            raise HTTPException(status_code=500, detail="Lỗi cơ sở dữ liệu khi lưu dự đoán")
+        features = [input_data.age, input_data.sex, bmi, input_data.children, input_data.smoker, input_data.region]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Dữ liệu đầu vào mô hình: %s", dict(zip(FEATURE_COLUMNS, features)))
+        # Gồm thời gian chờ gom lô và thời gian predict của mô hình
+        with stage("model_predict"):
+            prediction_usd = await prediction_batcher.predict(input_data.model, features)
+        logger.debug("Dự đoán USD: %s", prediction_usd)
+        response = prediction_response(input_data.model, prediction_usd)
+        prediction_vnd = response["prediction"]
+
+        # Lưu vào lịch sử (ghi nền theo lô, không chờ CSDL)
+        with stage("history_enqueue"):
+            await prediction_writer.submit(prediction_record(current_user["id"], input_dict, prediction_vnd))
 
-        logger.info(f"Dự đoán thành công: {response['prediction_text']}")
+        logger.info("Dự đoán thành công: %s", response["prediction_text"])
         return response
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Lỗi khi dự đoán: {str(e)}")
+        logger.error("Lỗi khi dự đoán: %s", e)
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý dữ liệu đầu vào: {str(e)}")
 
+# Dự đoán cho hồ sơ đã lưu: đọc kết quả chấm sẵn (một lần tra theo khóa chính); nếu hồ sơ vừa đổi
+# hoặc mô hình vừa đổi phiên bản mà chưa được chấm lại thì dự đoán ngay và báo ProfileScorer
+@app.get("/predict/me")
+async def predict_me(model: Literal['random_forest', 'decision_tree'] = 'random_forest',
+                     current_user: Optional[dict] = Depends(get_current_user)):
+    if current_user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    with stage("wait_ready"):
+        await wait_until_ready()
+    if model not in models:
+        raise HTTPException(status_code=400, detail="Mô hình không hợp lệ.")
+    try:
+        with stage("db_query"):
+            row = await db.fetchone(SELECT_PROFILE_PREDICTION, (model, current_user["id"]))
+    except sqlite3.Error as e:
+        logger.error(f"Lỗi cơ sở dữ liệu khi đọc hồ sơ: {e}")
+        raise HTTPException(status_code=500, detail="Lỗi cơ sở dữ liệu khi đọc hồ sơ")
+    if row is None:
+        raise HTTPException(status_code=404, detail="Chưa có hồ sơ, hãy cập nhật hồ sơ trước.")
+    revision, profile, (scored_revision, scored_version, stored) = row[0], row[1:-3], row[-3:]
+    precomputed = scored_revision == revision and scored_version == models.version_key(model)
+    if precomputed:
+        if stored is None:
+            raise HTTPException(status_code=400, detail="BMI phải nằm trong khoảng 15-50.")
+        prediction_usd = stored
+    else:
+        profile_scorer.notify(current_user["id"])
+        features, valid = profile_features([profile])
+        if not valid[0]:
+            raise HTTPException(status_code=400, detail="BMI phải nằm trong khoảng 15-50.")
+        with stage("model_predict"):
+            prediction_usd = await prediction_batcher.predict(model, features[0].tolist())
+    return {**prediction_response(model, prediction_usd), "precomputed": precomputed}
+
+# Dự đoán theo lô
+BATCH_INPUT_COLUMNS = ['age', 'sex', 'height', 'weight', 'children', 'smoker', 'region', 'model']
+BATCH_INTEGER_COLUMNS = ['age', 'sex', 'children', 'smoker', 'region']
+BATCH_CHUNK_SIZE = 5000
+BATCH_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+def _to_float_column(values):
+    """Chuyển một cột sang float64 một chiều, giá trị không hợp lệ (kể cả list/dict lồng nhau) thành NaN."""
+    try:
+        column = np.asarray(values, dtype=np.float64)
+        if column.shape == (len(values),):
+            return column
+    except (TypeError, ValueError, OverflowError):
+        pass
+    column = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        try:
+            column[i] = float(value) if isinstance(value, (int, float, str)) else np.nan
+        except (TypeError, ValueError, OverflowError):
+            column[i] = np.nan
+    return column
+
+def _to_model_column(values):
+    """Cột tên mô hình dạng mảng object một chiều; giá trị không phải chuỗi thành None."""
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value if isinstance(value, str) else None
+    return column
+
+def validate_batch(columns: dict):
+    """Kiểm tra cả lô theo cột, trả về (features, model_names, valid, errors)."""
+    n = len(columns['model'])
+    valid = np.ones(n, dtype=bool)
+    errors = np.empty(n, dtype=object)
+
+    def reject(ok, message):
+        bad = valid & ~ok
+        errors[bad] = message
+        valid[:] = valid & ok
+
+    numeric = {}
+    for name, (low, high) in INPUT_BOUNDS.items():
+        column = _to_float_column(columns[name])
+        with np.errstate(invalid='ignore'):
+            reject(np.isfinite(column), f"{name}: giá trị không hợp lệ")
+            reject((column >= low) & (column <= high), f"{name} phải nằm trong khoảng {low}-{high}")
+        if name in BATCH_INTEGER_COLUMNS:
+            reject(np.floor(column) == column, f"{name} phải là số nguyên")
+        numeric[name] = column
+
+    # Tính BMI cho cả lô bằng một phép toán mảng
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bmi = numeric['weight'] / (numeric['height'] ** 2)
+        reject((bmi >= 15) & (bmi <= 50), "BMI phải nằm trong khoảng 15-50.")
+
+    model_names = _to_model_column(columns['model'])
+    known = set(models)
+    reject(np.fromiter((name in known for name in model_names), dtype=bool, count=n), "Mô hình không hợp lệ.")
+
+    features = np.column_stack([
+        numeric['age'], numeric['sex'], bmi,
+        numeric['children'], numeric['smoker'], numeric['region']
+    ])
+    return numeric, features, model_names, valid, errors
+
+def predict_batch(features, model_names, valid):
+    """Dự đoán cả lô: mỗi mô hình chỉ gọi predict một lần trên toàn bộ ma trận."""
+    predictions = np.full(len(model_names), np.nan)
+    for model_name in np.unique(model_names[valid]):
+        mask = valid & (model_names == model_name)
+        predictions[mask] = predict_matrix(model_name, features[mask])
+    return np.maximum(predictions, 0) * USD_TO_VND
+
+def score_batch_chunk(user_id, columns, row_offset):
+    """Kiểm tra và dự đoán một khối dòng; trả về các dòng kết quả NDJSON và bản ghi cần lưu."""
+    numeric, features, model_names, valid, errors = validate_batch(columns)
+    predictions = predict_batch(features, model_names, valid)
+
+    records = []
+    lines = []
+    for i in range(len(model_names)):
+        row = row_offset + i
+        if not valid[i]:
+            lines.append(json.dumps({"row": row, "error": errors[i]}, ensure_ascii=False))
+            continue
+        input_dict = {name: int(numeric[name][i]) for name in BATCH_INTEGER_COLUMNS}
+        input_dict['height'] = float(numeric['height'][i])
+        input_dict['weight'] = float(numeric['weight'][i])
+        input_dict['model'] = model_names[i]
+        prediction_vnd = float(predictions[i])
+        records.append(prediction_record(user_id, input_dict, prediction_vnd))
+        lines.append(json.dumps({"row": row, "model": model_names[i], "prediction": prediction_vnd}))
+
+    return "".join(line + "\n" for line in lines), records
+
+def _rows_to_columns(rows):
+    return {name: [row.get(name) for row in rows] for name in BATCH_INPUT_COLUMNS}
+
+def iter_json_chunks(rows):
+    for start in range(0, len(rows), BATCH_CHUNK_SIZE):
+        chunk = [row if isinstance(row, dict) else {} for row in rows[start:start + BATCH_CHUNK_SIZE]]
+        yield _rows_to_columns(chunk)
+
+def iter_ndjson_chunks(text_file):
+    chunk = []
+    for line in text_file:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        chunk.append(row if isinstance(row, dict) else {})
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            yield _rows_to_columns(chunk)
+            chunk = []
+    if chunk:
+        yield _rows_to_columns(chunk)
+
+def iter_csv_chunks(text_file):
+    reader = csv.reader(text_file)
+    header = [name.strip() for name in next(reader, [])]
+    missing = [name for name in BATCH_INPUT_COLUMNS if name not in header]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Thiếu cột trong tệp CSV: {', '.join(missing)}")
+    indices = [header.index(name) for name in BATCH_INPUT_COLUMNS]
+    chunk = []
+    for record in reader:
+        if not record:
+            continue
+        chunk.append(record)
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            yield {name: [r[idx] if idx < len(r) else None for r in chunk] for name, idx in zip(BATCH_INPUT_COLUMNS, indices)}
+            chunk = []
+    if chunk:
+        yield {name: [r[idx] if idx < len(r) else None for r in chunk] for name, idx in zip(BATCH_INPUT_COLUMNS, indices)}
+
+async def _spool_request_body(request: Request):
+    """Ghi body vào tệp tạm để bộ nhớ không phụ thuộc kích thước tệp tải lên."""
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MAX_MEMORY)
+    async for data in request.stream():
+        spool.write(data)
+    spool.seek(0)
+    return spool
+
+@app.post("/predict/batch")
+async def predict_batch_endpoint(request: Request, current_user: Optional[dict] = Depends(get_current_user)):
+    if current_user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    await wait_until_ready()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    spool = None
+    if content_type == "application/json":
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dữ liệu JSON không hợp lệ")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Dữ liệu phải là một mảng JSON")
+        chunks = iter_json_chunks(rows)
+    elif content_type in ("text/csv", "application/x-ndjson"):
+        spool = await _spool_request_body(request)
+        text_file = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+        chunks = iter_csv_chunks(text_file) if content_type == "text/csv" else iter_ndjson_chunks(text_file)
+        # Đọc khối đầu (và header CSV) trước khi bắt đầu trả kết quả để lỗi định dạng thành 400
+        try:
+            first_chunk = await run_in_threadpool(next, chunks, None)
+        except (UnicodeDecodeError, csv.Error) as e:
+            spool.close()
+            raise HTTPException(status_code=400, detail=f"Tệp không hợp lệ (cần văn bản UTF-8): {e}")
+        except Exception:
+            spool.close()
+            raise
+        chunks = itertools.chain([first_chunk] if first_chunk else [], chunks)
+    else:
+        raise HTTPException(status_code=415, detail="Chỉ hỗ trợ application/json, text/csv hoặc application/x-ndjson")
+
+    user_id = current_user["id"]
+    logger.info(f"Nhận yêu cầu dự đoán theo lô ({content_type}) từ user_id: {user_id}")
+
+    async def stream_results():
+        # Mỗi khối được ghi và commit trước khi trả cho client: không giữ kết nối hay giao dịch ghi
+        # trong lúc chờ client đọc, nên client chậm không chặn các thao tác ghi khác
+        total = succeeded = 0
+        try:
+            while True:
+                columns = await run_in_threadpool(next, chunks, None)
+                if columns is None:
+                    break
+                lines, records = await run_in_threadpool(score_batch_chunk, user_id, columns, total)
+                if records:
+                    await db.run(write_predictions, records)
+                total += len(columns['model'])
+                succeeded += len(records)
+                yield lines
+            logger.info(f"Dự đoán theo lô thành công: {succeeded}/{total} dòng cho user_id: {user_id}")
+            yield json.dumps({"summary": {"total": total, "succeeded": succeeded, "failed": total - succeeded}}) + "\n"
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Phần sau của tệp sai định dạng: khối đầu đã qua kiểm tra nên không còn trả được 400
+            logger.warning("Tệp dự đoán theo lô sai định dạng sau dòng %d: %s", total, e)
+            yield json.dumps({"error": f"Tệp không hợp lệ sau dòng {total}: {e}. "
+                                       f"{succeeded} dự đoán trước đó đã được lưu."}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Lỗi khi dự đoán theo lô: {e}")
+            yield json.dumps({"error": f"Lỗi server sau dòng {total}. {succeeded} dự đoán trước đó đã được lưu."},
+                             ensure_ascii=False) + "\n"
+        finally:
+            if spool is not None:
+                spool.close()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 # Xem lịch sử dự đoán
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
+HISTORY_STREAM_FETCH_SIZE = 500
+HISTORY_COLUMNS = "id, age, sex, height, weight, children, smoker, region, model, prediction, timestamp"
+# Hai câu lệnh riêng để SQLite tìm thẳng vị trí cursor trên index (user_id, timestamp, id)
+HISTORY_SELECT_FIRST = f"""
+    SELECT {HISTORY_COLUMNS} FROM predictions
+    WHERE user_id = ?
+    ORDER BY timestamp DESC, id DESC
+"""
+HISTORY_SELECT_AFTER = f"""
+    SELECT {HISTORY_COLUMNS} FROM predictions
+    WHERE user_id = ? AND (timestamp, id) < (?, ?)
+    ORDER BY timestamp DESC, id DESC
+"""
+
+def history_row(row):
+    return {
+        "id": row[0],
+        "input_data": {
+            "age": row[1],
+            "sex": row[2],
+            "height": row[3],
+            "weight": row[4],
+            "children": row[5],
+            "smoker": row[6],
+            "region": row[7],
+            "model": row[8],
+        },
+        "prediction": row[9],
+        "timestamp": row[10]
+    }
+
+def encode_history_cursor(row):
+    return base64.urlsafe_b64encode(f"{row[10]}|{row[0]}".encode()).decode()
+
+def history_query(user_id: int, cursor: Optional[str]):
+    """Trả về (sql, params) cho trang bắt đầu ngay sau cursor (keyset pagination)."""
+    if cursor is None:
+        return HISTORY_SELECT_FIRST, (user_id,)
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return HISTORY_SELECT_AFTER, (user_id, timestamp, int(row_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+
 @app.get("/history")
-async def get_history(current_user: Optional[dict] = Depends(get_current_user)):
+async def get_history(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: Literal['json', 'ndjson'] = 'json',
+    current_user: Optional[dict] = Depends(get_current_user)
+):
     if current_user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
+    sql, params = history_query(current_user["id"], cursor)
+    if format == 'ndjson' or request.headers.get("accept", "").startswith("application/x-ndjson"):
+        return StreamingResponse(stream_history(current_user["id"], sql, params, limit),
+                                 media_type="application/x-ndjson")
     try:
-        with sqlite3.connect("database.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, input_data, prediction, timestamp FROM predictions WHERE user_id = ? ORDER BY timestamp DESC",
-                (current_user["id"],)
-            )
-            history = [
-                {
-                    "id": row[0],
-                    "input_data": json.loads(row[1]),
-                    "prediction": row[2],
-                    "timestamp": row[3]
-                }
-                for row in cursor.fetchall()
-            ]
-        logger.info(f"Lấy lịch sử dự đoán cho user_id: {current_user['id']}")
-        return history
+        limit = limit or HISTORY_PAGE_SIZE
+        with stage("db_query"):
+            rows = await db.fetchall(sql + " LIMIT ?", params + (limit + 1,))
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = encode_history_cursor(rows[-1])
+        logger.info("Lấy lịch sử dự đoán cho user_id: %s", current_user["id"])
+        with stage("serialize"):
+            return JSONResponse([history_row(row) for row in rows], headers=headers)
     except sqlite3.Error as e:
         logger.error(f"Lỗi cơ sở dữ liệu khi lấy lịch sử: {e}")
         raise HTTPException(status_code=500, detail="Lỗi cơ sở dữ liệu khi lấy lịch sử")
@@ -428,6 +1250,68 @@ async def get_history(current_user: Optional[dict] = Depends(get_current_user)):
         logger.error(f"Lỗi khi lấy lịch sử: {str(e)}")
         raise HTTPException(status_code=500, detail="Lỗi server")
 
+async def stream_history(user_id: int, sql, params, limit: Optional[int]):
+    """Trả từng nhóm dòng NDJSON ngay khi đọc được từ CSDL.
+
+    Mỗi nhóm là một truy vấn keyset ngắn tiếp sau dòng cuối của nhóm trước, mượn kết nối chỉ trong
+    lúc truy vấn: client đọc chậm không giữ kết nối của pool.
+    """
+    remaining = limit
+    try:
+        while remaining is None or remaining > 0:
+            size = HISTORY_STREAM_FETCH_SIZE if remaining is None else min(remaining, HISTORY_STREAM_FETCH_SIZE)
+            rows = await db.fetchall(sql + " LIMIT ?", params + (size,))
+            if not rows:
+                break
+            yield "".join(json.dumps(history_row(row)) + "\n" for row in rows)
+            if len(rows) < size:
+                break
+            if remaining is not None:
+                remaining -= len(rows)
+            sql, params = HISTORY_SELECT_AFTER, (user_id, rows[-1][10], rows[-1][0])
+    except sqlite3.Error as e:
+        logger.error(f"Lỗi cơ sở dữ liệu khi lấy lịch sử: {e}")
+        yield json.dumps({"error": "Lỗi cơ sở dữ liệu khi lấy lịch sử"}, ensure_ascii=False) + "\n"
+
+# Thống kê lịch sử dự đoán (số lượng, phí trung bình/nhỏ nhất/lớn nhất) theo ngày, mô hình, vùng, hút thuốc;
+# đọc từ bảng rollup (analytics.py) nên chi phí theo số nhóm, không theo số dự đoán.
+# Số liệu gộp của mọi người dùng nên chỉ dành cho ADMIN_EMAILS
+def read_analytics(conn, sql, params):
+    return conn.execute(sql, params).fetchall(), read_state(conn)
+
+@app.get("/analytics/predictions")
+async def prediction_analytics(
+    group_by: str = "model",
+    start: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    end: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    model: Optional[str] = None,
+    region: Optional[int] = None,
+    smoker: Optional[int] = None,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    if current_user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Chỉ quản trị viên được xem thống kê tổng hợp")
+    dimensions = list(dict.fromkeys(name.strip() for name in group_by.split(",") if name.strip()))
+    unknown = [name for name in dimensions if name not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"group_by chỉ nhận {', '.join(GROUP_COLUMNS)}; "
+                                                    f"không hợp lệ: {', '.join(unknown)}")
+    try:
+        with stage("db_query"):
+            rows, state = await db.run(read_analytics, query_sql(dimensions),
+                                       query_params(start, end, model, region, smoker))
+    except sqlite3.Error as e:
+        logger.error(f"Lỗi cơ sở dữ liệu khi tổng hợp dự đoán: {e}")
+        raise HTTPException(status_code=500, detail="Lỗi cơ sở dữ liệu khi tổng hợp dự đoán")
+    return {
+        "group_by": dimensions,
+        "groups": format_groups(rows, dimensions),
+        # False khi còn dự đoán cũ chưa được cộng vào rollup (chạy python analytics.py backfill)
+        "backfill_complete": backfill_complete(state),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
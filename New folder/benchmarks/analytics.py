@@ -0,0 +1,152 @@
+"""So sánh truy vấn tổng hợp lịch sử dự đoán: GROUP BY quét bảng predictions và đọc bảng rollup (analytics.py).
+
+Tạo một CSDL tạm với --rows dự đoán giả trải đều trên --days ngày (tạo bằng CTE đệ quy ngay trong
+SQLite), chạy backfill để dựng rollup rồi đo từng truy vấn ở cả hai cách, kiểm tra kết quả khớp nhau.
+Cuối cùng đo chi phí thêm của việc cập nhật rollup trong mỗi lô ghi của PredictionWriter.
+Chạy: python benchmarks/analytics.py --rows 10000000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from analytics import BACKFILL_CHUNK_ROWS, backfill, format_groups, init_rollups, query_params, query_sql  # noqa: E402
+from history_writer import INSERT_PREDICTION, prediction_record, write_predictions  # noqa: E402
+
+CREATE_PREDICTIONS = """
+    CREATE TABLE predictions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, input_data JSON, prediction REAL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, age INTEGER, sex INTEGER, height REAL, weight REAL,
+        children INTEGER, smoker INTEGER, region INTEGER, model TEXT
+    )
+"""
+# Dữ liệu giả: id -> các cột suy ra bằng phép chia lấy dư để không phụ thuộc vào random của Python
+GENERATE_PREDICTIONS = """
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :rows)
+    INSERT INTO predictions (user_id, prediction, timestamp, age, sex, height, weight, children, smoker, region, model)
+    SELECT n % 5000, 20000000 + (n * 7919) % 600000000,
+           datetime('2026-01-01', '+' || (n % :days) || ' days', '+' || (n % 86400) || ' seconds'),
+           18 + n % 60, n % 2, 1.5 + (n % 50) / 100.0, 50 + n % 60, n % 5, (n / 7) % 2, n % 4,
+           CASE n % 3 WHEN 0 THEN 'decision_tree' ELSE 'random_forest' END
+    FROM seq
+"""
+# Cùng câu hỏi với query_sql() nhưng tính thẳng trên predictions
+FULL_SCAN_SQL = """
+    SELECT {select}COUNT(*), SUM(prediction), MIN(prediction), MAX(prediction)
+    FROM predictions
+    WHERE substr(timestamp, 1, 10) >= ? AND substr(timestamp, 1, 10) <= ?
+      AND (? IS NULL OR model = ?) AND (? IS NULL OR region = ?) AND (? IS NULL OR smoker = ?)
+    {group}
+"""
+QUERIES = {
+    "total": ((), {}),
+    "by model": (("model",), {}),
+    "by day, model": (("day", "model"), {}),
+    "by region, smoker, 30 days": (("region", "smoker"), {"start": "2026-02-01", "end": "2026-03-02"}),
+    "one model by day": (("day",), {"model": "random_forest"}),
+}
+
+
+def full_scan_sql(group_by):
+    columns = ", ".join("substr(timestamp, 1, 10)" if name == "day" else name for name in group_by)
+    return FULL_SCAN_SQL.format(select=f"{columns}, " if group_by else "",
+                                group=f"GROUP BY {columns} ORDER BY {columns}" if group_by else "")
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def same_groups(left, right):
+    if len(left) != len(right):
+        return False
+    for a, b in zip(left, right):
+        if {k: v for k, v in a.items() if k != "mean_prediction"} != {k: v for k, v in b.items() if k != "mean_prediction"}:
+            return False
+        if abs(a["mean_prediction"] - b["mean_prediction"]) > 1e-6 * abs(b["mean_prediction"]):
+            return False
+    return True
+
+
+def bench_queries(conn, repeat):
+    print(f"\n{'query':<28} {'groups':>7} {'full scan ms':>13} {'rollup ms':>10} {'speedup':>9}")
+    for name, (group_by, filters) in QUERIES.items():
+        params = query_params(filters.get("start"), filters.get("end"), filters.get("model"),
+                              filters.get("region"), filters.get("smoker"))
+        scan_time, scan_rows = timed(lambda: conn.execute(full_scan_sql(group_by), params).fetchall(), repeat)
+        rollup_time, rollup_rows = timed(lambda: conn.execute(query_sql(group_by), params).fetchall(), repeat)
+        expected, actual = format_groups(scan_rows, group_by), format_groups(rollup_rows, group_by)
+        if not same_groups(expected, actual):
+            raise RuntimeError(f"{name}: rollup result differs from the full scan")
+        print(f"{name:<28} {len(actual):7d} {scan_time * 1000:13.1f} {rollup_time * 1000:10.2f} "
+              f"{scan_time / rollup_time:8.0f}x")
+
+
+def bench_writes(conn, batch_size, batches):
+    """Thời gian ghi một lô của PredictionWriter khi chỉ INSERT và khi kèm cập nhật rollup."""
+    features = {"age": 40, "sex": 1, "height": 1.7, "weight": 70.0, "children": 2, "smoker": 0, "region": 2}
+    batch = [prediction_record(user_id, {**features, "region": user_id % 4,
+                                         "model": ("random_forest", "decision_tree")[user_id % 2]}, 1e8 + user_id)
+             for user_id in range(batch_size)]
+
+    def insert_only():
+        conn.executemany(INSERT_PREDICTION, batch)
+        conn.commit()
+
+    def with_rollup():
+        write_predictions(conn, batch)
+
+    print(f"\nwriter batch of {batch_size} rows (median of {batches}):")
+    results = {}
+    for _ in range(2):  # xen kẽ hai cách để giảm nhiễu
+        for name, fn in (("insert only", insert_only), ("insert + rollup", with_rollup)):
+            results.setdefault(name, []).append(timed(fn, batches)[0])
+    base = min(results["insert only"])
+    for name, samples in results.items():
+        best = min(samples)
+        print(f"  {name:<16} {best * 1000:8.2f} ms  {batch_size / best:10.0f} rows/s  {best / base - 1:+7.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-rows", type=int, default=BACKFILL_CHUNK_ROWS)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--batches", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "analytics.db"))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(CREATE_PREDICTIONS)
+        start = time.perf_counter()
+        conn.execute(GENERATE_PREDICTIONS, {"rows": args.rows, "days": args.days})
+        conn.commit()
+        size_mb = os.path.getsize(os.path.join(tmp, "analytics.db")) / 1e6
+        print(f"generated {args.rows} predictions over {args.days} days in {time.perf_counter() - start:.1f}s "
+              f"({size_mb:.0f} MB)")
+
+        init_rollups(conn.cursor())
+        conn.commit()
+        start = time.perf_counter()
+        backfill(conn, args.chunk_rows)
+        groups = conn.execute("SELECT COUNT(*) FROM prediction_rollup_daily").fetchone()[0]
+        print(f"backfill: {time.perf_counter() - start:.1f}s -> {groups} rollup rows")
+
+        bench_queries(conn, args.repeat)
+        bench_writes(conn, args.batch_size, args.batches)
+        conn.close()
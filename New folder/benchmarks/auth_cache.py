@@ -0,0 +1,65 @@
+"""Đếm số truy vấn CSDL mỗi request /predict khi tắt và bật cache người dùng đã xác thực.
+
+Chạy app thật qua ASGI (httpx) trên một CSDL tạm; đường warm phải không còn truy vấn users nào.
+Chạy: python benchmarks/auth_cache.py --requests 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def drive(client, headers, n_requests, concurrency):
+    body = {"age": 30, "sex": 0, "height": 1.7, "weight": 70, "children": 1,
+            "smoker": 0, "region": 2, "model": "random_forest"}
+    queue = asyncio.Queue()
+    for _ in range(n_requests):
+        queue.put_nowait(body)
+
+    async def worker():
+        while not queue.empty():
+            response = await client.post("/predict", json=queue.get_nowait(), headers=headers)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return n_requests / (time.perf_counter() - start)
+
+
+async def main(args):
+    import httpx
+    import app
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with app.lifespan(app.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"email": "bench@example.com", "password": "Benchmark1"}
+        await client.post("/register", json=credentials)
+        token = (await client.post("/login", json=credentials)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        for label, cache_size in (("cache disabled", 0), ("cache enabled", app.AUTH_CACHE_SIZE)):
+            for cache in (app.token_cache, app.user_cache):
+                cache.maxsize = cache_size
+                cache.clear()
+            await drive(client, headers, 1, 1)  # làm nóng cache (nếu bật)
+            before = app.db.calls["fetchone"]
+            rps = await drive(client, headers, args.requests, args.concurrency)
+            lookups = (app.db.calls["fetchone"] - before) / args.requests
+            print(f"{label:15s}: {lookups:.2f} user lookups per /predict, {rps:8.1f} req/s, "
+                  f"token cache hits {app.token_cache.hits}, user cache hits {app.user_cache.hits}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        asyncio.run(main(args))
@@ -0,0 +1,97 @@
+"""So sánh số request/giây của mẫu truy cập CSDL trong /predict đã xác thực.
+
+- before: mỗi request mở sqlite3.connect mới và chạy đồng bộ trên event loop (journal mặc định)
+- after:  pool kết nối WAL của db.Database, truy vấn chạy trên luồng của pool
+
+Chạy: python benchmarks/db_concurrency.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import Database  # noqa: E402
+
+SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE NOT NULL, hashed_password TEXT NOT NULL)",
+    "CREATE TABLE predictions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, input_data JSON, "
+    "prediction REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)",
+]
+SELECT_USER = "SELECT id, email FROM users WHERE id = ?"
+INSERT_PREDICTION = "INSERT INTO predictions (user_id, input_data, prediction) VALUES (?, ?, ?)"
+INPUT_DATA = json.dumps({"age": 30, "sex": 0, "height": 1.7, "weight": 70, "children": 1,
+                         "smoker": 0, "region": 2, "model": "random_forest"})
+
+
+def create_database(path, n_users=100):
+    with sqlite3.connect(path) as conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany("INSERT INTO users (email, hashed_password) VALUES (?, ?)",
+                         [(f"user{i}@example.com", "x") for i in range(n_users)])
+
+
+async def request_before(path, user_id):
+    with sqlite3.connect(path) as conn:
+        conn.execute(SELECT_USER, (user_id,)).fetchone()
+    with sqlite3.connect(path) as conn:
+        conn.execute(INSERT_PREDICTION, (user_id, INPUT_DATA, 1.0))
+        conn.commit()
+
+
+async def request_after(db, user_id):
+    await db.fetchone(SELECT_USER, (user_id,))
+    await db.execute(INSERT_PREDICTION, (user_id, INPUT_DATA, 1.0))
+
+
+async def run(n_requests, concurrency, handler):
+    queue = asyncio.Queue()
+    for i in range(n_requests):
+        queue.put_nowait(i % 100 + 1)
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            start = time.perf_counter()
+            await handler(user_id)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return n_requests / elapsed, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, "before.db")
+        after_path = os.path.join(tmp, "after.db")
+        create_database(before_path)
+        create_database(after_path)
+
+        rps, p99 = asyncio.run(run(args.requests, args.concurrency,
+                                   lambda user_id: request_before(before_path, user_id)))
+        print(f"before (connect per request): {rps:8.1f} req/s, p99 {p99:7.2f} ms")
+
+        db = Database(after_path, pool_size=args.pool_size)
+        rps, p99 = asyncio.run(run(args.requests, args.concurrency,
+                                   lambda user_id: request_after(db, user_id)))
+        db.close()
+        print(f"after  (WAL pool of {args.pool_size}):      {rps:8.1f} req/s, p99 {p99:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
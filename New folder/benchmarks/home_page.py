@@ -0,0 +1,71 @@
+"""So sánh req/s của trang chủ / khi render Jinja2 mỗi request (cách cũ) và khi phục vụ bản render sẵn.
+
+Cách cũ được dựng lại thành một route tạm /__legacy_home trong tiến trình benchmark: chạy
+get_current_user (có token) rồi render templates/index.html mỗi lần. Cách mới đo cả lần tải đầy đủ
+(gzip) lẫn lần kiểm tra lại có If-None-Match (304). Chạy app thật qua ASGI (httpx) trên CSDL tạm.
+Chạy: python benchmarks/home_page.py --requests 3000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_legacy_route(app):
+    """Route có cùng việc phải làm như home() trước đây: xác thực người dùng và render template."""
+    from typing import Optional
+    from fastapi import Depends, Request
+
+    @app.app.get("/__legacy_home")
+    async def legacy_home(request: Request, current_user: Optional[dict] = Depends(app.get_current_user)):
+        return app.templates.TemplateResponse(request, "index.html", {"user": current_user})
+
+
+async def main(args):
+    import logging
+    import httpx
+    import app
+    from suite import drive
+
+    logging.disable(logging.INFO)
+    add_legacy_route(app)
+    transport = httpx.ASGITransport(app=app.app)
+    async with app.lifespan(app.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"email": "bench@example.com", "password": "Benchmark1"}
+        await client.post("/register", json=credentials)
+        token = (await client.post("/login", json=credentials)).json()["access_token"]
+        etag = (await client.get("/", headers={"Accept-Encoding": "gzip"})).headers["etag"]
+
+        scenarios = {
+            "render per request": ("/__legacy_home", {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}),
+            "prerendered": ("/", {"Accept-Encoding": "gzip"}),
+            "prerendered, 304": ("/", {"Accept-Encoding": "gzip", "If-None-Match": etag}),
+        }
+        print(f"{'variant':<20} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'bytes':>7}")
+        base = None
+        for name, (path, headers) in scenarios.items():
+            send = lambda c, path=path, headers=headers: c.get(path, headers=headers)  # noqa: E731
+            response = await send(client)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{path}: HTTP {response.status_code} {response.text[:200]}")
+            await drive(client, send, args.concurrency * 2, args.concurrency)  # làm nóng
+            result = await drive(client, send, args.requests, args.concurrency)
+            base = base or result["rps"]
+            size = response.num_bytes_downloaded
+            print(f"{name:<20} {result['rps']:9.1f} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} {size:7d}"
+                  f"  {result['rps'] / base:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        asyncio.run(main(args))
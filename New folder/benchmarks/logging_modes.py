@@ -0,0 +1,95 @@
+"""So sánh thông lượng /predict giữa các chế độ logging (log_pipeline.py) khi log ghi ra tệp thật.
+
+Mỗi cấu hình chạy kịch bản tải predict của benchmarks/suite.py trong tiến trình con riêng với
+stderr (nơi app ghi log) chuyển vào một tệp tạm, hoặc (--sink slow-pipe) vào pipe được đọc với tốc độ
+giới hạn để thấy khác biệt khi nơi nhận log chậm: chế độ sync chặn event loop khi pipe đầy, async
+bỏ bản ghi và đếm dropped. Các cấu hình chạy xen kẽ nhiều vòng và lấy
+trung vị để giảm nhiễu của máy ảo.
+Chạy: python benchmarks/logging_modes.py --rounds 3 --requests 3000 [--sink slow-pipe]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    "sync-text": {"LOG_MODE": "sync", "LOG_FORMAT": "text"},
+    "async-text": {"LOG_MODE": "async", "LOG_FORMAT": "text"},
+    "async-json": {"LOG_MODE": "async", "LOG_FORMAT": "json"},
+    "async-json-sampled": {"LOG_MODE": "async", "LOG_FORMAT": "json", "LOG_SAMPLE_RATES": "/predict=0.01"},
+}
+
+
+def drain(pipe, log_file, bytes_per_second):
+    """Đọc log từ pipe và ghi vào tệp; với bytes_per_second giả lập nơi nhận chậm (terminal, log shipper)."""
+    while True:
+        start = time.perf_counter()
+        block = pipe.read1(4096)
+        if not block:
+            return
+        log_file.write(block)
+        if bytes_per_second:
+            time.sleep(max(0.0, len(block) / bytes_per_second - (time.perf_counter() - start)))
+
+
+def run(name, args, tmp):
+    env = {key: value for key, value in os.environ.items() if not key.startswith("LOG_")}
+    env.update(CONFIGS[name])
+    output = os.path.join(tmp, f"{name}.json")
+    log_path = os.path.join(tmp, f"{name}.log")
+    with open(log_path, "wb") as log_file:
+        process = subprocess.Popen(
+            [sys.executable, "benchmarks/suite.py", "--skip-micro", "--scenarios", "predict",
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--show-logs",
+             "--output", output],
+            cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE if args.sink == "slow-pipe" else log_file)
+        if args.sink == "slow-pipe":
+            reader = threading.Thread(target=drain, args=(process.stderr, log_file, args.sink_kb_per_second * 1024))
+            reader.start()
+            reader.join()
+        if process.wait() != 0:
+            raise RuntimeError(f"{name}: suite.py exited with {process.returncode}")
+    with open(output) as f:
+        results = json.load(f)
+    with open(log_path, "rb") as f:
+        lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+    return results["load"]["predict"], results["meta"].get("logging", {}), lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sink", choices=["file", "slow-pipe"], default="file",
+                        help="where the app's log output goes: a file, or a pipe drained at --sink-kb-per-second")
+    parser.add_argument("--sink-kb-per-second", type=float, default=64)
+    args = parser.parse_args()
+
+    samples = {name: [] for name in args.configs}
+    with tempfile.TemporaryDirectory() as tmp:
+        for round_number in range(args.rounds):
+            for name in args.configs:
+                samples[name].append(run(name, args, tmp))
+                load, _, _ = samples[name][-1]
+                print(f"round {round_number + 1} {name:<20} {load['rps']:8.1f} req/s  p99 {load['p99_ms']:7.2f} ms",
+                      file=sys.stderr)
+
+    base = statistics.median(load["rps"] for load, _, _ in samples[args.configs[0]])
+    print(f"{'config':<20} {'req/s':>9} {'vs ' + args.configs[0]:>16} {'p99 ms':>9} {'log lines':>10} "
+          f"{'dropped':>8} {'sampled out':>12}")
+    for name, runs in samples.items():
+        rps = statistics.median(load["rps"] for load, _, _ in runs)
+        p99 = statistics.median(load["p99_ms"] for load, _, _ in runs)
+        _, stats, lines = runs[-1]
+        print(f"{name:<20} {rps:9.1f} {rps / base - 1:+16.1%} {p99:9.2f} {lines:10d} "
+              f"{stats.get('dropped', 0):8d} {stats.get('sampled_out', 0):12d}")
@@ -0,0 +1,91 @@
+"""Đo độ trễ p99 của /predict khi có một loạt đăng nhập chạy song song.
+
+So sánh bcrypt chạy ngay trên event loop (workers = 0) với pool tiến trình của PasswordHasher.
+Chạy: python benchmarks/login_storm.py --predicts 300 --rate 50 --logins 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_scenario(client, headers, credentials, n_predicts, rate, n_logins, login_concurrency):
+    body = {"age": 30, "sex": 0, "height": 1.7, "weight": 70, "children": 1,
+            "smoker": 0, "region": 2, "model": "random_forest"}
+    latencies = []
+    statuses = {}
+
+    async def predict(scheduled):
+        response = await client.post("/predict", json=body, headers=headers)
+        # Đo từ thời điểm lẽ ra request được gửi (tải mở) để không bỏ sót lúc event loop bị chặn
+        latencies.append(time.perf_counter() - scheduled)
+        response.raise_for_status()
+
+    async def predicts():
+        start = time.perf_counter()
+        tasks = []
+        for i in range(n_predicts):
+            scheduled = start + i / rate
+            await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+            tasks.append(asyncio.create_task(predict(scheduled)))
+        await asyncio.gather(*tasks)
+
+    async def logins(count):
+        for _ in range(count):
+            response = await client.post("/login", json=credentials)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    per_worker = n_logins // login_concurrency
+    await asyncio.gather(predicts(), *[logins(per_worker) for _ in range(login_concurrency)])
+    return latencies, statuses
+
+
+async def main(args):
+    import httpx
+    import app
+    from password_hashing import PasswordHasher
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with app.lifespan(app.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"email": "bench@example.com", "password": "Benchmark1"}
+        await client.post("/register", json=credentials)
+        token = (await client.post("/login", json=credentials)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        pool = app.password_hasher
+        scenarios = (
+            ("no logins", pool, 0),
+            ("inline bcrypt", PasswordHasher(rounds=pool.rounds, workers=0), args.logins),
+            (f"pool ({pool.workers} workers)", pool, args.logins),
+        )
+        for label, hasher, n_logins in scenarios:
+            app.password_hasher = hasher
+            latencies, statuses = await run_scenario(
+                client, headers, credentials, args.predicts, args.rate, n_logins, args.login_concurrency)
+            print(f"{label:20s}: /predict p50 {percentile(latencies, 0.50) * 1000:7.1f} ms, "
+                  f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms, max {max(latencies) * 1000:7.1f} ms, "
+                  f"login statuses {statuses}")
+        app.password_hasher = pool
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--predicts", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=50, help="/predict requests per second")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--login-concurrency", type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        asyncio.run(main(args))
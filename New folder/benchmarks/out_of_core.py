@@ -0,0 +1,84 @@
+"""Đo thời gian và RSS đỉnh của huấn luyện ngoài bộ nhớ (training.out_of_core) theo số dòng.
+
+Với mỗi cỡ dữ liệu: sinh CSV tổng hợp, chạy bước nạp vào bộ đệm theo cột và bước huấn luyện
+trong tiến trình con riêng, lấy RSS đỉnh từ wait4 (tiến trình lớn nhất, kể cả worker). Với
+cỡ nhỏ, chạy thêm cách cũ (pd.read_csv cả tệp + RandomForestRegressor) để so sánh.
+Chạy: python benchmarks/out_of_core.py --rows 1000000 10000000 --n-estimators 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IN_MEMORY = """
+import sys
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from training.features import CATEGORY_MAPS, FEATURE_COLUMNS, TARGET_COLUMN
+df = pd.read_csv(sys.argv[1])
+for column, mapping in CATEGORY_MAPS.items():
+    df[column] = df[column].map(mapping)
+RandomForestRegressor(n_estimators=int(sys.argv[2]), max_depth=int(sys.argv[3]), min_samples_leaf=int(sys.argv[4]),
+                      n_jobs=int(sys.argv[5]), random_state=42).fit(df[FEATURE_COLUMNS], df[TARGET_COLUMN])
+"""
+
+
+def run(args, env):
+    """Chạy lệnh con; trả về (giây, RSS đỉnh MB của tiến trình lớn nhất trong cây tiến trình, stdout)."""
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=APP_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{output[-2000:]}")
+    return elapsed, usage.ru_maxrss / 1024, output
+
+
+def report(label, rows, seconds, rss, extra=""):
+    print(f"{rows:>10}  {label:<22} {seconds:8.1f}s  {rss:8.0f} MB  {extra}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--n-estimators", type=int, default=20)
+    parser.add_argument("--memory-budget-mb", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-depth", type=int, default=12)
+    parser.add_argument("--min-samples-leaf", type=int, default=20)
+    parser.add_argument("--in-memory-max-rows", type=int, default=1000000,
+                        help="also time the in-memory baseline up to this many rows")
+    parser.add_argument("--data-dir", help="keep generated CSVs and caches here (default: a temporary directory)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        env = dict(os.environ, FEATURE_CACHE_DIR=os.path.join(data_dir, "cache"))
+        tree_args = ["--max-depth", str(args.max_depth), "--min-samples-leaf", str(args.min_samples_leaf)]
+        print(f"{'rows':>10}  {'stage':<22} {'wall':>9}  {'peak RSS':>11}")
+        for rows in args.rows:
+            csv_path = os.path.join(data_dir, f"insurance_{rows}.csv")
+            if not os.path.exists(csv_path):
+                seconds, rss, _ = run([sys.executable, "-m", "training.synthetic", "--rows", str(rows),
+                                       "--out", csv_path], env)
+                report("generate CSV", rows, seconds, rss, f"{os.path.getsize(csv_path) / 2**20:.0f} MB")
+            seconds, rss, _ = run([sys.executable, "-m", "training.out_of_core", "--data", csv_path, "--ingest-only"], env)
+            report("ingest (columnar)", rows, seconds, rss)
+            seconds, rss, output = run(
+                [sys.executable, "-m", "training.out_of_core", "--data", csv_path, "--no-save",
+                 "--n-estimators", str(args.n_estimators), "--memory-budget-mb", str(args.memory_budget_mb),
+                 "--workers", str(args.workers), *tree_args], env)
+            rmse = next((line.split()[-1] for line in output.splitlines() if line.startswith("holdout_rmse")), "?")
+            report(f"out-of-core {args.n_estimators} trees", rows, seconds, rss,
+                   f"budget {args.memory_budget_mb} MB, holdout RMSE {rmse}")
+            if rows <= args.in_memory_max_rows:
+                seconds, rss, _ = run([sys.executable, "-c", IN_MEMORY, csv_path, str(args.n_estimators),
+                                       str(args.max_depth), str(args.min_samples_leaf), str(args.workers)], env)
+                report(f"in-memory {args.n_estimators} trees", rows, seconds, rss)
@@ -0,0 +1,109 @@
+"""Đo throughput /predict và tổng bộ nhớ (PSS) của serve.py theo số worker.
+
+Mỗi cấu hình chạy serve.py trên một CSDL tạm, gửi tải qua HTTP thật rồi cộng PSS của
+tiến trình cha và các worker. Với mô hình mmap, tổng PSS gần như không tăng theo số worker.
+Chạy: python benchmarks/serve_workers.py --workers 1 2 4 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from metrics import process_memory  # noqa: E402
+
+
+def child_pids(parent):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Trường thứ 4 là ppid; tên tiến trình (trong ngoặc) có thể chứa khoảng trắng
+        if int(stat.rsplit(")", 1)[1].split()[1]) == parent:
+            pids.append(int(entry))
+    return pids
+
+
+async def drive(port, seconds, concurrency):
+    import httpx
+
+    body = {"age": 30, "sex": 0, "height": 1.7, "weight": 70, "children": 1,
+            "smoker": 0, "region": 2, "model": "random_forest"}
+    credentials = {"email": "bench@example.com", "password": "Benchmark1"}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+        await client.post("/register", json=credentials)
+        token = (await client.post("/login", json=credentials)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        done = 0
+        deadline = time.perf_counter() + seconds
+
+        async def worker():
+            nonlocal done
+            # Mỗi luồng tải một kết nối riêng để tải được chia cho các worker
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30) as own:
+                while time.perf_counter() < deadline:
+                    response = await own.post("/predict", json=body, headers=headers)
+                    response.raise_for_status()
+                    done += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return done / (time.perf_counter() - start)
+
+
+def wait_ready(port, timeout=120):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError("serve.py không khởi động kịp")
+
+
+def run(workers, mmap_mode, args, tmp):
+    env = dict(os.environ, DATABASE_PATH=os.path.join(tmp, f"bench_{workers}_{mmap_mode or 'ram'}.db"),
+               MODEL_MMAP_MODE=mmap_mode)
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port),
+         "--log-level", "warning", "--memory-report-interval", "0"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(args.port)
+        rps = asyncio.run(drive(args.port, args.seconds, args.concurrency))
+        pids = [process.pid] + child_pids(process.pid)
+        memory = [process_memory(pid) for pid in pids]
+        total_pss = sum(m.get("pss_bytes", 0) for m in memory)
+        max_rss = max(m.get("rss_bytes", 0) for m in memory[1:])
+        print(f"{workers} worker(s), mmap {mmap_mode or 'off':3s}: {rps:8.1f} req/s, "
+              f"total PSS {total_pss / 1e6:7.1f} MB, largest worker RSS {max_rss / 1e6:7.1f} MB")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        for mmap_mode in ("r", ""):
+            for workers in args.workers:
+                run(workers, mmap_mode, args, tmp)
@@ -0,0 +1,304 @@
+"""Bộ benchmark của app: microbenchmark từng bước của /predict và tải bất đồng bộ lên app ASGI thật.
+
+Lớp 1 (micro): kiểm tra pydantic, tính BMI, dựng ma trận đặc trưng, predict của từng mô hình
+và ghi SQLite, đo trực tiếp các hàm/đối tượng của app.py.
+Lớp 2 (load): gọi app thật trong tiến trình qua httpx.ASGITransport (gồm cả middleware,
+xác thực, batcher, ghi nền) trên một CSDL tạm, với số luồng đồng thời cấu hình được:
+/predict, /history, trang chủ / và /login.
+
+Kết quả ghi ra JSON; --compare so với baseline đã lưu (benchmarks/baseline.json, đo trên máy ảo
+1 CPU) và trả mã 1 nếu chậm hơn quá --threshold. Baseline được quy đổi theo tốc độ máy đo bằng một
+vòng hiệu chuẩn; trên máy ảo dùng chung CPU các bước cỡ micro giây vẫn dao động ~±40% giữa các lần
+chạy nên ngưỡng mặc định là 50%. Chỉ so kết quả đo trên cùng loại máy.
+Chạy: python benchmarks/suite.py --output results.json --compare benchmarks/baseline.json
+Cập nhật baseline: python benchmarks/suite.py --update-baseline
+Trong pytest: python -m pytest --run-slow tests/test_benchmark_suite.py (ngưỡng BENCHMARK_THRESHOLD, mặc định 150%)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(APP_DIR, "benchmarks", "baseline.json")
+
+BODY = {"age": 30, "sex": 0, "height": 1.7, "weight": 70, "children": 1,
+        "smoker": 0, "region": 2, "model": "random_forest"}
+CREDENTIALS = {"email": "bench@example.com", "password": "Benchmark1"}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(samples_us):
+    return {
+        "p50_us": percentile(samples_us, 0.50),
+        "p95_us": percentile(samples_us, 0.95),
+        "p99_us": percentile(samples_us, 0.99),
+        "samples": len(samples_us),
+    }
+
+
+def sample_stage(fn, seconds, inner):
+    """Gọi fn lặp lại trong ~seconds giây; mỗi mẫu là trung bình của `inner` lần gọi (µs/lần)."""
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        samples.append((time.perf_counter() - start) / inner * 1e6)
+    return samples
+
+
+def time_stages(stages, seconds, rounds=5):
+    """Đo từng bước trong `stages` ({tên: (fn, inner hoặc None)}), tổng ~seconds giây mỗi bước.
+
+    Các bước được đo xen kẽ qua nhiều vòng ngắn để một đợt máy chậm (máy ảo bị chia CPU)
+    rơi đều lên mọi bước thay vì làm lệch riêng một bước.
+    """
+    inners = {}
+    for name, (fn, inner) in stages.items():
+        if inner is None:
+            # Chọn inner sao cho một mẫu dài ~200 µs, đủ lớn so với độ phân giải của perf_counter
+            start = time.perf_counter()
+            fn()
+            inner = max(1, int(200e-6 / max(time.perf_counter() - start, 1e-9)))
+        for _ in range(inner):
+            fn()  # làm nóng
+        inners[name] = inner
+    samples = {name: [] for name in stages}
+    for _ in range(rounds):
+        for name, (fn, _) in stages.items():
+            samples[name] += sample_stage(fn, seconds / rounds, inners[name])
+    return {name: summarize(values) for name, values in samples.items()}
+
+
+def calibrate(seconds=0.5):
+    """Thời gian (µs) của một vòng Python cố định: đo tốc độ máy lúc chạy để so baseline công bằng."""
+    stages = {"calibration": (lambda: sum(i * i for i in range(1000)), 20)}
+    return time_stages(stages, seconds)["calibration"]["p50_us"]
+
+
+def micro_benchmarks(app, seconds):
+    import numpy as np
+    import pandas as pd
+    from history_writer import INSERT_PREDICTION, prediction_record, write_predictions
+
+    app.init_db()
+    app.load_models()
+    input_data = app.PredictionInput(**BODY)
+    bmi = input_data.weight / (input_data.height ** 2)
+    features = [input_data.age, input_data.sex, bmi, input_data.children, input_data.smoker, input_data.region]
+    matrix = np.array([features], dtype=np.float64)
+    batch = np.repeat(matrix, app.PREDICT_BATCH_MAX_SIZE, axis=0)
+    record = prediction_record(1, BODY, 1.0)
+
+    stages = {
+        "validate": (lambda: app.PredictionInput(**BODY), None),
+        "bmi": (lambda: input_data.weight / (input_data.height ** 2), None),
+        # Dòng đặc trưng -> ma trận như PredictionBatcher._run_batch; DataFrame để so với cách cũ
+        "feature_matrix": (lambda: np.array([features], dtype=np.float64), None),
+        "feature_dataframe": (lambda: pd.DataFrame([features], columns=app.FEATURE_COLUMNS), None),
+    }
+    for name in sorted(app.models):
+        model = app.models[name]
+        stages[f"predict_{name}"] = (lambda model=model: model.predict(matrix), None)
+        stages[f"predict_{name}_x{len(batch)}"] = (lambda model=model: model.predict(batch), None)
+
+    # Ghi SQLite: một dòng mỗi giao dịch (cách cũ) và một lô của PredictionWriter (kèm cập nhật rollup)
+    with app.db.connection() as conn:
+        def insert_one():
+            conn.execute(INSERT_PREDICTION, record)
+            conn.commit()
+
+        writer_batch = [record] * app.prediction_writer.batch_size
+
+        def insert_batch():
+            write_predictions(conn, writer_batch)
+
+        stages["sqlite_insert"] = (insert_one, 10)
+        stages[f"sqlite_insert_x{len(writer_batch)}"] = (insert_batch, 1)
+        results = time_stages(stages, seconds)
+        conn.execute("DELETE FROM predictions")
+        conn.execute("DELETE FROM prediction_rollup_daily")
+        conn.commit()
+    return results
+
+
+async def drive(client, send, n_requests, concurrency):
+    """Tải đóng: `concurrency` luồng gửi tuần tự cho đến khi đủ n_requests."""
+    latencies = []
+    errors = 0
+    remaining = n_requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await send(client)
+            latencies.append((time.perf_counter() - start) * 1e3)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "rps": n_requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "errors": errors,
+    }
+
+
+async def load_benchmarks(app, args):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with app.lifespan(app.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/register", json=CREDENTIALS)
+        token = (await client.post("/login", json=CREDENTIALS)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        await app.wait_until_ready()
+
+        scenarios = {
+            "predict": (lambda c: c.post("/predict", json=BODY, headers=headers), args.requests, args.concurrency),
+            "history": (lambda c: c.get("/history", params={"limit": 100}, headers=headers),
+                        args.requests, args.concurrency),
+            "home": (lambda c: c.get("/", headers={"Accept-Encoding": "gzip"}), args.requests, args.concurrency),
+            # bcrypt chiếm phần lớn thời gian /login nên chạy ít request hơn;
+            # PasswordHasher trả 429 khi hàng đợi đầy, nên /login có mức đồng thời riêng
+            "login": (lambda c: c.post("/login", json=CREDENTIALS), args.login_requests, args.login_concurrency),
+        }
+        results = {}
+        for name in args.scenarios:
+            send, n_requests, concurrency = scenarios[name]
+            await drive(client, send, min(n_requests, concurrency * 2), concurrency)  # làm nóng
+            results[name] = await drive(client, send, n_requests, concurrency)
+        return results
+
+
+# Chỉ số so với baseline: (nhóm, tên chỉ số, True nếu lớn hơn là tốt hơn)
+COMPARED_METRICS = [("micro", "p50_us", False), ("load", "rps", True), ("load", "p99_ms", False)]
+
+
+def compare(results, baseline, threshold, normalize=True):
+    """Trả về danh sách (tên, baseline, hiện tại, thay đổi) của các chỉ số chậm hơn quá threshold.
+
+    Với normalize, baseline được quy đổi theo tỉ lệ tốc độ máy (vòng hiệu chuẩn) giữa hai lần chạy,
+    để máy ảo bị chia CPU không bị báo nhầm là hồi quy.
+    """
+    speed = 1.0
+    if normalize and baseline["meta"].get("calibration_us") and results["meta"].get("calibration_us"):
+        speed = results["meta"]["calibration_us"] / baseline["meta"]["calibration_us"]
+        print(f"  machine speed vs baseline: calibration loop {speed:.2f}x the baseline time")
+    regressions = []
+    for group, metric, higher_is_better in COMPARED_METRICS:
+        for name, before in baseline.get(group, {}).items():
+            after = results.get(group, {}).get(name)
+            if after is None or not before.get(metric):
+                continue
+            expected = before[metric] / speed if higher_is_better else before[metric] * speed
+            change = after[metric] / expected - 1
+            # Mức chậm đi: thông lượng giảm một nửa tính là chậm 100%, như độ trễ tăng gấp đôi
+            worse = expected / after[metric] - 1 if higher_is_better else change
+            marker = "REGRESSION" if worse > threshold else ""
+            print(f"  {group}.{name}.{metric}: {expected:10.2f} -> {after[metric]:10.2f} ({change:+7.1%}) {marker}")
+            if worse > threshold:
+                regressions.append((f"{group}.{name}.{metric}", expected, after[metric], change))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'stage':<28} {'p50 µs':>10} {'p95 µs':>10} {'p99 µs':>10}")
+    for name, r in results.get("micro", {}).items():
+        print(f"{name:<28} {r['p50_us']:10.2f} {r['p95_us']:10.2f} {r['p99_us']:10.2f}")
+    print(f"{'endpoint':<10} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, r in results.get("load", {}).items():
+        print(f"{name:<10} {r['concurrency']:5d} {r['rps']:9.1f} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} "
+              f"{r['p99_ms']:9.2f} {r['errors']:7d}")
+
+
+def main(args):
+    import app
+
+    if not args.show_logs:
+        # Vẫn định dạng log như khi chạy thật, chỉ không in ra terminal
+        app.log_pipeline.set_stream(open(os.devnull, "w"))
+    # Log INFO của httpx (client của benchmark) không thuộc app
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "compare", "update_baseline")},
+        },
+    }
+    calibration = [calibrate()]
+    if not args.skip_micro:
+        results["micro"] = micro_benchmarks(app, args.micro_seconds)
+    if not args.skip_load:
+        results["load"] = asyncio.run(load_benchmarks(app, args))
+    calibration.append(calibrate())
+    results["meta"]["calibration_us"] = sum(calibration) / len(calibration)
+    results["meta"]["logging"] = app.log_pipeline.stats()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--micro-seconds", type=float, default=1.0, help="time spent sampling each stage")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per load scenario")
+    parser.add_argument("--login-requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--login-concurrency", type=int, default=4)
+    parser.add_argument("--scenarios", nargs="+", choices=["predict", "history", "home", "login"],
+                        default=["predict", "history", "home", "login"])
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="fail when a metric is this fraction worse than the baseline")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="compare raw numbers without adjusting for machine speed")
+    parser.add_argument("--update-baseline", nargs="?", const=BASELINE_PATH, help="write results as the new baseline")
+    parser.add_argument("--show-logs", action="store_true", help="print the app's request logs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        results = main(args)
+
+    print_results(results)
+    for path in filter(None, (args.output, args.update_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparing with {args.compare} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold, normalize=not args.no_normalize)
+        if regressions:
+            print(f"FAIL: {len(regressions)} metric(s) regressed more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("No regressions.")
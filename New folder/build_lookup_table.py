@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from tree_engine import FlatForest
+from training import load_features
+from training.models import sequential
+from lookup_table import (
+    FEATURE_COLUMNS, GRID, LookupTable, bmi_thresholds, build_table,
+    file_sha256, read_metadata, save_table, table_paths,
+)
+
+# Define paths
+DATA_PATH = 'data/insurance.csv'
+MODELS = {
+    'random_forest': ('model/random_forest_model.pkl', 'model/random_forest'),
+    'decision_tree': ('model/decision_tree_model.pkl', 'model/decision_tree'),
+}
+
+
+def sklearn_predict(model):
+    return lambda X: model.predict(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+
+
+def build(name, model_path, prefix):
+    model = sequential(joblib.load(model_path))
+    thresholds = bmi_thresholds(FlatForest.from_sklearn(model))
+    start = time.perf_counter()
+    table = build_table(sklearn_predict(model), thresholds)
+    save_table(prefix, table, thresholds, {
+        'model': name,
+        'source': model_path,
+        'source_sha256': file_sha256(model_path),
+    })
+    size_mb = os.path.getsize(table_paths(prefix)[0]) / 1e6
+    print(f"{name}: {len(thresholds)} BMI thresholds, {table.size} cells ({size_mb:.1f} MB) "
+          f"built in {time.perf_counter() - start:.1f}s -> {table_paths(prefix)[0]}")
+
+
+def load_dataset():
+    return load_features(DATA_PATH)[0].astype(np.float64)
+
+
+def verify(name, model_path, prefix, n_random=100000):
+    """Đối chiếu bảng với model.predict; trả về True nếu khớp tuyệt đối."""
+    metadata = read_metadata(prefix)
+    if metadata is None:
+        print(f"{name}: lookup table not found, run without --verify first.")
+        return False
+    if metadata['source_sha256'] != file_sha256(model_path):
+        print(f"{name}: lookup table is stale ({model_path} changed).")
+        return False
+    model = sequential(joblib.load(model_path))
+    predict = sklearn_predict(model)
+    lut = LookupTable.load(prefix)
+    ok = True
+
+    # Mỗi ô được tính tại cận trên của khoảng BMI; tính lại tại cận dưới phải cho cùng kết quả,
+    # vì mô hình là hằng số trên mỗi khoảng giữa hai ngưỡng liên tiếp.
+    lower = build_table(predict, lut.thresholds, upper=False)
+    mismatched = int(np.count_nonzero(lower != lut.table))
+    print(f"{name}: {lut.table.size} cells checked at the lower end of each BMI interval, {mismatched} mismatches")
+    ok &= mismatched == 0
+
+    # Tra cứu từ đầu vào thực tế: dữ liệu huấn luyện và các điểm ngẫu nhiên trong lưới
+    rng = np.random.default_rng(42)
+    samples = np.column_stack(
+        [rng.integers(low, high + 1, n_random) for _, low, high in GRID[:2]]
+        + [rng.uniform(15, 50, n_random)]
+        + [rng.integers(low, high + 1, n_random) for _, low, high in GRID[2:]]
+    ).astype(np.float64)
+    for label, X in (('dataset rows', load_dataset()), ('random inputs', samples)):
+        identical = np.array_equal(lut.predict(X), predict(X))
+        print(f"{name}: {len(X)} {label} identical to model.predict: {identical}")
+        ok &= identical
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or verify the precomputed prediction lookup tables.")
+    parser.add_argument('--verify', action='store_true', help="check existing tables against model.predict")
+    parser.add_argument('--model', choices=sorted(MODELS), action='append', help="limit to one model (repeatable)")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.model or MODELS:
+        model_path, prefix = MODELS[name]
+        if not os.path.exists(model_path):
+            print(f"Skipping {name}: {model_path} not found.")
+            continue
+        if args.verify:
+            failed |= not verify(name, model_path, prefix)
+        else:
+            build(name, model_path, prefix)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,377 @@
+"""Nén mô hình cây sau huấn luyện trong một ngân sách sai số: RMSE trên tập test được tăng tối đa bao nhiêu %.
+
+Bản nén là một FlatForest với ngưỡng float32 (làm tròn xuống nên mọi phép so sánh giữ nguyên),
+giá trị lá float32, chỉ số nút int16 khi đủ chỗ (không thì int32) và mã đặc trưng uint8. Với mỗi
+độ sâu tối đa thử được, các cây được cắt ở độ sâu đó (nút bị cắt thành lá mang giá trị trung bình
+của nó), cặp lá anh em chênh nhau không quá --merge-tolerance được gộp, cây có dự đoán gần trùng
+một cây khác bị bỏ, rồi loại dần cây đóng góp ít nhất (xếp theo RMSE ngoài túi trên tập huấn
+luyện) khi RMSE còn trong ngân sách. Bản nhỏ nhất còn trong ngân sách được chọn. Ngân sách chỉ đo
+trên tập test mà train_*.py báo cáo (split_dataset): cùng các dòng cho mọi mô hình và mọi bản nén;
+dữ liệu ngoài túi chỉ quyết định thứ tự bỏ cây. Bản nén giữ ít nhất --min-trees cây và không cắt
+nông hơn --min-depth, vì tập test nhỏ không đủ để phát hiện sai số tăng khi rừng chỉ còn vài cây nông.
+
+Server nạp <mô hình>_compact.joblib (--save) thay cho mô hình được nén từ nó, dù mô hình đó là tệp
+pickle trong model/ hay phiên bản CURRENT của kho (so sha256); --publish đưa bản nén vào kho mô hình
+như một phiên bản riêng.
+Chạy: python compress_forest.py --max-rmse-increase 1 [--save] [--publish candidate]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from tree_engine import FlatForest, floor_float32
+
+# Define paths
+DATA_PATH = 'data/insurance.csv'
+MODELS = {
+    'random_forest': ('model/random_forest_model.pkl', 'model/random_forest_compact'),
+    'decision_tree': ('model/decision_tree_model.pkl', 'model/decision_tree_compact'),
+}
+# Độ sâu thử lần lượt; None là giữ nguyên độ sâu
+DEPTHS = (None, 24, 20, 16, 14, 12, 10, 8, 6)
+MIN_DEPTH = 8
+MIN_TREES = 10
+MIN_CORRELATION = 0.999
+
+
+def compact_paths(prefix):
+    return prefix + '.joblib', prefix + '.json'
+
+
+def read_compact_metadata(prefix):
+    """Thông tin của bản nén (nguồn, sha256 của pickle, RMSE); None nếu chưa có bản nén."""
+    artifact, metadata = compact_paths(prefix)
+    if not (os.path.exists(artifact) and os.path.exists(metadata)):
+        return None
+    with open(metadata, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def prune(forest, trees=None, max_depth=None, merge_tolerance=0.0):
+    """FlatForest mới chỉ gồm các cây trees (theo thứ tự gốc), cắt ở max_depth và gộp lá anh em.
+
+    Giá trị của mỗi nút trong (trung bình nhãn của các mẫu đi qua nó) được giữ khi làm phẳng,
+    nên nút bị cắt hay được gộp chỉ cần đánh dấu là lá.
+    """
+    trees = np.arange(forest.n_trees) if trees is None else np.sort(np.asarray(trees))
+    roots = np.asarray(forest.roots[trees], dtype=np.intp)
+    left = np.asarray(forest.left, dtype=np.intp)
+    right = np.asarray(forest.right, dtype=np.intp)
+    is_leaf = np.array(forest.is_leaf, dtype=bool)
+
+    def levels():
+        """Các nút còn với tới được, theo từng tầng tính từ gốc."""
+        frontier = roots
+        while len(frontier):
+            yield frontier
+            internal = frontier[~is_leaf[frontier]]
+            frontier = np.concatenate([left[internal], right[internal]])
+
+    if max_depth is not None:
+        for depth, nodes in enumerate(levels()):
+            if depth == max_depth:
+                is_leaf[nodes] = True
+    if merge_tolerance > 0:
+        # Từ tầng sâu nhất lên: nút có hai con đều là lá và gần bằng nhau thành lá, có thể gộp tiếp ở tầng trên
+        for nodes in reversed(list(levels())):
+            internal = nodes[~is_leaf[nodes]]
+            mergeable = (is_leaf[left[internal]] & is_leaf[right[internal]]
+                         & (np.abs(forest.value[left[internal]] - forest.value[right[internal]]) <= merge_tolerance))
+            is_leaf[internal[mergeable]] = True
+
+    reachable = list(levels())
+    kept = np.sort(np.concatenate(reachable))
+    new_id = np.zeros(len(is_leaf), dtype=np.intp)
+    new_id[kept] = np.arange(len(kept))
+    kept_leaf = is_leaf[kept]
+    self_ids = np.arange(len(kept))
+    return FlatForest(
+        feature=np.where(kept_leaf, 0, forest.feature[kept]).astype(np.int32),
+        threshold=np.where(kept_leaf, np.inf, forest.threshold[kept]).astype(np.float64),
+        left=np.where(kept_leaf, self_ids, new_id[left[kept]]).astype(np.int32),
+        right=np.where(kept_leaf, self_ids, new_id[right[kept]]).astype(np.int32),
+        value=np.asarray(forest.value[kept], dtype=np.float64),
+        roots=new_id[roots].astype(np.int32),
+        max_depth=len(reachable) - 1,
+        n_features=forest.n_features,
+        feature_names=forest.feature_names,
+    )
+
+
+def quantize(forest):
+    """Bản nén của forest: ngưỡng làm tròn xuống float32, giá trị float32, chỉ số nút int16/int32."""
+    n_nodes = len(forest.value)
+    index = np.int16 if n_nodes - 1 <= np.iinfo(np.int16).max else np.int32
+    return FlatForest(
+        feature=np.asarray(forest.feature).astype(np.uint8 if forest.n_features <= 256 else np.int32),
+        threshold=floor_float32(forest.threshold),
+        left=np.asarray(forest.left).astype(index),
+        right=np.asarray(forest.right).astype(index),
+        value=np.asarray(forest.value).astype(np.float32),
+        roots=np.asarray(forest.roots).astype(index),
+        max_depth=forest.max_depth,
+        n_features=forest.n_features,
+        feature_names=forest.feature_names,
+    )
+
+
+def rmse(predictions, y):
+    return float(np.sqrt(np.mean((np.asarray(predictions, dtype=np.float64) - y) ** 2)))
+
+
+def tree_predictions(forest, X):
+    """Dự đoán của từng cây, dạng (n_trees, n_rows)."""
+    return np.asarray(forest.value[forest.apply(X)], dtype=np.float64)
+
+
+def distinct_trees(tree_preds, min_correlation=MIN_CORRELATION):
+    """Chỉ số các cây giữ lại sau khi bỏ cây có dự đoán tương quan >= min_correlation với một cây đứng trước."""
+    if min_correlation >= 1 or len(tree_preds) < 2:
+        return list(range(len(tree_preds)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = np.nan_to_num(np.corrcoef(tree_preds))  # cây hằng số cho nan
+    kept = []
+    for i in range(len(tree_preds)):
+        if not kept or correlation[i, kept].max() < min_correlation:
+            kept.append(i)
+    return kept
+
+
+def out_of_bag_mask(model, n_rows):
+    """mask[i, r] True khi dòng huấn luyện r nằm ngoài mẫu bootstrap của cây i; None nếu không có bootstrap."""
+    if not getattr(model, 'bootstrap', False) or not hasattr(model, 'estimators_samples_'):
+        return None
+    mask = np.ones((len(model.estimators_), n_rows), dtype=bool)
+    for i, samples in enumerate(model.estimators_samples_):
+        if len(samples) and samples.max() >= n_rows:
+            return None  # mô hình không được huấn luyện trên tập này
+        mask[i, samples] = False
+    return mask
+
+
+def masked_rmse(total, weight, y):
+    """RMSE của dự đoán total / weight, chỉ trên các dòng có weight > 0 (theo trục cuối)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        squared = np.where(weight > 0, (total / weight - y) ** 2, np.nan)
+    return np.sqrt(np.nanmean(squared, axis=-1))
+
+
+def elimination_order(tree_preds, mask, y, trees):
+    """Loại ngược: mỗi bước bỏ cây mà khi bỏ RMSE trên dữ liệu chọn thấp nhất, mỗi dòng chỉ tính các
+    cây có mask True (cây chưa thấy dòng đó). Trả về [(cây bị bỏ, RMSE sau khi bỏ)] theo thứ tự."""
+    trees = list(trees)
+    weights = mask.astype(np.float64)
+    total = (tree_preds[trees] * weights[trees]).sum(axis=0)
+    weight = weights[trees].sum(axis=0)
+    order = []
+    while len(trees) > 1:
+        errors = masked_rmse(total - tree_preds[trees] * weights[trees], weight - weights[trees], y)
+        best = int(np.argmin(errors))
+        tree = trees.pop(best)
+        total -= tree_preds[tree] * weights[tree]
+        weight -= weights[tree]
+        order.append((tree, float(errors[best])))
+    return order
+
+
+def compress(base, X_test, y_test, max_increase_pct, X_select=None, y_select=None, select_mask=None,
+             depths=DEPTHS, merge_tolerance=0.0, min_correlation=MIN_CORRELATION, min_trees=MIN_TREES,
+             min_depth=MIN_DEPTH):
+    """Các bản nén còn trong ngân sách, mỗi độ sâu một bản: danh sách (tên, FlatForest, thông tin).
+
+    Thứ tự bỏ cây được quyết định trên dữ liệu chọn (X_select, với rừng bootstrap là các dòng huấn
+    luyện ngoài túi của từng cây theo select_mask) để không khớp theo nhiễu của tập test nhỏ. Ngân
+    sách chỉ so trên toàn bộ tập test, nên mọi bản được so trên cùng các dòng. Không có dữ liệu chọn
+    thì dùng chính tập test.
+    """
+    if X_select is None:
+        X_select, y_select = X_test, y_test
+    if select_mask is None:
+        select_mask = np.ones((base.n_trees, len(X_select)), dtype=bool)
+    base_rmse = rmse(base.predict(X_test), y_test)
+    limit = base_rmse * (1 + max_increase_pct / 100)
+    min_trees = max(1, min(min_trees, base.n_trees))
+
+    variants = []
+    for depth in depths:
+        if depth is not None and (depth >= base.max_depth or depth < min_depth):
+            continue
+        capped = prune(base, max_depth=depth, merge_tolerance=merge_tolerance)
+        select_preds = tree_predictions(capped, X_select)
+        test_preds = tree_predictions(capped, X_test)
+        trees = distinct_trees(select_preds, min_correlation)
+        if len(trees) < min_trees:
+            trees = list(range(capped.n_trees))
+        if rmse(test_preds[trees].mean(axis=0), y_test) > limit:
+            break  # cắt nông hơn chỉ làm sai số tăng thêm
+        near_duplicates = capped.n_trees - len(trees)
+        test_total = test_preds[trees].sum(axis=0)
+        for tree, _ in elimination_order(select_preds, select_mask, y_select, trees):
+            if len(trees) <= min_trees or rmse((test_total - test_preds[tree]) / (len(trees) - 1), y_test) > limit:
+                break
+            test_total -= test_preds[tree]
+            trees.remove(tree)
+        forest = quantize(prune(capped, trees))
+        test_error = rmse(forest.predict(X_test), y_test)
+        if test_error > limit:
+            continue  # làm tròn float32 đẩy qua giới hạn
+        variants.append((f"depth {depth or base.max_depth}", forest, {
+            "max_depth": depth,
+            "trees": forest.n_trees,
+            "near_duplicate_trees": near_duplicates,
+            "nodes": len(forest.value),
+            "test_rmse": test_error,
+        }))
+    return base_rmse, limit, variants
+
+
+def measure(load, path, X, prepare=None, repeat=5, single_row_calls=300):
+    """Kích thước tệp, thời gian nạp (kèm một dự đoán đầu tiên) và độ trễ mỗi dòng của một mô hình.
+
+    prepare chuyển ma trận đầu vào sang dạng mô hình nhận (DataFrame cho sklearn), làm trước khi đo.
+    """
+    prepare = prepare or (lambda rows: rows)
+    rows = [prepare(X[i % len(X):i % len(X) + 1]) for i in range(single_row_calls)]
+    batch = prepare(X[np.arange(1000) % len(X)])
+    load_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model = load(path)
+        model.predict(rows[0])
+        load_times.append(time.perf_counter() - start)
+    single = []
+    for row in rows:
+        start = time.perf_counter()
+        model.predict(row)
+        single.append(time.perf_counter() - start)
+    batch_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict(batch)
+        batch_times.append(time.perf_counter() - start)
+    return {
+        "bytes": os.path.getsize(path),
+        "load_ms": float(np.median(load_times)) * 1000,
+        "row_us": float(np.median(single)) * 1e6,
+        "batch_row_us": float(np.median(batch_times)) / len(batch) * 1e6,
+    }
+
+
+def report(name, model_path, model, base, X_test, y_test, base_rmse, variants):
+    """In bảng so sánh các bản (pickle sklearn, mảng phẳng float64, bản nén) và trả về các dòng của bảng."""
+    import joblib
+    import pandas as pd
+    from training import FEATURE_COLUMNS
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        frame = lambda X: pd.DataFrame(X, columns=FEATURE_COLUMNS)  # noqa: E731
+        sklearn_stats = measure(joblib.load, model_path, X_test, frame)
+        rows.append(("sklearn pickle", {"trees": base.n_trees, "nodes": len(base.value),
+                                        "test_rmse": rmse(model.predict(frame(X_test)), y_test), **sklearn_stats}))
+        entries = [("flat float64", base, {"trees": base.n_trees, "nodes": len(base.value)}),
+                   ("flat float32", quantize(base), {"trees": base.n_trees, "nodes": len(base.value)})] + variants
+        for label, forest, info in entries:
+            path = os.path.join(tmp, f"{len(rows)}.joblib")
+            forest.save(path)
+            rows.append((label, {**info, "test_rmse": rmse(forest.predict(X_test), y_test),
+                                 **measure(FlatForest.load, path, X_test)}))
+
+    print(f"\n{name}: test RMSE {base_rmse:.2f} on {len(y_test)} rows")
+    print(f"{'variant':<16} {'trees':>5} {'nodes':>8} {'size KB':>9} {'load ms':>8} {'1-row us':>9} "
+          f"{'batch us/row':>12} {'test RMSE':>10} {'vs base':>8}")
+    for label, row in rows:
+        print(f"{label:<16} {row['trees']:5d} {row['nodes']:8d} {row['bytes'] / 1024:9.1f} {row['load_ms']:8.2f} "
+              f"{row['row_us']:9.1f} {row['batch_row_us']:12.2f} {row['test_rmse']:10.2f} "
+              f"{row['test_rmse'] / base_rmse - 1:+8.2%}")
+    return [{"variant": label, **row} for label, row in rows]
+
+
+def save_compact(prefix, forest, metadata):
+    artifact, metadata_path = compact_paths(prefix)
+    forest.save(artifact)
+    with open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Compact model saved to {artifact}")
+
+
+if __name__ == '__main__':
+    import joblib
+    from lookup_table import file_sha256
+    from training import FEATURE_COLUMNS, load_dataset, split_dataset
+
+    parser = argparse.ArgumentParser(description="Compress trained tree models within a test-RMSE budget.")
+    parser.add_argument('--model', choices=sorted(MODELS), action='append', help="limit to one model (repeatable)")
+    parser.add_argument('--max-rmse-increase', type=float, default=1.0,
+                        help="allowed test-RMSE increase over the original model, in percent")
+    parser.add_argument('--depths', type=int, nargs='+', help="depth caps to try (default: none, then 24 down to --min-depth)")
+    parser.add_argument('--merge-tolerance', type=float, default=0.0,
+                        help="merge sibling leaves whose predictions differ by at most this much (0 = off)")
+    parser.add_argument('--min-correlation', type=float, default=MIN_CORRELATION,
+                        help="drop trees whose training-set predictions correlate at least this much with a kept tree")
+    parser.add_argument('--min-trees', type=int, default=MIN_TREES,
+                        help=f"never keep fewer trees than this (default: {MIN_TREES}, or all if the forest is smaller)")
+    parser.add_argument('--min-depth', type=int, default=MIN_DEPTH,
+                        help=f"never cap trees shallower than this (default: {MIN_DEPTH})")
+    parser.add_argument('--save', action='store_true', help="write the smallest variant where the server loads it")
+    parser.add_argument('--publish', choices=['current', 'candidate'],
+                        help="also publish the smallest variant to the model registry")
+    parser.add_argument('--output', help="write the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        X, y = load_dataset(DATA_PATH)
+    except FileNotFoundError:
+        print(f"Error: {DATA_PATH} not found.")
+        sys.exit(1)
+    X_train, X_test, y_train, y_test = split_dataset(X, y)
+    X_train, y_train = X_train.to_numpy(np.float64), y_train.to_numpy(np.float64)
+    X_test, y_test = X_test.to_numpy(np.float64), y_test.to_numpy(np.float64)
+    depths = DEPTHS if args.depths is None else (None, *sorted(args.depths, reverse=True))
+
+    results = {}
+    for name in args.model or MODELS:
+        model_path, prefix = MODELS[name]
+        if not os.path.exists(model_path):
+            print(f"Skipping {name}: {model_path} not found.")
+            continue
+        model = joblib.load(model_path)
+        base = FlatForest.from_sklearn(model)
+        # Rừng bootstrap: chọn cây trên các dòng huấn luyện ngoài túi; cây đơn: trên tập test
+        mask = out_of_bag_mask(model, len(X_train))
+        selection = (X_train, y_train, mask) if mask is not None else (None, None, None)
+        base_rmse, limit, variants = compress(base, X_test, y_test, args.max_rmse_increase, *selection, depths,
+                                              args.merge_tolerance, args.min_correlation, args.min_trees,
+                                              args.min_depth)
+        rows = report(name, model_path, model, base, X_test, y_test, base_rmse, variants)
+        results[name] = {"base_test_rmse": base_rmse, "rmse_limit": limit, "variants": rows}
+        if not variants:
+            print(f"{name}: no variant within +{args.max_rmse_increase}% test RMSE")
+            continue
+        label, forest, info = min(variants, key=lambda variant: variant[1].value.nbytes)
+        print(f"{name}: smallest variant within +{args.max_rmse_increase}% test RMSE: {label}, "
+              f"{info['trees']} trees, {info['nodes']} nodes, test RMSE {base_rmse:.2f} -> {info['test_rmse']:.2f}")
+        metadata = {
+            'model': name,
+            'source': model_path,
+            'source_sha256': file_sha256(model_path),
+            'max_rmse_increase_pct': args.max_rmse_increase,
+            'merge_tolerance': args.merge_tolerance,
+            'base_test_rmse': base_rmse,
+            **info,
+        }
+        if args.save:
+            save_compact(prefix, forest, metadata)
+        if args.publish:
+            from model_registry import MODEL_REGISTRY_DIR, publish
+            version = publish(name, model, forest, FEATURE_COLUMNS,
+                              {'test_rmse': info['test_rmse'], 'base_test_rmse': base_rmse},
+                              pointer=args.publish.upper(), compressed=metadata)
+            print(f"Published compact {name} version {version} to {MODEL_REGISTRY_DIR} as {args.publish.upper()}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
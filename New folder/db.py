@@ -0,0 +1,167 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "30"))
+
+# Cấu hình PRAGMA áp dụng cho mọi kết nối trong pool
+PRAGMA_PROFILE = {
+    "journal_mode": "WAL",        # đọc không chặn ghi, ghi không chặn đọc
+    "synchronous": "NORMAL",      # với WAL chỉ fsync khi checkpoint, vẫn an toàn khi ứng dụng crash
+    "busy_timeout": 5000,         # chờ khóa ghi thay vì báo lỗi "database is locked" ngay
+    "cache_size": -16000,         # 16 MB page cache cho mỗi kết nối
+    "temp_store": "MEMORY",
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+
+class Database:
+    """Pool kết nối SQLite có giới hạn, chạy truy vấn trên luồng riêng thay vì event loop.
+
+    Mỗi kết nối sống lâu trong pool nên câu lệnh SQL (chuỗi cố định, tham số `?`)
+    chỉ được biên dịch một lần rồi lấy lại từ statement cache của sqlite3.
+    """
+
+    def __init__(self, path=DATABASE_PATH, pool_size=DB_POOL_SIZE, pragmas=None,
+                 acquire_timeout=DB_ACQUIRE_TIMEOUT, statement_cache_size=256):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self.pragmas = PRAGMA_PROFILE if pragmas is None else pragmas
+        self.acquire_timeout = acquire_timeout
+        self.statement_cache_size = statement_cache_size
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="db")
+        self.calls = Counter()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            timeout=self.pragmas.get("busy_timeout", 5000) / 1000,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def acquire_sync(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._pool.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Hết kết nối trong pool cơ sở dữ liệu")
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """Mượn một kết nối (chặn luồng hiện tại); rollback nếu có lỗi."""
+        conn = self.acquire_sync()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    async def acquire(self):
+        """Mượn một kết nối mà không chặn event loop; trả lại bằng release()."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.acquire_sync)
+
+    def _run_sync(self, fn, args):
+        with self.connection() as conn:
+            return fn(conn, *args)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_sync, fn, args)
+
+    async def run(self, fn, *args):
+        """Chạy fn(conn, *args) trên luồng của pool với một kết nối mượn."""
+        self.calls["run"] += 1
+        return await self._run(fn, *args)
+
+    async def run_on(self, conn, fn, *args):
+        """Chạy fn(conn, *args) với kết nối đã mượn sẵn.
+
+        Dùng executor mặc định để người giữ kết nối không phải chờ luồng của pool,
+        vốn có thể đang bận chờ chính kết nối đó.
+        """
+        self.calls["run_on"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: fn(conn, *args))
+
+    async def fetchone(self, sql, params=()):
+        self.calls["fetchone"] += 1
+        return await self._run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        self.calls["fetchall"] += 1
+        return await self._run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql, params=()):
+        """Thực thi một câu lệnh ghi và commit; trả về lastrowid."""
+        self.calls["execute"] += 1
+        def execute(conn):
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        return await self._run(execute)
+
+    async def executemany(self, sql, seq_of_params):
+        self.calls["executemany"] += 1
+        def executemany(conn):
+            cursor = conn.executemany(sql, seq_of_params)
+            conn.commit()
+            return cursor.rowcount
+        return await self._run(executemany)
+
+    def stats(self):
+        return {
+            "pool_size": self.pool_size,
+            "connections": self._created,
+            "idle_connections": self._pool.qsize(),
+            "calls": dict(self.calls),
+        }
+
+    def close(self):
+        """Đóng mọi kết nối và luồng; đối tượng vẫn dùng lại được (mở kết nối mới khi cần).
+
+        serve.py gọi hàm này trước khi fork để worker không thừa hưởng kết nối SQLite của tiến trình cha.
+        """
+        self._executor.shutdown(wait=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="db")
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
@@ -0,0 +1,35 @@
+import joblib
+import os
+import sys
+from tree_engine import FlatForest, verify_against_sklearn
+from training import load_dataset
+from training.models import MODEL_PATHS as MODELS, sequential
+
+# Define paths
+DATA_PATH = 'data/insurance.csv'
+
+# Load dataset
+try:
+    X, _ = load_dataset(DATA_PATH)
+except FileNotFoundError:
+    print(f"Error: {DATA_PATH} not found.")
+    exit(1)
+
+# Export every trained model to flat arrays and verify against sklearn
+failed = False
+for name, (model_path, flat_path) in MODELS.items():
+    if not os.path.exists(model_path):
+        print(f"Skipping {name}: {model_path} not found.")
+        continue
+    model = sequential(joblib.load(model_path))
+    flat_model = FlatForest.from_sklearn(model)
+    identical, max_diff = verify_against_sklearn(model, flat_model, X)
+    print(f"{name}: {flat_model.n_trees} trees, {len(flat_model.value)} nodes, "
+          f"identical to sklearn on {len(X)} rows: {identical} (max diff {max_diff})")
+    if not identical:
+        failed = True
+        continue
+    flat_model.save(flat_path)
+    print(f"Flat model saved to {flat_path}")
+
+sys.exit(1 if failed else 0)
@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from analytics import update_rollups
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+INPUT_FIELDS = ('age', 'sex', 'height', 'weight', 'children', 'smoker', 'region', 'model')
+INSERT_PREDICTION = """
+    INSERT INTO predictions (user_id, age, sex, height, weight, children, smoker, region, model, prediction, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+RECORD_FIELDS = INSERT_PREDICTION.count("?")
+# Tệp journal đã ghi lại (theo sha256 nội dung), ghi cùng giao dịch với các dòng của nó: crash giữa
+# commit và os.remove thì lần sau chỉ xóa tệp, không chèn lại
+CREATE_JOURNAL_REPLAYS = """
+    CREATE TABLE IF NOT EXISTS journal_replays (
+        digest TEXT PRIMARY KEY,
+        records INTEGER NOT NULL,
+        replayed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def insert_predictions(conn, records):
+    """Ghi các bản ghi lịch sử và cộng chúng vào bảng rollup, trong giao dịch đang mở của conn."""
+    conn.executemany(INSERT_PREDICTION, records)
+    update_rollups(conn, records)
+
+
+def write_predictions(conn, records):
+    insert_predictions(conn, records)
+    conn.commit()
+    return len(records)
+
+
+def parse_journal(lines):
+    """Tách các dòng journal thành (bản ghi hợp lệ, dòng hỏng).
+
+    Dòng hỏng thường là dòng cuối bị cắt khi tiến trình chết giữa lúc ghi; bỏ qua từng dòng
+    thay vì làm hỏng cả tệp.
+    """
+    records, malformed = [], []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, list) and len(record) == RECORD_FIELDS:
+            records.append(tuple(record))
+        else:
+            malformed.append(line)
+    return records, malformed
+
+
+def prediction_record(user_id, input_dict, prediction):
+    """Bản ghi lịch sử; thời điểm lấy lúc dự đoán (UTC, cùng định dạng CURRENT_TIMESTAMP)."""
+    return (
+        (user_id,)
+        + tuple(input_dict[name] for name in INPUT_FIELDS)
+        + (prediction, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+
+
+class PredictionWriter:
+    """Ghi lịch sử dự đoán ở nền (write-behind) theo lô bằng executemany.
+
+    Hàng đợi có giới hạn: khi đầy, submit() chờ tối đa put_timeout_ms (backpressure) rồi
+    ghi bản ghi ra journal trên đĩa nếu được cấu hình, nếu không thì bỏ và đếm lại.
+    Lô ghi lỗi cũng được chuyển ra journal; journal được ghi lại vào CSDL khi khởi động
+    và sau mỗi lần ghi lô thành công. Mọi thao tác file journal chạy trên luồng phụ để
+    open/fsync không chặn event loop.
+    """
+
+    def __init__(self, db, max_queue_size=10000, batch_size=500, flush_interval_ms=50,
+                 put_timeout_ms=100, journal_path=None):
+        self.db = db
+        self.max_queue_size = max_queue_size
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_timeout = put_timeout_ms / 1000
+        self.journal_path = journal_path
+        self._queue = None
+        self._task = None
+        # Giữ các lần ghi journal đồng thời không xen dòng và không chạy cùng lúc với việc đổi tên
+        self._journal_lock = threading.Lock()
+        self._journal_pending = bool(journal_path) and (
+            os.path.exists(journal_path) or os.path.exists(journal_path + ".replay"))
+        self.flushed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.flush_errors = 0
+        self.restarts = 0
+        self.flush_latency = Histogram([0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1])
+        self.flush_size = Histogram([1, 10, 50, 100, 250, 500, 1000])
+
+    def start(self):
+        if self._task is not None and self._task.done():
+            # Task nền chết vì lỗi không lường trước: chạy lại trên cùng hàng đợi để không mất bản ghi
+            error = None if self._task.cancelled() else self._task.exception()
+            logger.error(f"Task ghi lịch sử đã dừng bất thường ({error!r}), khởi động lại")
+            self.restarts += 1
+            self._task = asyncio.create_task(self._run())
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Ghi hết hàng đợi rồi dừng task nền (gọi khi server tắt)."""
+        if self._task is None:
+            return
+        self.start()
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, record):
+        self.start()
+        try:
+            self._queue.put_nowait(record)
+            return
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._queue.put(record), self.put_timeout)
+        except asyncio.TimeoutError:
+            await self._spill_or_drop([record], "hàng đợi ghi lịch sử đầy")
+
+    def _append_journal(self, records):
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with self._journal_lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _rotate_journal(self, replay_path):
+        """Đổi tên journal thành replay_path (nếu chưa có); trả về True nếu vẫn còn journal mới."""
+        with self._journal_lock:
+            if os.path.exists(self.journal_path) and not os.path.exists(replay_path):
+                os.replace(self.journal_path, replay_path)
+            return os.path.exists(self.journal_path)
+
+    async def _spill_or_drop(self, records, reason):
+        if self.journal_path:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._append_journal, records)
+                self.spilled += len(records)
+                self._journal_pending = True
+                logger.warning(f"Ghi {len(records)} bản ghi lịch sử ra journal: {reason}")
+                return
+            except OSError as e:
+                logger.error(f"Không ghi được journal {self.journal_path}: {e}")
+        self.dropped += len(records)
+        logger.error(f"Bỏ {len(records)} bản ghi lịch sử: {reason}")
+
+    async def _run(self):
+        if self._journal_pending:
+            await self._replay_journal()
+        stopping = False
+        while not stopping:
+            record = await self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._flush(batch)
+        # Xả nốt những gì còn lại khi dừng
+        remaining = []
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            if record is not None:
+                remaining.append(record)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start:start + self.batch_size])
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            await self.db.run(write_predictions, batch)
+        except Exception as e:
+            self.flush_errors += 1
+            logger.error(f"Lỗi khi ghi lô {len(batch)} bản ghi lịch sử: {e}")
+            await self._spill_or_drop(batch, "ghi CSDL thất bại")
+            return
+        self.flush_latency.observe(time.perf_counter() - start)
+        self.flush_size.observe(len(batch))
+        self.flushed += len(batch)
+        if self._journal_pending:
+            await self._replay_journal()
+
+    async def _replay_journal(self):
+        # Đổi tên journal trước khi đọc để các bản ghi spill mới không bị xóa nhầm
+        replay_path = self.journal_path + ".replay"
+        loop = asyncio.get_running_loop()
+        try:
+            self._journal_pending = await loop.run_in_executor(None, self._rotate_journal, replay_path)
+        except OSError as e:
+            # Thử lại sau lần ghi lô thành công tiếp theo; không để lỗi làm chết task nền
+            self._journal_pending = True
+            logger.error(f"Không đổi tên được journal {self.journal_path}: {e}")
+            return
+        if not os.path.exists(replay_path):
+            return
+
+        def replay(conn):
+            with open(replay_path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            conn.execute(CREATE_JOURNAL_REPLAYS)
+            count = 0
+            if conn.execute("SELECT 1 FROM journal_replays WHERE digest = ?", (digest,)).fetchone() is None:
+                records, malformed = parse_journal(data.decode("utf-8", errors="replace").splitlines(keepends=True))
+                if malformed:
+                    # Giữ lại để kiểm tra bằng tay; không chặn phần còn lại của journal
+                    with open(self.journal_path + ".bad", "a", encoding="utf-8") as f:
+                        f.writelines(line if line.endswith("\n") else line + "\n" for line in malformed)
+                    logger.warning(f"Bỏ qua {len(malformed)} dòng hỏng trong journal {replay_path}, "
+                                   f"chuyển sang {self.journal_path}.bad")
+                insert_predictions(conn, records)
+                conn.execute("INSERT INTO journal_replays (digest, records) VALUES (?, ?)", (digest, len(records)))
+                conn.commit()
+                count = len(records)
+            else:
+                logger.warning(f"Journal {replay_path} đã được ghi lại trước đó, chỉ xóa tệp")
+            os.remove(replay_path)
+            return count
+
+        try:
+            count = await self.db.run(replay)
+        except Exception as e:
+            self._journal_pending = True
+            logger.error(f"Không ghi lại được journal {replay_path}: {e}")
+            return
+        self.replayed += count
+        if count:
+            logger.info(f"Đã ghi lại {count} bản ghi lịch sử từ journal")
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_size": self.max_queue_size,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "flush_errors": self.flush_errors,
+            "restarts": self.restarts,
+            "flush_latency_seconds": self.flush_latency.snapshot(),
+            "flush_size": self.flush_size.snapshot(),
+        }
@@ -0,0 +1,190 @@
+"""Cấu hình logging của app: đồng bộ (mặc định) hoặc ghi ở luồng nền qua hàng đợi có giới hạn.
+
+LOG_MODE=async: handler trên luồng event loop chỉ đặt LogRecord vào hàng đợi (LOG_QUEUE_SIZE);
+QueueListener định dạng và ghi ở luồng nền. Định dạng lười: msg/args giữ nguyên đến luồng nền
+nên gọi log với tham số kiểu %s, không dùng f-string, và không sửa đối tượng đã truyền vào log.
+Hàng đợi đầy thì bỏ bản ghi và đếm (dropped) thay vì chặn request; WARNING trở lên còn được
+thêm một phần dự phòng bằng LOG_QUEUE_SIZE nên lỗi không bị bỏ vì log INFO dồn ứ.
+LOG_FORMAT=json: mỗi dòng một đối tượng JSON (kèm method/path của request nếu có).
+LOG_SAMPLE_RATES="/predict=0.01,/history=0.1,*=1": tỉ lệ request theo đường dẫn được giữ log
+INFO/DEBUG; quyết định một lần cho cả request. WARNING trở lên luôn được giữ.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+from metrics import current_trace
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Thuộc tính có sẵn của LogRecord; phần còn lại (extra=...) được ghi thành trường JSON
+RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def parse_sample_rates(text):
+    """"/predict=0.01,*=1" -> {"/predict": 0.01, "*": 1.0}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        path, _, rate = item.rpartition("=")
+        rate = float(rate)
+        if not path or not 0 <= rate <= 1:
+            raise ValueError(f"LOG_SAMPLE_RATES không hợp lệ: {item!r}")
+        rates[path] = rate
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi bản ghi một dòng JSON: ts, level, logger, msg, các trường extra và exc nếu có."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestSampler(logging.Filter):
+    """Lọc log INFO/DEBUG theo tỉ lệ của đường dẫn request; gắn method/path vào bản ghi."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.default_rate = rates.get("*", 1.0)
+        self.sampled_out = 0
+
+    def filter(self, record):
+        trace = current_trace()
+        if trace is None:
+            return True
+        record.method = trace.method
+        record.path = trace.path
+        if record.levelno >= logging.WARNING:
+            return True
+        if trace.log_sampled is None:
+            rate = self.rates.get(trace.path, self.default_rate)
+            trace.log_sampled = rate >= 1 or random.random() < rate
+        if not trace.log_sampled:
+            self.sampled_out += 1
+        return trace.log_sampled
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler không chặn: quá max_size bản ghi đang chờ thì bỏ bản ghi và tăng dropped.
+
+    Hàng đợi bên dưới không giới hạn; giới hạn kiểm tra ở đây để WARNING trở lên dùng được
+    thêm max_size chỗ dự phòng.
+    """
+
+    def __init__(self, log_queue, max_size):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Không định dạng ở đây (QueueHandler mặc định gọi format trên luồng gọi log)
+        return record
+
+    def enqueue(self, record):
+        limit = self.max_size if record.levelno < logging.WARNING else 2 * self.max_size
+        if self.queue.qsize() >= limit:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class LogPipeline:
+    """Handler của root logger theo LOG_MODE/LOG_FORMAT/LOG_SAMPLE_RATES."""
+
+    def __init__(self, mode="sync", fmt="text", queue_size=10000, sample_rates=None, level=logging.INFO):
+        if mode not in ("sync", "async"):
+            raise ValueError(f"LOG_MODE không hợp lệ: {mode!r} (sync | async)")
+        if fmt not in ("text", "json"):
+            raise ValueError(f"LOG_FORMAT không hợp lệ: {fmt!r} (text | json)")
+        self.mode = mode
+        self.format = fmt
+        self.queue_size = queue_size
+        self.level = level
+        self.sampler = RequestSampler(sample_rates or {})
+        # Handler ghi ra thật (stderr); ở chế độ async nó chạy trong luồng của QueueListener
+        self.output_handlers = [logging.StreamHandler()]
+        formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+        for handler in self.output_handlers:
+            handler.setFormatter(formatter)
+        self.queue_handler = None
+        self.listener = None
+
+    @classmethod
+    def from_env(cls, environ):
+        return cls(
+            mode=environ.get("LOG_MODE", "sync"),
+            fmt=environ.get("LOG_FORMAT", "text"),
+            queue_size=int(environ.get("LOG_QUEUE_SIZE", "10000")),
+            sample_rates=parse_sample_rates(environ.get("LOG_SAMPLE_RATES")),
+        )
+
+    def install(self):
+        """Gắn vào root logger; như basicConfig, không làm gì nếu root đã có handler."""
+        root = logging.getLogger()
+        if root.handlers:
+            return False
+        root.setLevel(self.level)
+        if self.mode == "async":
+            self.queue_handler = BoundedQueueHandler(queue.Queue(), self.queue_size)
+            handlers = [self.queue_handler]
+            self.start()
+            atexit.register(self.stop)
+        else:
+            handlers = self.output_handlers
+        for handler in handlers:
+            handler.addFilter(self.sampler)
+            root.addHandler(handler)
+        return True
+
+    def start(self):
+        """Chạy luồng ghi với hàng đợi mới (gọi lại trong worker sau fork: luồng không được fork theo)."""
+        if self.queue_handler is None:
+            return
+        self.queue_handler.queue = queue.Queue()
+        self.listener = QueueListener(self.queue_handler.queue, *self.output_handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def flush(self, timeout=5.0):
+        """Chờ luồng nền ghi hết các bản ghi đang có trong hàng đợi."""
+        if self.listener is None:
+            return
+        log_queue = self.queue_handler.queue
+        deadline = time.monotonic() + timeout
+        while log_queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+        for handler in self.output_handlers:
+            handler.flush()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def set_stream(self, stream):
+        for handler in self.output_handlers:
+            handler.setStream(stream)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "format": self.format,
+            "queue_depth": self.queue_handler.queue.qsize() if self.queue_handler else 0,
+            "dropped": self.queue_handler.dropped if self.queue_handler else 0,
+            "sampled_out": self.sampler.sampled_out,
+        }
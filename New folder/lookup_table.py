@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import numpy as np
+from tree_engine import floor_float32
+
+# Không gian đầu vào rời rạc, giống với các Field của PredictionInput (trừ BMI)
+GRID = (
+    ('age', 18, 64),
+    ('sex', 0, 1),
+    ('children', 0, 5),
+    ('smoker', 0, 1),
+    ('region', 0, 3),
+)
+FEATURE_COLUMNS = ['age', 'sex', 'bmi', 'children', 'smoker', 'region']
+GRID_COLUMNS = [FEATURE_COLUMNS.index(name) for name, _, _ in GRID]
+BMI_COLUMN = FEATURE_COLUMNS.index('bmi')
+GRID_SHAPE = tuple(high - low + 1 for _, low, high in GRID)
+GRID_LOW = np.array([low for _, low, _ in GRID])
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def table_paths(prefix):
+    return prefix + '_lut.npy', prefix + '_lut_bmi.npy', prefix + '_lut.json'
+
+
+def bmi_thresholds(flat_model):
+    """Các ngưỡng tách BMI của mọi cây, làm tròn xuống float32 và loại trùng.
+
+    sklearn so sánh x (float32) với ngưỡng float64; với mọi x float32,
+    `x > t` tương đương `x > floor32(t)`, nên các ngưỡng cùng floor32 chia BMI giống hệt nhau.
+    """
+    mask = (flat_model.feature == BMI_COLUMN) & ~flat_model.is_leaf
+    return np.unique(floor_float32(flat_model.threshold[mask])).astype(np.float64)
+
+
+def bmi_interval_points(thresholds, upper=True):
+    """Một giá trị BMI (float32) đại diện cho mỗi khoảng (t[i-1], t[i]]; có len(thresholds) + 1 khoảng."""
+    thresholds32 = thresholds.astype(np.float32)
+    if len(thresholds32) == 0:
+        # Mô hình không tách theo BMI: một khoảng duy nhất, mọi giá trị BMI đều đại diện được
+        return np.zeros(1, dtype=np.float32)
+    after_last = np.nextafter(thresholds32[-1:], np.float32(np.inf))
+    if upper:
+        return np.concatenate([thresholds32, after_last])
+    below_first = thresholds32[:1] - np.float32(1)
+    return np.concatenate([below_first, np.nextafter(thresholds32, np.float32(np.inf))])
+
+
+def iter_grid_rows(bmi_points):
+    """Sinh ma trận đặc trưng cho mọi ô của bảng, mỗi lần một giá trị tuổi."""
+    rest = [np.arange(low, high + 1) for _, low, high in GRID[1:]]
+    mesh = np.meshgrid(*rest, bmi_points, indexing='ij')
+    columns = [m.ravel().astype(np.float64) for m in mesh]
+    for age in range(GRID[0][1], GRID[0][2] + 1):
+        X = np.empty((len(columns[0]), len(FEATURE_COLUMNS)), dtype=np.float64)
+        X[:, GRID_COLUMNS[0]] = age
+        for column, values in zip(GRID_COLUMNS[1:], columns[:-1]):
+            X[:, column] = values
+        X[:, BMI_COLUMN] = columns[-1]
+        yield age, X
+
+
+def build_table(predict, thresholds, upper=True):
+    """Tính trước dự đoán cho mọi (age, sex, children, smoker, region, khoảng BMI)."""
+    bmi_points = bmi_interval_points(thresholds, upper=upper)
+    table = np.empty(GRID_SHAPE + (len(bmi_points),), dtype=np.float64)
+    for age, X in iter_grid_rows(bmi_points):
+        table[age - GRID[0][1]] = np.asarray(predict(X), dtype=np.float64).reshape(table.shape[1:])
+    return table
+
+
+def save_table(prefix, table, thresholds, metadata):
+    table_path, bmi_path, meta_path = table_paths(prefix)
+    np.save(table_path, table)
+    np.save(bmi_path, thresholds)
+    with open(meta_path, 'w') as f:
+        json.dump(dict(metadata, shape=list(table.shape)), f, indent=2)
+
+
+def read_metadata(prefix):
+    meta_path = table_paths(prefix)[2]
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+class LookupTable:
+    """Trả lời dự đoán bằng một lần tìm nhị phân trên ngưỡng BMI và một lần đánh chỉ số mảng."""
+
+    def __init__(self, table, thresholds):
+        self.table = table
+        self.thresholds = thresholds
+
+    @classmethod
+    def load(cls, prefix, mmap_mode='r'):
+        table_path, bmi_path, _ = table_paths(prefix)
+        return cls(np.load(table_path, mmap_mode=mmap_mode), np.load(bmi_path))
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        cells = X[:, GRID_COLUMNS]
+        index = cells.astype(np.intp) - GRID_LOW
+        if np.any(cells != np.floor(cells)) or np.any(index < 0) or np.any(index >= GRID_SHAPE):
+            raise ValueError("Đầu vào nằm ngoài lưới của bảng tra cứu")
+        bmi_index = np.searchsorted(self.thresholds, X[:, BMI_COLUMN].astype(np.float32), side='left')
+        return np.asarray(self.table[tuple(index.T) + (bmi_index,)], dtype=np.float64)
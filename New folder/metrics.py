@@ -0,0 +1,379 @@
+import bisect
+import collections
+import contextvars
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket (giây) mặc định cho độ trễ request và từng bước xử lý
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Histogram:
+    """Histogram với các bucket cố định, an toàn khi dùng từ nhiều luồng."""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self):
+        """Trả về số đếm tích lũy theo từng cận trên (giống Prometheus)."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            value_sum = self._sum
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = total
+        return {"buckets": cumulative, "count": total, "sum": value_sum}
+
+
+def process_memory(pid="self"):
+    """Bộ nhớ của một tiến trình (byte) đọc từ /proc (Linux).
+
+    rss tính cả trang dùng chung (mô hình mmap, trang copy-on-write sau fork) cho mọi
+    tiến trình; pss chia đều trang dùng chung nên cộng pss các worker ra tổng thực tế.
+    Trả về {} nếu hệ điều hành không có /proc.
+    """
+    fields = {"Rss": "rss_bytes", "Pss": "pss_bytes", "Shared_Clean": "shared_bytes",
+              "Shared_Dirty": "shared_bytes", "Private_Clean": "private_bytes", "Private_Dirty": "private_bytes"}
+    for name in ("smaps_rollup", "status"):
+        try:
+            with open(f"/proc/{pid}/{name}") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        memory = {}
+        for line in lines:
+            key, _, rest = line.partition(":")
+            key = "Rss" if key == "VmRSS" else key
+            if key in fields:
+                memory[fields[key]] = memory.get(fields[key], 0) + int(rest.split()[0]) * 1024
+        if memory:
+            return memory
+    return {}
+
+
+class Counter:
+    """Bộ đếm có nhãn (mỗi tổ hợp giá trị nhãn một số đếm), an toàn khi dùng từ nhiều luồng."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self):
+        with self._lock:
+            return [(dict(zip(self.labelnames, labels)), value) for labels, value in self._values.items()]
+
+
+class HistogramFamily:
+    """Một Histogram cho mỗi tổ hợp giá trị nhãn, cùng bộ bucket."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labels):
+        histogram = self._histograms.get(labels)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(labels, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, value, *labels):
+        self.labels(*labels).observe(value)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._histograms.items())
+        return [(dict(zip(self.labelnames, labels)), histogram) for labels, histogram in items]
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Tập các metric của tiến trình, xuất theo định dạng văn bản của Prometheus.
+
+    Ngoài Counter/HistogramFamily đăng ký trực tiếp, các collector là hàm trả về danh sách
+    (tên, kiểu, mô tả, [(nhãn, giá trị hoặc Histogram)]) đọc từ số liệu sẵn có của các thành phần.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(HistogramFamily, name, documentation, labelnames, buckets)
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def collect(self):
+        for metric in list(self._metrics.values()):
+            yield metric.name, metric.type, metric.documentation, metric.samples()
+        for collector in self._collectors:
+            yield from collector()
+
+    def render(self):
+        lines = []
+        for name, metric_type, documentation, samples in self.collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                if metric_type != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                snapshot = value.snapshot()
+                for bound, count in snapshot["buckets"].items():
+                    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(snapshot['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """Thời gian từng bước của một request; stage() cộng dồn vào request đang chạy."""
+
+    __slots__ = ("method", "path", "start", "stages", "samples", "task", "frame", "log_sampled")
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.samples = None
+        self.task = None
+        self.frame = None
+        self.log_sampled = None
+
+
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+def current_trace():
+    """RequestTrace của request đang chạy (None nếu ngoài request)."""
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name):
+    """Đo một bước xử lý của request hiện tại (dùng được quanh await); ngoài request thì bỏ qua."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages[name] = trace.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: đếm request, đo độ trễ theo route và theo từng bước stage() của request.
+
+    Route lấy theo mẫu đường dẫn (/history chứ không theo tham số) để số nhãn không tăng vô hạn.
+    """
+
+    def __init__(self, app, registry, profiler=None):
+        self.app = app
+        self.profiler = profiler
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests by method, route and status code.", ("method", "route", "status"))
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by method and route.", ("method", "route"))
+        self.stages = registry.histogram(
+            "http_request_stage_seconds", "Time spent in each stage of a request handler.", ("route", "stage"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        if self.profiler is not None:
+            self.profiler.begin(trace, sys._getframe())
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - trace.start
+            _current_trace.reset(token)
+            route = getattr(scope.get("route"), "path", None) or scope.get("root_path") or "unmatched"
+            self.requests.inc(trace.method, route, str(status))
+            self.latency.observe(elapsed, trace.method, route)
+            for name, seconds in trace.stages.items():
+                self.stages.observe(seconds, route, name)
+            if self.profiler is not None:
+                self.profiler.end(trace, elapsed, status)
+
+
+def _frame_name(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SlowRequestProfiler:
+    """Profiler lấy mẫu: giữ stack (dạng folded của flame graph) của `slowest` request chậm nhất.
+
+    Một luồng nền chụp stack mỗi `interval` giây. Request đang chạy trên event loop được ghi stack
+    thật (thời gian CPU); request đang chờ (DB, pool luồng, batcher) được ghi chuỗi await đang treo,
+    kết thúc bằng "[await]", nên stack phản ánh thời gian thực (wall-clock) của request.
+    Phần chạy trong pool luồng không được gán vào request, chỉ thấy là đang chờ.
+    """
+
+    def __init__(self, slowest=10, interval=0.005):
+        self.slowest = slowest
+        self.interval = interval
+        self._active = {}
+        self._frames = {}
+        self._slow = []  # heap (thời gian, thứ tự, nhãn, stacks)
+        self._sequence = itertools.count()
+        self._loop_thread = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.ticks = 0
+
+    def start(self):
+        """Gọi từ luồng event loop (lifespan) để biết luồng nào cần lấy mẫu."""
+        if self._thread is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def begin(self, trace, frame):
+        import asyncio
+
+        trace.samples = collections.Counter()
+        trace.task = asyncio.current_task()
+        trace.frame = frame
+        self._active[id(trace)] = trace
+        self._frames[frame] = trace
+
+    def end(self, trace, elapsed, status):
+        self._active.pop(id(trace), None)
+        self._frames.pop(trace.frame, None)
+        if not trace.samples:
+            return
+        entry = (elapsed, next(self._sequence), f"{trace.method} {trace.path} {status} {elapsed * 1000:.0f}ms",
+                 dict(trace.samples))
+        if len(self._slow) < self.slowest:
+            heapq.heappush(self._slow, entry)
+        elif elapsed > self._slow[0][0]:
+            heapq.heapreplace(self._slow, entry)
+
+    def _sample_running(self):
+        """Stack đang chạy trên event loop, tính từ frame của middleware; trả về (trace, stack)."""
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = []
+        while frame is not None:
+            trace = self._frames.get(frame)
+            if trace is not None:
+                return trace, stack
+            stack.append(_frame_name(frame.f_code))
+            frame = frame.f_back
+        return None, None
+
+    @staticmethod
+    def _awaiting_stack(trace):
+        """Chuỗi coroutine đang treo của request, từ middleware tới chỗ đang await."""
+        stack = []
+        awaitable = trace.task.get_coro() if trace.task is not None else None
+        recording = False
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+            if frame is None:
+                break
+            recording = recording or frame is trace.frame
+            if recording:
+                stack.append(_frame_name(frame.f_code))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+        return stack + ["[await]"] if recording else None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            running, stack = self._sample_running()
+            if running is not None:
+                running.samples[";".join(reversed(stack)) or "[middleware]"] += 1
+            for trace in list(self._active.values()):
+                if trace is running:
+                    continue
+                awaiting = self._awaiting_stack(trace)
+                if awaiting:
+                    trace.samples[";".join(awaiting[1:]) or "[await]"] += 1
+
+    def folded(self):
+        """Stack dạng folded (flamegraph.pl, speedscope): "nhãn request;hàm;...;hàm số_mẫu"."""
+        lines = []
+        for elapsed, _, label, samples in sorted(self._slow, reverse=True):
+            for stack, count in sorted(samples.items()):
+                lines.append(f"{label};{stack} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
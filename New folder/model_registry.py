@@ -0,0 +1,386 @@
+"""Kho mô hình có phiên bản: nạp lại nóng và chấm điểm song song (shadow) mô hình ứng viên.
+
+Cấu trúc thư mục (mặc định model/registry):
+
+    <tên mô hình>/<phiên bản>/manifest.json   tên, phiên bản, đặc trưng, chỉ số, sha256 từng tệp
+    <tên mô hình>/<phiên bản>/model.joblib    mô hình sklearn
+    <tên mô hình>/<phiên bản>/flat.joblib     FlatForest (nạp bằng mmap)
+    <tên mô hình>/CURRENT                     phiên bản đang phục vụ
+    <tên mô hình>/CANDIDATE                   (tùy chọn) phiên bản được chấm điểm shadow
+
+Thư mục phiên bản được ghi dưới tên tạm rồi đổi tên, các tệp con trỏ được thay bằng
+os.replace, nên server không bao giờ thấy phiên bản ghi dở. Bảng tra cứu và bản nén trong model/
+(build_lookup_table.py, compress_forest.py --save) được dùng thay flat.joblib khi chúng được dựng
+từ đúng model.joblib của phiên bản (so sha256).
+Chạy: python model_registry.py list | promote <tên> <phiên bản> | candidate <tên> [phiên bản]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from lookup_table import file_sha256
+from metrics import Histogram
+from tree_engine import FlatForest
+
+logger = logging.getLogger(__name__)
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "model/registry")
+MANIFEST = "manifest.json"
+POINTERS = ("CURRENT", "CANDIDATE")
+
+
+def read_pointer(root, name, pointer):
+    try:
+        with open(os.path.join(root, name, pointer), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(root, name, pointer, version):
+    """Đặt CURRENT/CANDIDATE; version = None xóa con trỏ."""
+    path = os.path.join(root, name, pointer)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if not os.path.exists(os.path.join(root, name, version, MANIFEST)):
+        raise FileNotFoundError(f"Không có phiên bản {name}/{version}")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_manifest(root, name, version):
+    with open(os.path.join(root, name, version, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_versions(root, name):
+    directory = os.path.join(root, name)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(v for v in os.listdir(directory) if os.path.exists(os.path.join(directory, v, MANIFEST)))
+
+
+def publish(name, model, flat_model, features, metrics, root=MODEL_REGISTRY_DIR, pointer="CURRENT", compressed=None):
+    """Ghi một phiên bản mới và trỏ CURRENT (hoặc CANDIDATE) tới nó; trả về tên phiên bản.
+
+    compressed: thông tin nén (compress_forest.py) khi flat_model là bản nén chứ không giống hệt model.
+    """
+    import joblib  # nhập khi cần để app khởi động nhanh
+    os.makedirs(os.path.join(root, name), exist_ok=True)
+    version = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    suffix = 1
+    while os.path.exists(os.path.join(root, name, version)):
+        suffix += 1
+        version = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{suffix}"
+    tmp_dir = os.path.join(root, name, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+    joblib.dump(model, os.path.join(tmp_dir, "model.joblib"))
+    flat_model.save(os.path.join(tmp_dir, "flat.joblib"))
+    manifest = {
+        "name": name,
+        "version": version,
+        "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "features": list(features),
+        "metrics": {key: float(value) for key, value in metrics.items()},
+        "files": {
+            key: {"path": filename, "sha256": file_sha256(os.path.join(tmp_dir, filename))}
+            for key, filename in (("model", "model.joblib"), ("flat", "flat.joblib"))
+        },
+    }
+    if compressed is not None:
+        manifest["compressed"] = compressed
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp_dir, os.path.join(root, name, version))
+    if pointer:
+        write_pointer(root, name, pointer, version)
+    return version
+
+
+def load_version(root, name, version, mmap_mode="r", derived=None):
+    """Kiểm tra checksum rồi nạp một phiên bản; trả về (manifest, mô hình có .predict, tệp dẫn xuất).
+
+    derived(name, sha256 của model.joblib) trả về (mô hình, tệp dẫn xuất) khi có dạng nhanh hơn dựng
+    từ đúng mô hình này (bảng tra cứu, bản nén trong model/), tệp dẫn xuất None nếu dạng đó cho kết
+    quả giống hệt; trả về None thì dùng flat.joblib của phiên bản như thường.
+    """
+    manifest = read_manifest(root, name, version)
+    directory = os.path.join(root, name, version)
+    for key, entry in manifest["files"].items():
+        if file_sha256(os.path.join(directory, entry["path"])) != entry["sha256"]:
+            raise ValueError(f"Checksum của {name}/{version}/{entry['path']} không khớp")
+    files = manifest["files"]
+    if derived is not None and "model" in files and "compressed" not in manifest:
+        found = derived(name, files["model"]["sha256"])
+        if found is not None:
+            return (manifest, *found)
+    if "flat" in files:
+        model = FlatForest.load(os.path.join(directory, files["flat"]["path"]), mmap_mode=mmap_mode)
+    else:
+        import joblib
+        model = FlatForest.from_sklearn(joblib.load(os.path.join(directory, files["model"]["path"])))
+    return manifest, model, None
+
+
+class ModelRegistry:
+    """Các mô hình đang phục vụ, tra cứu như một dict chỉ đọc: models[name].predict(X).
+
+    Bảng mô hình là dict không bao giờ bị sửa tại chỗ; phiên bản mới được nạp, kiểm tra
+    và làm nóng trên luồng theo dõi rồi thay bằng một phép gán, nên request đang chạy
+    vẫn dùng trọn phiên bản cũ và không request nào phải chờ nạp mô hình.
+    """
+
+    def __init__(self, root=MODEL_REGISTRY_DIR, features=None, warmup_rows=None, poll_interval=5.0,
+                 shadow_fraction=0.1, shadow_max_pending=4, mmap_mode="r", derived=None):
+        self.root = root
+        self.features = list(features) if features is not None else None
+        self.warmup_rows = warmup_rows
+        self.poll_interval = poll_interval
+        self.shadow_fraction = shadow_fraction
+        self.shadow_max_pending = shadow_max_pending
+        self.mmap_mode = mmap_mode
+        self.derived = derived
+        self._active = {}       # tên -> (mô hình, thông tin phiên bản)
+        self._candidates = {}   # tên -> (mô hình, thông tin phiên bản)
+        self._failed = set()    # (tên, phiên bản) nạp lỗi; thư mục phiên bản không đổi nên không thử lại
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_pending = 0
+        self._shadow_lock = threading.Lock()
+        self.load_errors = 0
+        self.swaps = 0
+        self.shadow = {}
+
+    # Truy cập kiểu dict cho các hàm dự đoán
+    def __getitem__(self, name):
+        return self._active[name][0]
+
+    def get(self, name, default=None):
+        entry = self._active.get(name)
+        return entry[0] if entry is not None else default
+
+    def __contains__(self, name):
+        return name in self._active
+
+    def __iter__(self):
+        return iter(list(self._active))
+
+    def __len__(self):
+        return len(self._active)
+
+    def set_fallback(self, name, model, source):
+        """Dùng mô hình nạp ngoài kho (tệp cũ trong model/) khi kho chưa có phiên bản nào."""
+        if name not in self._active:
+            # Không có số phiên bản: nhận diện theo tệp nguồn và thời điểm sửa của nó
+            fingerprint = f"{source}@{os.path.getmtime(source):.0f}" if os.path.exists(source) else source
+            self._active = {**self._active, name: (model, {"version": None, "source": source,
+                                                          "fingerprint": fingerprint})}
+
+    def version_key(self, name):
+        """Định danh của mô hình name đang phục vụ; đổi mỗi khi mô hình được thay."""
+        info = self._active[name][1]
+        if info["version"] is None:
+            return info["fingerprint"]
+        # Bản nén dẫn xuất cho kết quả khác flat.joblib của phiên bản nên có định danh riêng
+        return f"{info['version']}+{info['artifact']}" if info.get("artifact") else info["version"]
+
+    def _prepare(self, name, version):
+        manifest, model, artifact = load_version(self.root, name, version, self.mmap_mode, self.derived)
+        if self.features is not None and manifest["features"] != self.features:
+            raise ValueError(f"{name}/{version} dùng đặc trưng {manifest['features']}, cần {self.features}")
+        if self.warmup_rows is not None:
+            # Làm nóng: chạm vào các trang mmap và kiểm tra kết quả trước khi nhận request
+            if not np.all(np.isfinite(model.predict(self.warmup_rows))):
+                raise ValueError(f"{name}/{version} trả về giá trị không hữu hạn khi làm nóng")
+        info = {
+            "version": version,
+            "source": os.path.join(self.root, name, version),
+            "artifact": artifact,
+            "metrics": manifest.get("metrics", {}),
+            "created_at": manifest.get("created_at"),
+            "loaded_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        return model, info
+
+    def _resolve(self, name, version, *loaded):
+        for entry in loaded:
+            if entry is not None and entry[1]["version"] == version:
+                return entry
+        try:
+            return self._prepare(name, version)
+        except Exception:
+            self._failed.add((name, version))
+            raise
+
+    def refresh(self):
+        """Nạp các phiên bản CURRENT/CANDIDATE mới; trả về danh sách (tên, phiên bản) vừa đổi."""
+        changed = []
+        if not os.path.isdir(self.root):
+            return changed
+        with self._refresh_lock:
+            for name in sorted(os.listdir(self.root)):
+                if not os.path.isdir(os.path.join(self.root, name)):
+                    continue
+                active, candidate = self._active.get(name), self._candidates.get(name)
+                current_version = read_pointer(self.root, name, "CURRENT")
+                candidate_version = read_pointer(self.root, name, "CANDIDATE")
+                if candidate_version == current_version:
+                    candidate_version = None
+                if (name, current_version) in self._failed:
+                    current_version = None
+                if (name, candidate_version) in self._failed:
+                    candidate_version = None
+                try:
+                    if current_version and (active is None or active[1]["version"] != current_version):
+                        entry = self._resolve(name, current_version, active, candidate)
+                        self._active = {**self._active, name: entry}
+                        self.swaps += 1
+                        changed.append((name, current_version))
+                        logger.info(f"Đã chuyển mô hình {name} sang phiên bản {current_version}")
+                    if candidate_version is None:
+                        if candidate is not None:
+                            self._candidates = {k: v for k, v in self._candidates.items() if k != name}
+                    elif candidate is None or candidate[1]["version"] != candidate_version:
+                        entry = self._resolve(name, candidate_version, candidate, self._active.get(name))
+                        self._candidates = {**self._candidates, name: entry}
+                        self.shadow[name] = self._new_shadow_stats(candidate_version)
+                        logger.info(f"Chấm điểm shadow {name} phiên bản {candidate_version} "
+                                    f"trên {self.shadow_fraction:.0%} lưu lượng")
+                except Exception as e:
+                    self.load_errors += 1
+                    logger.error(f"Không nạp được mô hình {name} từ kho: {e}")
+        return changed
+
+    def start(self):
+        if self._watcher is None and self.poll_interval > 0:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+        self._shadow_executor.shutdown(wait=True)
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.refresh()
+
+    # Chấm điểm shadow
+    def _new_shadow_stats(self, version):
+        return {
+            "version": version,
+            "batches": 0,
+            "rows": 0,
+            "skipped": 0,
+            "errors": 0,
+            "max_abs_diff": 0.0,
+            "sum_abs_diff": 0.0,
+            "abs_diff": Histogram([1, 10, 100, 500, 1000, 5000, 10000]),
+            "primary_latency": Histogram([0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1]),
+            "candidate_latency": Histogram([0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1]),
+        }
+
+    def maybe_shadow(self, name, features, predictions, primary_seconds):
+        """Gọi sau khi đã trả kết quả chính; chấm lại lô bằng ứng viên trên luồng riêng."""
+        candidate = self._candidates.get(name)
+        if candidate is None or random.random() >= self.shadow_fraction:
+            return
+        stats = self.shadow[name]
+        with self._shadow_lock:
+            if self._shadow_pending >= self.shadow_max_pending:
+                stats["skipped"] += 1
+                return
+            self._shadow_pending += 1
+        self._shadow_executor.submit(self._score_shadow, candidate[0], stats, features, predictions, primary_seconds)
+
+    def _score_shadow(self, model, stats, features, predictions, primary_seconds):
+        try:
+            start = time.perf_counter()
+            shadow_predictions = model.predict(features)
+            elapsed = time.perf_counter() - start
+            diffs = np.abs(np.asarray(shadow_predictions) - np.asarray(predictions))
+            with self._shadow_lock:
+                stats["batches"] += 1
+                stats["rows"] += len(diffs)
+                stats["sum_abs_diff"] += float(diffs.sum())
+                stats["max_abs_diff"] = max(stats["max_abs_diff"], float(diffs.max(initial=0)))
+            for diff in diffs:
+                stats["abs_diff"].observe(float(diff))
+            stats["primary_latency"].observe(primary_seconds)
+            stats["candidate_latency"].observe(elapsed)
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"Lỗi khi chấm điểm shadow phiên bản {stats['version']}: {e}")
+        finally:
+            with self._shadow_lock:
+                self._shadow_pending -= 1
+
+    def stats(self):
+        result = {}
+        for name, (_, info) in self._active.items():
+            entry = {"active": info}
+            candidate = self._candidates.get(name)
+            if candidate is not None:
+                shadow = self.shadow[name]
+                entry["candidate"] = candidate[1]
+                entry["shadow"] = {
+                    **{k: v for k, v in shadow.items() if not isinstance(v, Histogram)},
+                    "mean_abs_diff": shadow["sum_abs_diff"] / shadow["rows"] if shadow["rows"] else None,
+                    **{k: v.snapshot() for k, v in shadow.items() if isinstance(v, Histogram)},
+                }
+            result[name] = entry
+        return {
+            "root": self.root,
+            "swaps": self.swaps,
+            "load_errors": self.load_errors,
+            "shadow_fraction": self.shadow_fraction,
+            "models": result,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and promote versions in the model registry.")
+    parser.add_argument("--root", default=MODEL_REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list models, versions and pointers")
+    promote = commands.add_parser("promote", help="serve a version (running servers pick it up)")
+    promote.add_argument("name")
+    promote.add_argument("version")
+    candidate = commands.add_parser("candidate", help="shadow-score a version; omit version to clear")
+    candidate.add_argument("name")
+    candidate.add_argument("version", nargs="?")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        names = sorted(os.listdir(args.root)) if os.path.isdir(args.root) else []
+        for name in names:
+            pointers = {pointer: read_pointer(args.root, name, pointer) for pointer in POINTERS}
+            for version in list_versions(args.root, name):
+                manifest = read_manifest(args.root, name, version)
+                marks = ",".join(p for p, v in pointers.items() if v == version)
+                metrics = " ".join(f"{k}={v:.4f}" for k, v in manifest.get("metrics", {}).items())
+                print(f"{name:15s} {version:20s} {marks:18s} {metrics}")
+    elif args.command == "promote":
+        write_pointer(args.root, args.name, "CURRENT", args.version)
+        if read_pointer(args.root, args.name, "CANDIDATE") == args.version:
+            write_pointer(args.root, args.name, "CANDIDATE", None)
+        print(f"{args.name}: CURRENT -> {args.version}")
+    elif args.command == "candidate":
+        write_pointer(args.root, args.name, "CANDIDATE", args.version)
+        print(f"{args.name}: CANDIDATE -> {args.version or '(none)'}")
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", str(os.cpu_count() or 1)))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", str(4 * max(1, PASSWORD_POOL_SIZE))))
+
+logger = logging.getLogger(__name__)
+
+# Mỗi tiến trình giữ CryptContext riêng theo số vòng bcrypt
+_contexts = {}
+
+
+def _context(rounds):
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return _contexts[rounds]
+
+
+def hash_password(password, rounds):
+    return _context(rounds).hash(password)
+
+
+def _warm_up(rounds):
+    _context(rounds)
+
+
+def verify_and_update(password, hashed_password, rounds):
+    """Trả về (đúng mật khẩu, hash mới nếu cần băm lại với số vòng hiện tại hoặc None)."""
+    return _context(rounds).verify_and_update(password, hashed_password)
+
+
+class PasswordHasherBusy(Exception):
+    """Hàng đợi băm mật khẩu đã đầy, request nên được trả về 429."""
+
+
+class PasswordHasher:
+    """Chạy bcrypt trên pool tiến trình riêng để không chiếm CPU của event loop.
+
+    Tối đa workers + queue_limit thao tác được phép cùng lúc; vượt quá thì
+    PasswordHasherBusy được ném ra ngay. workers = 0 băm ngay trên luồng gọi.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_POOL_SIZE, queue_limit=PASSWORD_QUEUE_LIMIT):
+        self.rounds = rounds
+        self.workers = max(0, workers)
+        self.queue_limit = max(0, queue_limit)
+        self._executor = None
+        self._executor_pid = None
+        self._in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        """Tạo các tiến trình con ngay (gọi trong lifespan của mỗi tiến trình phục vụ).
+
+        Tiến trình con được tạo bằng "forkserver" ("spawn" nơi không có, như Windows) chứ không
+        fork thẳng từ server, nên không thừa hưởng luồng nào (luồng ghi log, pool CSDL...) hay khóa
+        mà các luồng đó đang giữ, dù start() chạy sau khi chúng đã chạy. Pool thừa hưởng qua
+        os.fork (worker của serve.py) không dùng được nên được tạo lại. Không tạo được pool
+        tiến trình thì băm trên pool luồng và ghi cảnh báo.
+        """
+        if self.workers == 0 or (self._executor is not None and self._executor_pid == os.getpid()):
+            return
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        try:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(start_method)
+            )
+            # Mỗi submit khi chưa có tiến trình rảnh tạo thêm một tiến trình con; không cần chờ làm nóng xong
+            for _ in range(self.workers):
+                self._executor.submit(_warm_up, self.rounds)
+        except (OSError, ValueError, NotImplementedError) as e:
+            logger.warning(f"Không tạo được pool tiến trình băm mật khẩu ({start_method}): {e}; "
+                           f"băm trên {self.workers} luồng thay thế")
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._executor_pid = os.getpid()
+
+    def _get_executor(self):
+        self.start()
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        if self.workers > 0 and self._in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self._in_flight += 1
+        try:
+            if self.workers == 0:
+                result = fn(*args)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._get_executor(), fn, *args)
+        except Exception:
+            # Hash hỏng/không nhận dạng được, tiến trình con chết...: không tính là hoàn thành
+            self.failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        self.completed += 1
+        return result
+
+    async def hash(self, password):
+        return await self._submit(hash_password, password, self.rounds)
+
+    async def verify_and_update(self, password, hashed_password):
+        return await self._submit(verify_and_update, password, hashed_password, self.rounds)
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def stats(self):
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+import numpy as np
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+PROFILE_COLUMNS = ('age', 'sex', 'height', 'weight', 'children', 'smoker', 'region')
+# Cùng khoảng BMI mà /predict chấp nhận
+BMI_MIN, BMI_MAX = 15, 50
+
+_STALE = "(pp.user_id IS NULL OR pp.model_version != ? OR pp.profile_revision != p.revision)"
+SELECT_STALE_PROFILES = f"""
+    SELECT p.user_id, p.revision, {', '.join('p.' + name for name in PROFILE_COLUMNS)}
+    FROM profiles p
+    LEFT JOIN profile_predictions pp ON pp.user_id = p.user_id AND pp.model = ?
+    WHERE p.user_id > ? AND {_STALE}
+    ORDER BY p.user_id
+    LIMIT ?
+"""
+SELECT_STALE_USERS = f"""
+    SELECT p.user_id, p.revision, {', '.join('p.' + name for name in PROFILE_COLUMNS)}
+    FROM profiles p
+    LEFT JOIN profile_predictions pp ON pp.user_id = p.user_id AND pp.model = ?
+    WHERE p.user_id IN (SELECT value FROM json_each(?)) AND {_STALE}
+"""
+UPSERT_PROFILE_PREDICTION = """
+    INSERT INTO profile_predictions (user_id, model, model_version, profile_revision, prediction, updated_at)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id, model) DO UPDATE SET
+        model_version = excluded.model_version,
+        profile_revision = excluded.profile_revision,
+        prediction = excluded.prediction,
+        updated_at = excluded.updated_at
+"""
+# Đọc của /predict/me: một lần tra theo khóa chính của cả hai bảng
+SELECT_PROFILE_PREDICTION = f"""
+    SELECT p.revision, {', '.join('p.' + name for name in PROFILE_COLUMNS)},
+           pp.profile_revision, pp.model_version, pp.prediction
+    FROM profiles p
+    LEFT JOIN profile_predictions pp ON pp.user_id = p.user_id AND pp.model = ?
+    WHERE p.user_id = ?
+"""
+
+
+def profile_features(rows):
+    """Ma trận đặc trưng (age, sex, bmi, children, smoker, region) từ các dòng PROFILE_COLUMNS.
+
+    Trả về (features, valid); valid False ở dòng có BMI ngoài khoảng /predict chấp nhận.
+    """
+    values = np.array(rows, dtype=np.float64).reshape(-1, len(PROFILE_COLUMNS))
+    age, sex, height, weight, children, smoker, region = values.T
+    bmi = weight / height ** 2
+    valid = (bmi >= BMI_MIN) & (bmi <= BMI_MAX)
+    return np.column_stack([age, sex, bmi, children, smoker, region]), valid
+
+
+class ProfileScorer:
+    """Chấm sẵn dự đoán của hồ sơ đã lưu cho mọi mô hình đang phục vụ (bảng profile_predictions).
+
+    Mỗi dòng kết quả ghi kèm revision của hồ sơ và phiên bản mô hình đã dùng; chỉ phần cũ được
+    chấm lại, ở nền theo lô batch_size: hồ sơ được notify() sau PUT /profile, và khi phiên bản một
+    mô hình đổi (kiểm tra mỗi poll_interval) thì quét các dòng chấm bằng phiên bản khác.
+    predict(name, features) là coroutine trả về dự đoán của cả ma trận.
+    """
+
+    def __init__(self, db, models, predict, batch_size=500, poll_interval=5.0):
+        self.db = db
+        self.models = models
+        self.predict = predict
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self._versions = {}   # mô hình -> phiên bản đã chấm xong toàn bộ hồ sơ
+        self._dirty = set()
+        self._wake = None
+        self._task = None
+        self.rescored = 0
+        self.batches = 0
+        self.errors = 0
+        self.batch_latency = Histogram([0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1])
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def notify(self, user_id):
+        """Hồ sơ của user_id có thể đã đổi: chấm lại ở lượt kế tiếp."""
+        self._dirty.add(user_id)
+        self.wake()
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            for name in list(self.models):
+                version = self.models.version_key(name)
+                if self._versions.get(name) == version:
+                    continue
+                try:
+                    await self._rescore_all(name, version)
+                    self._versions[name] = version
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Lỗi khi chấm lại hồ sơ cho mô hình {name} ({version}): {e}")
+            if self._dirty:
+                users, self._dirty = sorted(self._dirty), set()
+                try:
+                    await self._rescore_users(users)
+                except Exception as e:
+                    self.errors += 1
+                    self._dirty.update(users)
+                    logger.error(f"Lỗi khi chấm lại {len(users)} hồ sơ vừa cập nhật: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _rescore_all(self, name, version):
+        after = -1
+        while True:
+            rows = await self.db.fetchall(SELECT_STALE_PROFILES, (name, after, version, self.batch_size))
+            if not rows:
+                return
+            await self._score(name, version, rows)
+            after = rows[-1][0]
+
+    async def _rescore_users(self, users):
+        for start in range(0, len(users), self.batch_size):
+            chunk = str(users[start:start + self.batch_size])  # mảng JSON cho json_each
+            for name in list(self.models):
+                version = self.models.version_key(name)
+                rows = await self.db.fetchall(SELECT_STALE_USERS, (name, chunk, version))
+                if rows:
+                    await self._score(name, version, rows)
+
+    async def _score(self, name, version, rows):
+        start = time.perf_counter()
+        features, valid = profile_features([row[2:] for row in rows])
+        predictions = np.full(len(rows), np.nan)
+        if valid.any():
+            predictions[valid] = await self.predict(name, features[valid])
+        await self.db.executemany(UPSERT_PROFILE_PREDICTION, [
+            (row[0], name, version, row[1], float(prediction) if ok else None)
+            for row, prediction, ok in zip(rows, predictions, valid)
+        ])
+        self.rescored += len(rows)
+        self.batches += 1
+        self.batch_latency.observe(time.perf_counter() - start)
+
+    def stats(self):
+        return {
+            "batch_size": self.batch_size,
+            "pending_users": len(self._dirty),
+            "scored_versions": dict(self._versions),
+            "rescored": self.rescored,
+            "batches": self.batches,
+            "errors": self.errors,
+            "batch_latency": self.batch_latency.snapshot(),
+        }
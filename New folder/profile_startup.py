@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+# Đo trên máy 1 CPU (chế độ lazy): import app ~0.5s, byte đầu tiên ~0.7s, sẵn sàng ~0.75s với mô hình
+# phẳng (~2.8s khi chỉ có pickle). Ngưỡng có dư; --check và tests/test_startup.py báo lỗi nếu trung vị vượt
+TTFB_TARGET_SECONDS = 1.5
+READY_TARGET_SECONDS = 5.0
+FIRST_PREDICT_TARGET_SECONDS = 0.25
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_profile(env, top):
+    """Chạy `python -X importtime -c "import app"`; trả về (tổng giây, các import trực tiếp tốn nhất)."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            cwd=APP_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+    # Module con được in trước module cha: gom các dòng độ sâu 1 cho tới dòng "app"
+    children = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth == 1:
+            children.append((int(cumulative_us), name))
+        elif depth == 0:
+            if name == "app":
+                return int(cumulative_us) / 1e6, sorted(children, reverse=True)[:top]
+            children = []
+    raise RuntimeError("app not found in -X importtime output")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(url, body=None, headers=None, timeout=5):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def measure_startup(mode, env, timeout=60):
+    """Khởi động uvicorn; đo thời gian tới byte đầu tiên, tới /readyz và dự đoán đầu tiên."""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR, env=dict(env, STARTUP_MODE=mode), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        ttfb = ready = None
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                if ttfb is None:
+                    request(f"{base}/healthz", timeout=1)
+                    ttfb = time.perf_counter() - start
+                if request(f"{base}/readyz", timeout=1)[0] == 200:
+                    ready = time.perf_counter() - start
+                    break
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(0.005)
+        if ready is None:
+            raise RuntimeError(f"server not ready after {timeout}s")
+
+        credentials = {"email": "profile@example.com", "password": "Profile123"}
+        request(f"{base}/register", credentials)
+        token = request(f"{base}/login", credentials)[1]["access_token"]
+        body = {"age": 30, "sex": 0, "height": 1.7, "weight": 70, "children": 1,
+                "smoker": 0, "region": 2, "model": "random_forest"}
+        predict_start = time.perf_counter()
+        status, _ = request(f"{base}/predict", body, {"Authorization": f"Bearer {token}"})
+        first_predict = time.perf_counter() - predict_start
+        if status != 200:
+            raise RuntimeError(f"first /predict returned {status}")
+        return ttfb, ready, first_predict
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile app import time and measure time-to-first-byte.")
+    parser.add_argument('--runs', type=int, default=3, help="server starts per mode (median is reported)")
+    parser.add_argument('--modes', nargs='+', choices=['lazy', 'eager'], default=['lazy', 'eager'])
+    parser.add_argument('--top', type=int, default=12, help="number of imports to list")
+    parser.add_argument('--check', action='store_true',
+                        help="exit with status 1 if the lazy-mode medians exceed the targets")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_PATH=os.path.join(tmp, "profile.db"))
+        total, direct = import_profile(env, args.top)
+        print(f"import app: {total:.3f}s (cumulative); slowest direct imports:")
+        for cumulative, name in direct:
+            print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+
+        for mode in args.modes:
+            runs = [measure_startup(mode, env) for _ in range(args.runs)]
+            ttfb, ready, first_predict = (statistics.median(values) for values in zip(*runs))
+            print(f"{mode:5s}: first byte {ttfb:.3f}s, ready {ready:.3f}s, first /predict {first_predict * 1000:.1f} ms "
+                  f"(median of {args.runs})")
+            if args.check and mode == 'lazy':
+                for label, value, target in (
+                    ("time to first byte", ttfb, TTFB_TARGET_SECONDS),
+                    ("time to ready", ready, READY_TARGET_SECONDS),
+                    ("first /predict", first_predict, FIRST_PREDICT_TARGET_SECONDS),
+                ):
+                    if value > target:
+                        print(f"FAIL: {label} {value:.3f}s exceeds target {target:.3f}s")
+                        failed = True
+    if args.check:
+        print("Startup check failed." if failed else "Startup check passed.")
+    sys.exit(1 if failed else 0)
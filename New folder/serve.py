@@ -0,0 +1,141 @@
+"""Chạy app với nhiều worker (pre-fork) dùng chung mô hình đã ánh xạ bộ nhớ.
+
+Tiến trình cha tải app (và mô hình, qua mmap_mode='r') một lần, mở socket rồi fork
+các worker; mảng mô hình là trang chỉ đọc dùng chung nên thêm worker không nhân bản mô hình.
+Bộ nhớ (RSS/PSS) của từng worker được ghi log định kỳ và có trong /stats của worker đó.
+Chạy: python serve.py --workers 4 --port 8000
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("serve")
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app_module, sock, log_level):
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Pool băm mật khẩu được tạo trong lifespan của từng worker
+    # Luồng ghi log (LOG_MODE=async) của tiến trình cha không đi theo fork
+    app_module.log_pipeline.start()
+    config = uvicorn.Config(app_module.app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(app_module, sock, log_level):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app_module, sock, log_level)
+        except BaseException:
+            logger.exception("Worker dừng do lỗi")
+            code = 1
+        finally:
+            # Không chạy atexit/finalizer của tiến trình cha trong worker
+            os._exit(code)
+    return pid
+
+
+def format_mb(value):
+    return f"{value / 1e6:8.1f}" if value is not None else "       -"
+
+
+def report_memory(workers):
+    from metrics import process_memory
+
+    total_pss = 0
+    for pid in [os.getpid()] + sorted(workers):
+        memory = process_memory(pid)
+        role = "master" if pid == os.getpid() else "worker"
+        total_pss += memory.get("pss_bytes", 0)
+        logger.info(f"{role} {pid}: RSS {format_mb(memory.get('rss_bytes'))} MB, "
+                    f"PSS {format_mb(memory.get('pss_bytes'))} MB, "
+                    f"shared {format_mb(memory.get('shared_bytes'))} MB")
+    logger.info(f"Tổng PSS {total_pss / 1e6:.1f} MB cho {len(workers)} worker")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork multi-worker server for app.py.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--memory-report-interval", type=float, default=60,
+                        help="seconds between per-worker memory reports (0 disables)")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py cần os.fork (Linux/macOS); trên Windows hãy chạy python app.py.")
+
+    workers_count = max(1, args.workers)
+    # Chia CPU cho pool băm mật khẩu của từng worker thay vì mỗi worker một pool đủ số lõi
+    os.environ.setdefault("PASSWORD_POOL_SIZE", str(max(1, (os.cpu_count() or 1) // workers_count)))
+    os.environ.setdefault("MODEL_MMAP_MODE", "r")
+
+    import app as app_module
+
+    # Nạp mô hình một lần trước khi fork; lifespan của worker thấy mô hình đã có và chỉ còn làm nóng
+    app_module.init_db()
+    app_module.load_models()
+    # Không để worker thừa hưởng luồng hay kết nối SQLite của tiến trình cha
+    app_module.db.close()
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Khởi động {workers_count} worker tại http://{args.host}:{args.port}")
+    workers = {spawn_worker(app_module, sock, args.log_level) for _ in range(workers_count)}
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    next_report = time.monotonic() + min(5, args.memory_report_interval)
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if args.memory_report_interval > 0 and time.monotonic() >= next_report:
+                report_memory(workers)
+                next_report = time.monotonic() + args.memory_report_interval
+            time.sleep(0.5)
+            continue
+        if pid not in workers:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} thoát (mã {os.waitstatus_to_exitcode(status)}), khởi động lại")
+            time.sleep(1)
+            workers.add(spawn_worker(app_module, sock, args.log_level))
+    sock.close()
+    logger.info("Đã dừng mọi worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -533,13 +533,18 @@ if (predictionForm) {
   });
 }
 
-// History
-async function loadHistory() {
+// History: mỗi lần tải một trang; header X-Next-Cursor cho biết còn trang sau
+async function loadHistory(cursor = null) {
   const { authenticated } = await checkAuthStatus();
   if (!authenticated) return;
   clearMessages();
+  const loadMoreButton = document.getElementById("history-load-more");
+  if (loadMoreButton) loadMoreButton.disabled = true;
   try {
-    const response = await fetch("/history", {
+    const url = cursor
+      ? `/history?cursor=${encodeURIComponent(cursor)}`
+      : "/history";
+    const response = await fetch(url, {
       method: "GET",
       headers: {
         Authorization: `Bearer ${getToken()}`,
@@ -556,10 +561,15 @@ async function loadHistory() {
       }
       throw new Error(result.detail || "Lỗi lấy lịch sử");
     }
+    const nextCursor = response.headers.get("X-Next-Cursor");
+    if (loadMoreButton) {
+      loadMoreButton.dataset.cursor = nextCursor || "";
+      loadMoreButton.style.display = nextCursor ? "block" : "none";
+    }
     const historyTableBody = document.getElementById("history-table-body");
     if (historyTableBody) {
-      historyTableBody.innerHTML = "";
-      if (result.length === 0) {
+      if (!cursor) historyTableBody.innerHTML = "";
+      if (result.length === 0 && !cursor) {
         historyTableBody.innerHTML =
           '<tr><td colspan="3" class="text-center">Chưa có lịch sử dự đoán nào.</td></tr>';
         return;
@@ -591,9 +601,20 @@ async function loadHistory() {
   } catch (error) {
     showError(`Lỗi: ${error.message}`);
     console.error("Load history error:", error);
+  } finally {
+    if (loadMoreButton) loadMoreButton.disabled = false;
   }
 }
 
+const historyLoadMore = document.getElementById("history-load-more");
+if (historyLoadMore) {
+  historyLoadMore.addEventListener("click", async function () {
+    if (historyLoadMore.dataset.cursor) {
+      await loadHistory(historyLoadMore.dataset.cursor);
+    }
+  });
+}
+
 // Navigation
 document.addEventListener("DOMContentLoaded", async function () {
   await updateNavbar();
@@ -0,0 +1,196 @@
+"""Tệp tĩnh có dấu vân tay nội dung, nén sẵn và phục vụ từ bộ nhớ.
+
+Khi khởi động, build_assets() đọc mọi tệp dưới static/, gắn 12 ký tự sha256 vào tên
+(css/style.css -> css/style.3f2a9c1b7d4e.css), nén sẵn gzip và brotli (nếu cài gói brotli) và
+giữ tất cả trong một dict. Template lấy đường dẫn qua static_url() nên mỗi lần nội dung đổi thì
+URL đổi theo; URL có dấu vân tay được cache một năm (immutable), tên gốc vẫn phục vụ được nhưng
+trình duyệt phải kiểm tra lại bằng ETag. Không có thao tác stat/đọc đĩa nào theo từng request.
+Ghi ra đĩa (cho nginx/CDN): python static_assets.py --out build/static
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+from starlette.exceptions import HTTPException
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn; thiếu thì chỉ phục vụ gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+# Tệp nhỏ hơn ngưỡng này hoặc đã nén sẵn (ảnh, font woff2) thì không nén
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+class Asset:
+    """Một tệp tĩnh trong bộ nhớ với các biến thể mã hóa {'identity'|'gzip'|'br': bytes}."""
+
+    __slots__ = ("path", "url", "content_type", "digest", "bodies")
+
+    def __init__(self, path, url, content_type, digest, bodies):
+        self.path = path
+        self.url = url
+        self.content_type = content_type
+        self.digest = digest
+        self.bodies = bodies
+
+    def etag(self, encoding):
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def fingerprinted_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def compress(body, content_type):
+    """Các biến thể nén sẵn đáng giữ (nhỏ hơn bản gốc)."""
+    bodies = {"identity": body}
+    if len(body) < MIN_COMPRESS_BYTES or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return bodies
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    for encoding, compressed in variants.items():
+        if len(compressed) < len(body):
+            bodies[encoding] = compressed
+    return bodies
+
+
+def make_asset(path, body):
+    """Asset từ nội dung trong bộ nhớ; kiểu nội dung đoán theo phần mở rộng của path."""
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type == "application/javascript":
+        content_type += "; charset=utf-8"
+    digest = hashlib.sha256(body).hexdigest()
+    return Asset(path, fingerprinted_name(path, digest), content_type, digest, compress(body, content_type))
+
+
+def build_assets(directory):
+    """Đọc và nén mọi tệp dưới directory; trả về {đường dẫn tương đối: Asset} (khóa dùng '/')."""
+    assets = {}
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            path = os.path.relpath(full_path, directory).replace(os.sep, "/")
+            with open(full_path, "rb") as f:
+                assets[path] = make_asset(path, f.read())
+    return assets
+
+
+def parse_accept_encoding(header):
+    """Tập mã hóa được chấp nhận (bỏ các mục q=0)."""
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def asset_response(asset, cache_control, accept_encoding="", if_none_match=None):
+    """(status, headers, body) cho một Asset: chọn br rồi gzip theo Accept-Encoding, 304 nếu ETag khớp."""
+    accepted = parse_accept_encoding(accept_encoding)
+    encoding = next((name for name in ("br", "gzip") if name in asset.bodies and name in accepted), "identity")
+    etag = asset.etag(encoding)
+    headers = [
+        (b"cache-control", cache_control.encode()),
+        (b"etag", etag.encode()),
+        (b"vary", b"Accept-Encoding"),
+    ]
+    if if_none_match is not None and (if_none_match.strip() == "*" or etag in
+                                      [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return 304, headers, b""
+    body = asset.bodies[encoding]
+    headers += [
+        (b"content-type", asset.content_type.encode()),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if encoding != "identity":
+        headers.append((b"content-encoding", encoding.encode()))
+    return 200, headers, body
+
+
+class StaticAssets:
+    """App ASGI phục vụ tệp tĩnh từ build_assets(), gắn tại /static.
+
+    Mỗi tệp trả được theo cả tên có dấu vân tay (cache immutable một năm) lẫn tên gốc (no-cache,
+    kiểm tra lại bằng ETag). Chọn br rồi gzip theo Accept-Encoding; If-None-Match khớp thì trả 304.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = build_assets(directory)
+        self.routes = {}
+        for asset in self.assets.values():
+            self.routes["/" + asset.path] = (asset, REVALIDATE_CACHE)
+            self.routes["/" + asset.url] = (asset, IMMUTABLE_CACHE)
+        logger.info("Đã nạp %d tệp tĩnh vào bộ nhớ (%d byte, brotli: %s)", len(self.assets),
+                    sum(len(asset.bodies["identity"]) for asset in self.assets.values()),
+                    "có" if brotli is not None else "không")
+
+    def url(self, path):
+        """Đường dẫn công khai có dấu vân tay của một tệp dưới static/, ví dụ static_url('css/style.css')."""
+        return "/static/" + self.assets[path].url
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        route = self.routes.get(path)
+        if route is None:
+            logger.warning("Tệp tĩnh không tồn tại: %s", scope["path"])
+            raise HTTPException(status_code=404)
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405, headers={"Allow": "GET, HEAD"})
+        asset, cache_control = route
+        headers = {}
+        for name, value in scope["headers"]:
+            if name in (b"accept-encoding", b"if-none-match"):
+                headers[name] = value.decode("latin-1")
+        status, response_headers, body = asset_response(
+            asset, cache_control, headers.get(b"accept-encoding", ""), headers.get(b"if-none-match"))
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+
+def write_assets(assets, out_dir):
+    """Ghi các tệp có dấu vân tay (kèm .gz/.br) và manifest.json ra out_dir."""
+    suffixes = {"identity": "", "gzip": ".gz", "br": ".br"}
+    for asset in assets.values():
+        target = os.path.join(out_dir, *asset.url.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        for encoding, body in asset.bodies.items():
+            with open(target + suffixes[encoding], "wb") as f:
+                f.write(body)
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({path: asset.url for path, asset in assets.items()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the files under static/.")
+    parser.add_argument("--static-dir", default="static")
+    parser.add_argument("--out", help="also write fingerprinted files, .gz/.br variants and manifest.json here")
+    args = parser.parse_args()
+
+    assets = build_assets(args.static_dir)
+    for path, asset in assets.items():
+        sizes = "  ".join(f"{encoding} {len(body):>7}" for encoding, body in asset.bodies.items())
+        print(f"{path:<24} -> {asset.url:<36} {sizes}")
+    if brotli is None:
+        print("brotli not installed: only gzip variants were built (pip install brotli)")
+    if args.out:
+        write_assets(assets, args.out)
+        print(f"Wrote {len(assets)} assets and manifest.json to {args.out}")
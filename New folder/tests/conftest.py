@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(APP_DIR, 'data', 'insurance.csv')
+sys.path.insert(0, APP_DIR)
+# CSDL tạm cho cả phiên test; phải đặt trước khi db.py được import
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="app-tests-"), "test.db"))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """Module app với cả hai tên mô hình phục vụ bằng cây quyết định có sẵn trong model/."""
+    os.chdir(APP_DIR)
+    import app
+    model, source = app.load_model('decision_tree')
+    for name in app.MODEL_FILES:
+        app.models.set_fallback(name, model, source)
+    app.startup_state["load_seconds"] = 0.0
+    return app
+
+
+@pytest.fixture(scope="session")
+def client(app_module):
+    from fastapi.testclient import TestClient
+    with TestClient(app_module.app) as test_client:
+        yield test_client
+
+
+def register_and_login(client, email):
+    credentials = {"email": email, "password": "Passw0rd1"}
+    assert client.post("/register", json=credentials).status_code == 200
+    token = client.post("/login", json=credentials).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Header Authorization của một người dùng mới."""
+    return register_and_login(client, f"user-{uuid.uuid4().hex[:12]}@example.com")
+
+
+@pytest.fixture
+def admin_headers(app_module, client, monkeypatch):
+    """Header Authorization của một người dùng mới có email trong ADMIN_EMAILS."""
+    email = f"admin-{uuid.uuid4().hex[:12]}@example.com"
+    monkeypatch.setattr(app_module, "ADMIN_EMAILS", {email})
+    return register_and_login(client, email)
+
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", help="chạy cả các test chậm (đánh dấu slow)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: test chậm (benchmark so với baseline), chỉ chạy với --run-slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="test chậm, chạy với --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
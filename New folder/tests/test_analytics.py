@@ -0,0 +1,15 @@
+def test_normal_user_cannot_read_global_analytics(client, auth_headers):
+    response = client.get("/analytics/predictions", headers=auth_headers)
+
+    assert response.status_code == 403
+
+
+def test_admin_reads_analytics(client, admin_headers):
+    response = client.get("/analytics/predictions?group_by=model,region", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json()["group_by"] == ["model", "region"]
+
+
+def test_analytics_requires_login(client):
+    assert client.get("/analytics/predictions").status_code == 401
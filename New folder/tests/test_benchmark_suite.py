@@ -0,0 +1,50 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+from conftest import APP_DIR
+
+SUITE_PATH = os.path.join(APP_DIR, 'benchmarks', 'suite.py')
+# Máy ảo dùng chung CPU: p99 dao động tới ~2 lần giữa các lần chạy, nên chỉ bắt hồi quy lớn
+BENCHMARK_THRESHOLD = os.getenv("BENCHMARK_THRESHOLD", "1.5")
+
+
+def load_suite():
+    spec = importlib.util.spec_from_file_location("benchmark_suite", SUITE_PATH)
+    suite = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(suite)
+    return suite
+
+
+def test_compare_scales_baseline_by_machine_speed():
+    suite = load_suite()
+    baseline = {"meta": {"calibration_us": 100.0},
+                "micro": {"predict": {"p50_us": 10.0}},
+                "load": {"predict": {"rps": 100.0, "p99_ms": 10.0}}}
+    # Máy chậm gấp đôi: độ trễ gấp đôi, thông lượng một nửa là bình thường
+    slower_machine = {"meta": {"calibration_us": 200.0},
+                      "micro": {"predict": {"p50_us": 19.0}},
+                      "load": {"predict": {"rps": 45.0, "p99_ms": 22.0}}}
+    assert suite.compare(slower_machine, baseline, 0.5) == []
+
+    regressed = {**slower_machine, "micro": {"predict": {"p50_us": 40.0}}, "load": {"predict": {"rps": 20.0, "p99_ms": 22.0}}}
+    names = [name for name, *_ in suite.compare(regressed, baseline, 0.5)]
+    assert names == ["micro.predict.p50_us", "load.predict.rps"]
+
+
+@pytest.mark.slow
+def test_suite_has_no_regressions_against_baseline():
+    """Chạy benchmarks/suite.py --compare với baseline đã lưu (python -m pytest --run-slow)."""
+    missing = [name for name in ('random_forest_model.pkl', 'decision_tree_model.pkl')
+               if not os.path.exists(os.path.join(APP_DIR, 'model', name))]
+    if missing:
+        pytest.skip(f"thiếu mô hình: {', '.join(missing)} (chạy train_*.py trước)")
+    result = subprocess.run(
+        [sys.executable, SUITE_PATH, '--micro-seconds', '0.5', '--login-requests', '20',
+         '--scenarios', 'predict', 'history', 'login', '--compare', '--threshold', BENCHMARK_THRESHOLD],
+        cwd=APP_DIR, capture_output=True, text=True, timeout=900,
+    )
+    report = "\n".join(line for line in result.stdout.splitlines() if line.startswith(("  ", "FAIL", "No ")))
+    assert result.returncode == 0, report or result.stderr[-2000:]
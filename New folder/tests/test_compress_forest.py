@@ -0,0 +1,25 @@
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from conftest import DATA_PATH
+from compress_forest import MIN_DEPTH, MIN_TREES, compress, out_of_bag_mask
+from training import load_dataset, split_dataset
+from tree_engine import FlatForest
+
+
+def test_compressed_forest_keeps_minimum_size_and_test_budget(tmp_path):
+    X, y = load_dataset(DATA_PATH, cache_dir=str(tmp_path / 'cache'))
+    X_train, X_test, y_train, y_test = (part.to_numpy(np.float64) for part in split_dataset(X, y))
+    model = RandomForestRegressor(n_estimators=40, random_state=0, n_jobs=1).fit(X_train, y_train)
+    base = FlatForest.from_sklearn(model)
+
+    base_rmse, limit, variants = compress(base, X_test, y_test, 5.0, X_train, y_train,
+                                          out_of_bag_mask(model, len(X_train)))
+
+    assert variants
+    for _, forest, info in variants:
+        assert forest.n_trees >= MIN_TREES
+        assert info["max_depth"] is None or info["max_depth"] >= MIN_DEPTH
+        assert forest.max_depth >= min(MIN_DEPTH, base.max_depth)
+        # Ngân sách đo trên toàn bộ tập test, cùng các dòng với mô hình gốc
+        assert info["test_rmse"] <= limit
+        assert np.sqrt(np.mean((forest.predict(X_test) - y_test) ** 2)) == info["test_rmse"]
@@ -0,0 +1,24 @@
+import asyncio
+
+from db import Database
+
+
+def test_calls_count_every_method_once(tmp_path):
+    db = Database(str(tmp_path / "calls.db"), pool_size=2)
+
+    async def scenario():
+        await db.execute("CREATE TABLE t (x INTEGER)")
+        await db.executemany("INSERT INTO t VALUES (?)", [(1,), (2,)])
+        await db.fetchone("SELECT x FROM t")
+        await db.fetchall("SELECT x FROM t")
+        await db.run(lambda conn: conn.execute("SELECT COUNT(*) FROM t").fetchone())
+        conn = await db.acquire()
+        try:
+            await db.run_on(conn, lambda conn: conn.execute("SELECT 1").fetchone())
+        finally:
+            db.release(conn)
+
+    asyncio.run(scenario())
+
+    assert db.stats()["calls"] == {"execute": 1, "executemany": 1, "fetchone": 1, "fetchall": 1,
+                                   "run": 1, "run_on": 1}
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from test_predict_batch import VALID_ROW
+
+
+def test_history_pages_follow_next_cursor(client, auth_headers):
+    """Trang lịch sử trả X-Next-Cursor cho tới trang cuối; nút "Tải thêm" trong script.js dựa vào header này."""
+    client.post("/predict/batch", json=[{**VALID_ROW, "age": age} for age in range(30, 35)], headers=auth_headers)
+
+    ages, cursor = [], None
+    for _ in range(5):
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/history", params=params, headers=auth_headers)
+        ages += [row["input_data"]["age"] for row in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert sorted(ages) == list(range(30, 35))
+    assert cursor is None
+
+
+def test_ndjson_stream_returns_connection_between_chunks(app_module, client, auth_headers, monkeypatch):
+    """Luồng NDJSON không giữ kết nối của pool trong lúc chờ client đọc nhóm tiếp theo."""
+    client.post("/predict/batch", json=[{**VALID_ROW, "age": age} for age in range(30, 37)], headers=auth_headers)
+    user_id = client.get("/me", headers=auth_headers).json()["id"]
+    monkeypatch.setattr(app_module, "HISTORY_STREAM_FETCH_SIZE", 3)
+    db = app_module.db
+
+    async def read(limit):
+        sql, params = app_module.history_query(user_id, None)
+        stream = app_module.stream_history(user_id, sql, params, limit)
+        chunks = []
+        async for chunk in stream:
+            # Client chưa đọc nhóm sau: mọi kết nối đã tạo đều đang rảnh trong pool
+            stats = db.stats()
+            assert stats["idle_connections"] == stats["connections"]
+            chunks.append(chunk)
+        return [json.loads(line)["input_data"]["age"] for chunk in chunks for line in chunk.splitlines()], len(chunks)
+
+    ages, n_chunks = asyncio.run(read(None))
+    assert ages == list(range(36, 29, -1)) and n_chunks == 3
+    ages, _ = asyncio.run(read(5))
+    assert ages == list(range(36, 31, -1))
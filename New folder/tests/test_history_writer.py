@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+
+import history_writer
+from analytics import init_rollups
+from db import Database
+from history_writer import PredictionWriter, prediction_record
+
+FEATURES = {"age": 40, "sex": 1, "height": 1.7, "weight": 70.0, "children": 2, "smoker": 0, "region": 1,
+            "model": "decision_tree"}
+
+
+class GatedDatabase(Database):
+    """Database mà mọi lần ghi chờ cổng mở, để giữ writer bận và làm đầy hàng đợi."""
+
+    def __init__(self, path):
+        super().__init__(path, pool_size=2)
+        self.gate = asyncio.Event()
+
+    async def run(self, fn, *args):
+        await self.gate.wait()
+        return await super().run(fn, *args)
+
+
+def create_schema(path):
+    db = Database(path, pool_size=1)
+    with db.connection() as conn:
+        conn.execute("""
+            CREATE TABLE predictions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, input_data JSON, prediction REAL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, age INTEGER, sex INTEGER, height REAL,
+                weight REAL, children INTEGER, smoker INTEGER, region INTEGER, model TEXT
+            )
+        """)
+        init_rollups(conn.cursor())
+        conn.commit()
+
+
+def count_predictions(path):
+    db = Database(path, pool_size=1)
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+def test_full_queue_spills_to_journal_and_replays(tmp_path):
+    path = str(tmp_path / "history.db")
+    journal = str(tmp_path / "journal.ndjson")
+    create_schema(path)
+
+    async def scenario():
+        db = GatedDatabase(path)
+        writer = PredictionWriter(db, max_queue_size=1, batch_size=1, flush_interval_ms=0,
+                                  put_timeout_ms=1, journal_path=journal)
+        for user_id in range(5):
+            await writer.submit(prediction_record(user_id, FEATURES, 1e8))
+        spilled = writer.spilled
+        with open(journal, encoding="utf-8") as f:
+            assert len(f.readlines()) == spilled
+        db.gate.set()
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert writer.spilled > 0 and writer.dropped == 0
+    assert writer.flushed + writer.replayed == 5
+    assert count_predictions(path) == 5
+    assert not os.path.exists(journal)
+
+
+def test_journal_rename_failure_keeps_writer_alive(tmp_path, monkeypatch):
+    path = str(tmp_path / "history.db")
+    journal = str(tmp_path / "journal.ndjson")
+    create_schema(path)
+    with open(journal, "w", encoding="utf-8") as f:
+        f.write(json.dumps(prediction_record(99, FEATURES, 1e8)) + "\n")
+    replace = os.replace
+    failures = []
+
+    def failing_replace(src, dst):
+        if not failures:
+            failures.append(src)
+            raise OSError("disk error")
+        return replace(src, dst)
+
+    monkeypatch.setattr(history_writer.os, "replace", failing_replace)
+
+    async def scenario():
+        writer = PredictionWriter(Database(path, pool_size=2), flush_interval_ms=0, journal_path=journal)
+        writer.start()
+        await writer.submit(prediction_record(1, FEATURES, 1e8))
+        await asyncio.sleep(0.2)
+        assert not writer._task.done()
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert failures == [journal]
+    assert (writer.flushed, writer.replayed) == (1, 1)
+    assert count_predictions(path) == 2
+
+
+def test_dead_writer_task_is_restarted(tmp_path):
+    path = str(tmp_path / "history.db")
+    create_schema(path)
+
+    async def scenario():
+        writer = PredictionWriter(Database(path, pool_size=2), flush_interval_ms=0)
+        flush = writer._flush
+        calls = []
+
+        async def crash_once(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            await flush(batch)
+
+        writer._flush = crash_once
+        await writer.submit(prediction_record(1, FEATURES, 1e8))
+        await asyncio.sleep(0.05)
+        assert writer._task.done()
+        await writer.submit(prediction_record(2, FEATURES, 1e8))
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert writer.restarts == 1
+    assert writer.flushed == 1
+    assert count_predictions(path) == 1
+
+
+def test_truncated_journal_line_is_skipped(tmp_path):
+    path = str(tmp_path / "history.db")
+    journal = str(tmp_path / "journal.ndjson")
+    create_schema(path)
+    lines = [json.dumps(prediction_record(user_id, FEATURES, 1e8)) + "\n" for user_id in range(3)]
+    with open(journal, "w", encoding="utf-8") as f:
+        f.write(lines[0] + lines[1] + lines[2][:25])  # tiến trình chết giữa lúc ghi dòng cuối
+
+    async def scenario():
+        writer = PredictionWriter(Database(path, pool_size=2), journal_path=journal)
+        writer.start()
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert writer.replayed == 2
+    assert count_predictions(path) == 2
+    assert not os.path.exists(journal + ".replay")
+    with open(journal + ".bad", encoding="utf-8") as f:
+        assert f.read() == lines[2][:25] + "\n"
+
+
+def test_journal_replayed_before_a_crash_is_not_inserted_twice(tmp_path, monkeypatch):
+    path = str(tmp_path / "history.db")
+    journal = str(tmp_path / "journal.ndjson")
+    create_schema(path)
+    with open(journal, "w", encoding="utf-8") as f:
+        for user_id in range(3):
+            f.write(json.dumps(prediction_record(user_id, FEATURES, 1e8)) + "\n")
+    remove = os.remove
+
+    def crash_before_remove(target):
+        raise OSError("crashed after commit")
+
+    async def start_and_stop():
+        writer = PredictionWriter(Database(path, pool_size=2), journal_path=journal)
+        writer.start()
+        await writer.stop()
+        return writer
+
+    # Lần khởi động đầu: commit xong nhưng không xóa được tệp replay
+    monkeypatch.setattr(history_writer.os, "remove", crash_before_remove)
+    asyncio.run(start_and_stop())
+    assert os.path.exists(journal + ".replay")
+    assert count_predictions(path) == 3
+
+    monkeypatch.setattr(history_writer.os, "remove", remove)
+    writer = asyncio.run(start_and_stop())
+
+    assert writer.replayed == 0
+    assert count_predictions(path) == 3
+    assert not os.path.exists(journal + ".replay")
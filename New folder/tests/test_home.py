@@ -0,0 +1,27 @@
+import re
+
+
+def test_repeated_home_request_returns_304(client):
+    first = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["etag"]})
+
+    assert first.status_code == 200 and first.headers["cache-control"] == "public, no-cache"
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == first.headers["etag"]
+
+
+def test_home_page_is_the_same_for_every_user(client, auth_headers):
+    email = client.get("/me", headers=auth_headers).json()["email"]
+
+    anonymous = client.get("/")
+    signed_in = client.get("/", headers=auth_headers)
+
+    assert signed_in.content == anonymous.content
+    assert signed_in.headers["etag"] == anonymous.headers["etag"]
+    assert email not in signed_in.text
+    # Menu mặc định là của khách; script.js đổi menu sau khi gọi /me
+    assert 'id="login-link"' in signed_in.text and 'id="logout-link"' not in signed_in.text
+    script = client.get(re.search(r'src="([^"]*script[^"]*\.js)"', signed_in.text).group(1)).text
+    assert 'fetch("/me"' in script
@@ -0,0 +1,50 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeRegressor
+
+from build_lookup_table import sklearn_predict
+from conftest import APP_DIR, DATA_PATH
+from lookup_table import LookupTable, bmi_thresholds, build_table, iter_grid_rows
+from training import load_dataset
+from tree_engine import FlatForest
+
+
+def boundary_bmis(thresholds):
+    """BMI đúng tại, ngay trên và ngay dưới mỗi ngưỡng (float32), cùng hai đầu khoảng /predict chấp nhận."""
+    at = thresholds.astype(np.float32)
+    return np.concatenate([at, np.nextafter(at, np.float32(np.inf)), np.nextafter(at, np.float32(-np.inf)),
+                           np.float32([15, 50])])
+
+
+def assert_matches_model(lut, model, bmis):
+    predict = sklearn_predict(model)
+    for age, X in iter_grid_rows(bmis):
+        assert np.array_equal(lut.predict(X), predict(X)), f"age={age}"
+
+
+@pytest.fixture(scope="module")
+def decision_tree():
+    return joblib.load(f"{APP_DIR}/model/decision_tree_model.pkl")
+
+
+def test_lookup_matches_decision_tree_over_grid(decision_tree):
+    thresholds = bmi_thresholds(FlatForest.from_sklearn(decision_tree))
+    lut = LookupTable(build_table(sklearn_predict(decision_tree), thresholds), thresholds)
+
+    assert len(thresholds) > 0
+    assert_matches_model(lut, decision_tree, boundary_bmis(thresholds))
+    assert_matches_model(lut, decision_tree, np.linspace(15, 50, 36, dtype=np.float32))
+
+
+def test_lookup_without_bmi_splits_uses_single_bucket(tmp_path):
+    X, y = load_dataset(DATA_PATH, cache_dir=str(tmp_path / "cache"))
+    model = DecisionTreeRegressor(max_depth=6, random_state=0).fit(X.assign(bmi=30.0), y)
+    thresholds = bmi_thresholds(FlatForest.from_sklearn(model))
+
+    table = build_table(sklearn_predict(model), thresholds)
+    lut = LookupTable(table, thresholds)
+
+    assert len(thresholds) == 0
+    assert table.shape[-1] == 1
+    assert_matches_model(lut, model, np.float32([15, 22.5, 30, 49.9, 50]))
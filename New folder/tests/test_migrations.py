@@ -0,0 +1,37 @@
+import json
+import sqlite3
+
+ROW = {"age": 40, "sex": 1, "height": 1.7, "weight": 70.0, "children": 2, "smoker": 0, "region": 1,
+       "model": "decision_tree"}
+
+
+def legacy_database():
+    """CSDL kiểu cũ: đầu vào chỉ nằm trong cột JSON input_data."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, input_data JSON, prediction REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany("INSERT INTO predictions (user_id, input_data, prediction) VALUES (?, ?, ?)",
+                     [(1, json.dumps({**ROW, "age": age}), 1e8) for age in (30, 40, 50)])
+    return conn
+
+
+def test_migration_keeps_input_json(app_module):
+    conn = legacy_database()
+    app_module.migrate_predictions(conn.cursor())
+    app_module.migrate_predictions(conn.cursor())
+
+    rows = conn.execute("SELECT input_data, age, model FROM predictions ORDER BY id").fetchall()
+    assert [(json.loads(data)["age"], age, model) for data, age, model in rows] == [
+        (30, 30, "decision_tree"), (40, 40, "decision_tree"), (50, 50, "decision_tree")]
+
+
+def test_migration_drops_input_json_only_when_asked(app_module):
+    conn = legacy_database()
+    app_module.migrate_predictions(conn.cursor(), drop_input_json=True)
+
+    rows = conn.execute("SELECT input_data, age FROM predictions ORDER BY id").fetchall()
+    assert rows == [(None, 30), (None, 40), (None, 50)]
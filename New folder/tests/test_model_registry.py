@@ -0,0 +1,55 @@
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+from model_registry import ModelRegistry, publish, read_manifest
+from tree_engine import FlatForest
+
+FEATURES = ['a', 'b']
+
+
+def trained_tree():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 10, (200, 2))
+    return DecisionTreeRegressor(max_depth=4, random_state=0).fit(X, X[:, 0] * 3 + X[:, 1])
+
+
+class Constant:
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, X):
+        return np.full(len(X), self.value, dtype=np.float64)
+
+
+def test_current_version_uses_derived_artifact(tmp_path):
+    """Phiên bản CURRENT dùng dạng dẫn xuất (bảng tra cứu/bản nén) dựng từ đúng model.joblib của nó."""
+    root = str(tmp_path / 'registry')
+    model = trained_tree()
+    version = publish('m', model, FlatForest.from_sklearn(model), FEATURES, {}, root=root)
+    model_sha = read_manifest(root, 'm', version)['files']['model']['sha256']
+    calls = []
+
+    def derived(name, source_sha256):
+        calls.append((name, source_sha256))
+        return (Constant(42.0), 'model/m_compact.joblib') if source_sha256 == model_sha else None
+
+    registry = ModelRegistry(root=root, features=FEATURES, poll_interval=0, derived=derived)
+    registry.refresh()
+
+    assert calls == [('m', model_sha)]
+    assert registry['m'].predict(np.zeros((1, 2)))[0] == 42.0
+    assert registry.version_key('m') == f"{version}+model/m_compact.joblib"
+
+
+def test_derived_artifact_ignored_without_match_or_for_compressed_versions(tmp_path):
+    root = str(tmp_path / 'registry')
+    model = trained_tree()
+    X = np.array([[1.0, 2.0], [7.5, 3.0]])
+    publish('plain', model, FlatForest.from_sklearn(model), FEATURES, {}, root=root)
+    publish('compressed', model, FlatForest.from_sklearn(model), FEATURES, {}, root=root, compressed={'trees': 1})
+
+    registry = ModelRegistry(root=root, features=FEATURES, poll_interval=0,
+                             derived=lambda name, sha: (Constant(42.0), None) if name == 'compressed' else None)
+    registry.refresh()
+
+    np.testing.assert_array_equal(registry['plain'].predict(X), model.predict(X))
+    np.testing.assert_array_equal(registry['compressed'].predict(X), model.predict(X))
@@ -0,0 +1,30 @@
+import pytest
+
+OPS_PATHS = ["/stats", "/metrics", "/debug/profile"]
+
+
+@pytest.mark.parametrize("path", OPS_PATHS)
+def test_ops_endpoints_are_off_without_token(client, path):
+    assert client.get(path).status_code == 404
+
+
+@pytest.mark.parametrize("path", OPS_PATHS)
+def test_ops_endpoints_require_the_token(app_module, client, auth_headers, monkeypatch, path):
+    monkeypatch.setattr(app_module, "OPS_TOKEN", "s3cret-ops")
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    # Token đăng nhập của người dùng thường không thay được OPS_TOKEN
+    assert client.get(path, headers=auth_headers).status_code == 401
+
+
+def test_ops_token_opens_stats_and_metrics(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "OPS_TOKEN", "s3cret-ops")
+    headers = {"Authorization": "Bearer s3cret-ops"}
+
+    stats = client.get("/stats", headers=headers).json()
+    metrics = client.get("/metrics", headers=headers).text
+    assert stats["process"]["pid"]
+    assert {"completed", "failed", "rejected"} <= set(stats["password_hasher"])
+    assert "prediction_writer_flushed_total" in metrics
+    assert "password_hasher_failed_total" in metrics
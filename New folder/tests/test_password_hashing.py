@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import threading
+
+import password_hashing
+from password_hashing import PasswordHasher
+
+
+def test_pool_does_not_fork_the_threaded_server():
+    """start() sau khi đã có luồng khác (như QueueListener của log_pipeline) vẫn băm được bằng tiến trình con."""
+    stop = threading.Event()
+    busy = threading.Thread(target=stop.wait, daemon=True)
+    busy.start()
+    hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        hasher.start()
+        assert hasher._executor._mp_context.get_start_method() in ("forkserver", "spawn")
+
+        async def roundtrip():
+            hashed = await hasher.hash("Passw0rd1")
+            return await hasher.verify_and_update("Passw0rd1", hashed)
+
+        valid, new_hash = asyncio.run(roundtrip())
+        assert valid and new_hash is None
+    finally:
+        hasher.shutdown()
+        stop.set()
+
+
+def test_thread_fallback_is_logged(monkeypatch, caplog):
+    def broken_pool(*args, **kwargs):
+        raise OSError("no semaphores")
+
+    monkeypatch.setattr(password_hashing, "ProcessPoolExecutor", broken_pool)
+    hasher = PasswordHasher(rounds=4, workers=2)
+    with caplog.at_level(logging.WARNING, logger="password_hashing"):
+        hasher.start()
+    try:
+        assert "luồng thay thế" in caplog.text
+        assert asyncio.run(hasher.hash("Passw0rd1")).startswith("$2b$04$")
+    finally:
+        hasher.shutdown()
+
+
+def test_pool_inherited_from_another_process_is_recreated(monkeypatch):
+    hasher = PasswordHasher(rounds=4, workers=1)
+    hasher.start()
+    inherited = hasher._executor
+    try:
+        monkeypatch.setattr(hasher, "_executor_pid", -1)
+        hasher.start()
+        assert hasher._executor is not inherited
+    finally:
+        hasher.shutdown()
+        inherited.shutdown()
+
+
+def test_failed_jobs_are_not_counted_as_completed():
+    hasher = PasswordHasher(rounds=4, workers=0)
+
+    async def scenario():
+        hashed = await hasher.hash("Passw0rd1")
+        await hasher.verify_and_update("Passw0rd1", hashed)
+        try:
+            await hasher.verify_and_update("Passw0rd1", "not-a-bcrypt-hash")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("hash không hợp lệ phải ném ValueError")
+
+    asyncio.run(scenario())
+
+    stats = hasher.stats()
+    assert (stats["completed"], stats["failed"], stats["rejected"], stats["in_flight"]) == (2, 1, 0, 0)
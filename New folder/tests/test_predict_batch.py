@@ -0,0 +1,99 @@
+import json
+
+VALID_ROW = {"age": 40, "sex": 1, "height": 1.7, "weight": 70, "children": 2, "smoker": 0, "region": 1,
+             "model": "decision_tree"}
+
+
+def batch_lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_malformed_rows_get_per_row_errors(client, auth_headers):
+    rows = [
+        VALID_ROW,
+        {**VALID_ROW, "age": [1, 2]},
+        {**VALID_ROW, "height": {"m": 1.7}},
+        {**VALID_ROW, "model": ["decision_tree"]},
+        {**VALID_ROW, "weight": "1e400"},
+        "not an object",
+        VALID_ROW,
+    ]
+    response = client.post("/predict/batch", json=rows, headers=auth_headers)
+
+    assert response.status_code == 200
+    lines = batch_lines(response)
+    assert [line["row"] for line in lines[:-1]] == list(range(len(rows)))
+    assert "prediction" in lines[0] and "prediction" in lines[6]
+    assert all("error" in line for line in lines[1:6])
+    assert lines[-1] == {"summary": {"total": 7, "succeeded": 2, "failed": 5}}
+
+
+def test_nested_lists_in_every_row(client, auth_headers):
+    """Các list cùng độ dài ở mọi dòng không được biến cột thành mảng hai chiều."""
+    rows = [{**VALID_ROW, "age": [30, 31], "model": ["a", "b"]} for _ in range(3)]
+    response = client.post("/predict/batch", json=rows, headers=auth_headers)
+
+    lines = batch_lines(response)
+    assert all("error" in line for line in lines[:-1])
+    assert lines[-1]["summary"] == {"total": 3, "succeeded": 0, "failed": 3}
+
+
+CSV_HEADER = "age,sex,height,weight,children,smoker,region,model\n"
+
+
+def test_non_utf8_csv_is_rejected(client, auth_headers):
+    body = (CSV_HEADER + "40,1,1.7,70,2,0,1,decision_tree\n").encode() + "30,0,1.6,\xe9\n".encode("latin-1")
+    response = client.post("/predict/batch", content=body, headers={**auth_headers, "Content-Type": "text/csv"})
+
+    assert response.status_code == 400
+    assert "UTF-8" in response.json()["detail"]
+
+
+def test_bad_csv_header_is_rejected(client, auth_headers):
+    response = client.post("/predict/batch", content="age,sex\n40,1\n",
+                           headers={**auth_headers, "Content-Type": "text/csv"})
+
+    assert response.status_code == 400
+    assert "Thiếu cột" in response.json()["detail"]
+
+
+def test_non_utf8_ndjson_is_rejected(client, auth_headers):
+    response = client.post("/predict/batch", content=b'{"age": 40}\n\xff\xfe\n',
+                           headers={**auth_headers, "Content-Type": "application/x-ndjson"})
+
+    assert response.status_code == 400
+
+
+def test_chunks_are_committed_as_they_stream(app_module, client, auth_headers, monkeypatch):
+    """Mỗi khối được commit riêng: lỗi ở khối sau không xóa các dự đoán đã trả về trước đó."""
+    monkeypatch.setattr(app_module, "BATCH_CHUNK_SIZE", 2)
+    predict_batch = app_module.predict_batch
+    calls = []
+
+    def fail_on_second_chunk(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("boom")
+        return predict_batch(*args)
+
+    monkeypatch.setattr(app_module, "predict_batch", fail_on_second_chunk)
+    response = client.post("/predict/batch", json=[VALID_ROW] * 5, headers=auth_headers)
+
+    lines = batch_lines(response)
+    assert [line["row"] for line in lines[:2]] == [0, 1]
+    assert "2 dự đoán" in lines[-1]["error"]
+    assert len(client.get("/history", headers=auth_headers).json()) == 2
+
+
+def test_batch_and_single_predict_accept_the_same_bounds(app_module, client, auth_headers):
+    """/predict (Field của PredictionInput) và /predict/batch (NumPy) dùng chung INPUT_BOUNDS."""
+    rows = []
+    for name, (low, high) in app_module.INPUT_BOUNDS.items():
+        step = 0.01 if isinstance(low, float) else 1
+        rows += [{**VALID_ROW, name: value} for value in (low - step, low, high, high + step)]
+    response = client.post("/predict/batch", json=rows, headers=auth_headers)
+
+    batch_ok = ["prediction" in line for line in batch_lines(response)[:-1]]
+    single_ok = [client.post("/predict", json=row, headers=auth_headers).status_code == 200 for row in rows]
+    assert batch_ok == single_ok
+    assert any(batch_ok) and not all(batch_ok)
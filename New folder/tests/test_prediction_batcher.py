@@ -0,0 +1,36 @@
+import asyncio
+
+FEATURES = [40, 1, 24.2, 2, 0, 1]
+
+
+def test_stop_flushes_pending_batches_and_waits_for_running_ones(app_module):
+    async def scenario():
+        batcher = app_module.PredictionBatcher(max_batch_size=64, max_wait_ms=60_000)
+        requests = [asyncio.create_task(batcher.predict("decision_tree", FEATURES)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert not any(request.done() for request in requests)
+        await batcher.stop()
+        assert all(request.done() for request in requests)
+        assert not batcher._tasks
+        return [request.result() for request in requests]
+
+    predictions = asyncio.run(scenario())
+
+    expected = app_module.models["decision_tree"].predict([FEATURES])[0]
+    assert predictions == [expected] * 3
+
+
+def test_running_batches_are_tracked_until_done(app_module):
+    async def scenario():
+        batcher = app_module.PredictionBatcher(max_batch_size=2, max_wait_ms=60_000)
+        requests = [asyncio.create_task(batcher.predict("decision_tree", FEATURES)) for _ in range(2)]
+        await asyncio.sleep(0)
+        running = set(batcher._tasks)
+        await asyncio.gather(*requests)
+        await asyncio.sleep(0)
+        return running, set(batcher._tasks)
+
+    running, remaining = asyncio.run(scenario())
+
+    assert len(running) == 1
+    assert remaining == set()
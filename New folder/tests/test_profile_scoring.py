@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+from profile_scoring import PROFILE_COLUMNS, profile_features
+
+PROFILE = {"age": 40, "sex": 1, "height": 1.7, "weight": 70.0, "children": 2, "smoker": 0, "region": 1}
+MODEL = "decision_tree"
+
+
+def query(app_module, sql, params=()):
+    with app_module.db.connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+        return rows
+
+
+def user_id(client, headers):
+    return client.get("/me", headers=headers).json()["id"]
+
+
+def wait_until_scored(app_module, uid, timeout=5.0):
+    """Chờ ProfileScorer chạy nền ghi dự đoán cho revision hiện tại của hồ sơ và phiên bản mô hình hiện tại."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        rows = query(app_module, """
+            SELECT pp.prediction FROM profiles p
+            JOIN profile_predictions pp ON pp.user_id = p.user_id AND pp.model = ?
+            WHERE p.user_id = ? AND pp.profile_revision = p.revision AND pp.model_version = ?
+        """, (MODEL, uid, app_module.models.version_key(MODEL)))
+        if rows:
+            return rows[0][0]
+        time.sleep(0.02)
+    pytest.fail("ProfileScorer không chấm hồ sơ kịp thời hạn")
+
+
+def predict_me(client, headers):
+    return client.get("/predict/me", params={"model": MODEL}, headers=headers)
+
+
+def set_stored_prediction(app_module, uid, value):
+    query(app_module, "UPDATE profile_predictions SET prediction = ? WHERE user_id = ? AND model = ?",
+          (value, uid, MODEL))
+
+
+@pytest.fixture
+def scored_user(app_module, client, auth_headers):
+    """Người dùng có hồ sơ PROFILE đã được chấm sẵn; dự đoán lưu được thay bằng giá trị dễ nhận ra."""
+    assert client.put("/profile", json=PROFILE, headers=auth_headers).status_code == 200
+    uid = user_id(client, auth_headers)
+    wait_until_scored(app_module, uid)
+    set_stored_prediction(app_module, uid, 1234.0)
+    return uid
+
+
+def test_precomputed_prediction_is_served_for_current_revision(app_module, client, auth_headers, scored_user):
+    response = predict_me(client, auth_headers)
+
+    assert response.status_code == 200
+    assert response.json()["precomputed"] is True
+    assert response.json()["prediction"] == 1234.0 * app_module.USD_TO_VND
+
+
+def test_profile_edit_bumps_revision_and_invalidates_stored_score(app_module, client, auth_headers, scored_user):
+    revision = query(app_module, "SELECT revision FROM profiles WHERE user_id = ?", (scored_user,))[0][0]
+    # Lưu lại đúng hồ sơ cũ không làm tăng revision
+    client.put("/profile", json=PROFILE, headers=auth_headers)
+    assert query(app_module, "SELECT revision FROM profiles WHERE user_id = ?", (scored_user,))[0][0] == revision
+
+    client.put("/profile", json={**PROFILE, "smoker": 1}, headers=auth_headers)
+    assert query(app_module, "SELECT revision FROM profiles WHERE user_id = ?", (scored_user,))[0][0] == revision + 1
+    response = predict_me(client, auth_headers)
+
+    assert response.json()["precomputed"] is False
+    assert response.json()["prediction"] != 1234.0 * app_module.USD_TO_VND
+    wait_until_scored(app_module, scored_user)
+    assert predict_me(client, auth_headers).json()["precomputed"] is True
+
+
+def test_model_version_change_invalidates_stored_score(app_module, client, auth_headers, scored_user, monkeypatch):
+    version_key = app_module.models.version_key
+    # Đổi định danh mô hình như khi một phiên bản mới được nâng lên CURRENT
+    monkeypatch.setattr(app_module.models, "version_key",
+                        lambda name: version_key(name) + ("-promoted" if name == MODEL else ""))
+
+    response = predict_me(client, auth_headers)
+
+    assert response.json()["precomputed"] is False
+    assert response.json()["prediction"] != 1234.0 * app_module.USD_TO_VND
+    wait_until_scored(app_module, scored_user)
+    assert predict_me(client, auth_headers).json()["precomputed"] is True
+
+
+def test_profile_with_null_fields_returns_400(app_module, client, auth_headers):
+    uid = user_id(client, auth_headers)
+    query(app_module, "INSERT INTO profiles (user_id, age, sex) VALUES (?, 40, 1)", (uid,))
+
+    response = predict_me(client, auth_headers)
+
+    assert response.status_code == 400
+
+
+def test_live_prediction_when_no_precomputed_row(app_module, client, auth_headers, scored_user):
+    query(app_module, "DELETE FROM profile_predictions WHERE user_id = ?", (scored_user,))
+
+    response = predict_me(client, auth_headers)
+
+    features, valid = profile_features([[PROFILE[name] for name in PROFILE_COLUMNS]])
+    expected = app_module.models[MODEL].predict(features)[0]
+    assert response.status_code == 200
+    assert response.json()["precomputed"] is False
+    assert response.json()["prediction"] == expected * app_module.USD_TO_VND
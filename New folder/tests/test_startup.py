@@ -0,0 +1,26 @@
+import os
+import statistics
+
+from sklearn.ensemble import RandomForestRegressor
+from conftest import DATA_PATH
+from model_registry import publish
+from profile_startup import READY_TARGET_SECONDS, TTFB_TARGET_SECONDS, measure_startup
+from training import FEATURE_COLUMNS, load_dataset
+from tree_engine import FlatForest
+
+
+def test_lazy_startup_meets_targets(tmp_path):
+    """Chế độ lazy: byte đầu tiên và /readyz trong ngưỡng của profile_startup.py --check (trung vị 3 lần)."""
+    # random_forest_model.pkl không nằm trong repo: phát hành một rừng nhỏ vào kho tạm để server nạp
+    X, y = load_dataset(DATA_PATH, cache_dir=str(tmp_path / 'cache'))
+    model = RandomForestRegressor(n_estimators=20, max_depth=10, random_state=0, n_jobs=1).fit(X, y)
+    registry = str(tmp_path / 'registry')
+    publish('random_forest', model, FlatForest.from_sklearn(model), FEATURE_COLUMNS, {}, root=registry)
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / 'startup.db'), MODEL_REGISTRY_DIR=registry,
+               BCRYPT_ROUNDS="4", PASSWORD_POOL_SIZE="1")
+
+    runs = [measure_startup('lazy', env) for _ in range(3)]
+    ttfb, ready, _ = (statistics.median(values) for values in zip(*runs))
+
+    assert ttfb <= TTFB_TARGET_SECONDS, f"time to first byte {ttfb:.3f}s > {TTFB_TARGET_SECONDS}s"
+    assert ready <= READY_TARGET_SECONDS, f"time to ready {ready:.3f}s > {READY_TARGET_SECONDS}s"
@@ -0,0 +1,72 @@
+import gzip
+import re
+
+import pytest
+
+from static_assets import IMMUTABLE_CACHE, Asset, asset_response
+
+STYLESHEET = "css/style.css"
+
+
+def test_fingerprinted_url_is_cached_immutable(app_module, client):
+    url = app_module.static_assets.url(STYLESHEET)
+
+    response = client.get(url)
+
+    assert re.fullmatch(r"/static/css/style\.[0-9a-f]{12}\.css", url)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get(f"/static/{STYLESHEET}").headers["cache-control"] == "no-cache"
+
+
+def test_gzip_variant_is_served_when_accepted(app_module, client):
+    asset = app_module.static_assets.assets[STYLESHEET]
+
+    response = client.get(app_module.static_assets.url(STYLESHEET), headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(asset.bodies["gzip"])
+    assert response.content == gzip.decompress(asset.bodies["gzip"]) == asset.bodies["identity"]
+
+
+def test_identity_is_served_without_accept_encoding(app_module, client):
+    response = client.get(app_module.static_assets.url(STYLESHEET), headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == app_module.static_assets.assets[STYLESHEET].bodies["identity"]
+
+
+def test_brotli_is_preferred_over_gzip():
+    asset = Asset("a.css", "a.0123456789ab.css", "text/css; charset=utf-8", "0" * 64,
+                  {"identity": b"plain", "gzip": b"gz", "br": b"br"})
+
+    status, headers, body = asset_response(asset, IMMUTABLE_CACHE, "gzip, deflate, br")
+    headers = dict(headers)
+
+    assert (status, body) == (200, b"br")
+    assert headers[b"content-encoding"] == b"br"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert asset_response(asset, IMMUTABLE_CACHE, "gzip, br;q=0")[2] == b"gz"
+
+
+def test_brotli_variant_is_served_when_accepted(app_module, client):
+    brotli = pytest.importorskip("brotli")
+    asset = app_module.static_assets.assets[STYLESHEET]
+
+    response = client.get(app_module.static_assets.url(STYLESHEET), headers={"Accept-Encoding": "br, gzip"})
+
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert brotli.decompress(asset.bodies["br"]) == asset.bodies["identity"]
+
+
+def test_templates_reference_fingerprinted_assets(app_module, client):
+    html = client.get("/").text
+
+    for path in (STYLESHEET, "js/script.js"):
+        url = app_module.static_assets.url(path)
+        assert f'"{url}"' in html
+        assert f'"/static/{path}"' not in html
+        assert client.get(url).headers["cache-control"] == IMMUTABLE_CACHE
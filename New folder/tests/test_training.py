@@ -0,0 +1,24 @@
+import os
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from conftest import DATA_PATH
+from model_registry import list_versions, read_pointer
+from training import load_dataset, split_dataset
+from training.models import evaluate, save_model
+
+
+def test_parallel_training_is_published(tmp_path, monkeypatch):
+    """Huấn luyện với n_jobs=-1 vẫn xuất được mảng phẳng giống hệt và phát hành vào kho."""
+    monkeypatch.chdir(tmp_path)
+    X, y = load_dataset(DATA_PATH, cache_dir=str(tmp_path / 'cache'))
+    X_train, X_test, y_train, y_test = split_dataset(X, y)
+    model = RandomForestRegressor(n_estimators=20, random_state=42, n_jobs=-1).fit(X_train, y_train)
+
+    version = save_model('random_forest', model, X, evaluate(model, X_train, y_train, X_test, y_test))
+
+    assert version is not None
+    assert model.n_jobs == 1
+    assert os.path.exists('model/random_forest_flat.joblib')
+    assert list_versions('model/registry', 'random_forest') == [version]
+    assert read_pointer('model/registry', 'random_forest', 'CURRENT') == version
+    assert np.isfinite(model.predict(X_test)).all()
@@ -0,0 +1,104 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from conftest import APP_DIR, DATA_PATH
+from training import load_dataset, split_dataset
+from tree_engine import FlatForest, floor_float32
+
+N_FEATURES = 7
+
+
+@pytest.fixture(scope="module")
+def training_data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(scale=[10, 1, 0.1, 20, 2, 1, 2], size=(2000, N_FEATURES))
+    # Cột rời rạc giống age/children/smoker/region để có ngưỡng dạng x.5
+    X[:, 1] = rng.integers(0, 2, len(X))
+    X[:, 4] = rng.integers(0, 5, len(X))
+    y = X[:, 0] * 3 + X[:, 3] ** 2 + 50 * X[:, 1] + rng.normal(size=len(X))
+    return X, y
+
+
+@pytest.fixture(scope="module", params=["decision_tree", "random_forest"])
+def model(request, training_data):
+    X, y = training_data
+    if request.param == "decision_tree":
+        return DecisionTreeRegressor(random_state=0).fit(X, y)
+    return RandomForestRegressor(n_estimators=25, max_depth=12, random_state=0, n_jobs=1).fit(X, y)
+
+
+def threshold_inputs(model, rng):
+    """Dòng có giá trị nằm đúng trên, ngay trên và ngay dưới các ngưỡng tách (dạng float32)."""
+    estimators = getattr(model, "estimators_", [model])
+    rows = []
+    for estimator in estimators[:5]:
+        tree = estimator.tree_
+        for node in np.flatnonzero(tree.children_left != -1)[:200]:
+            feature, threshold = tree.feature[node], tree.threshold[node]
+            at = floor_float32(threshold)
+            for value in (at, np.nextafter(at, np.float32(np.inf)), np.nextafter(at, np.float32(-np.inf)),
+                          threshold, np.float32(threshold)):
+                row = rng.normal(size=N_FEATURES).astype(np.float32)
+                row[feature] = value
+                rows.append(row)
+    return np.asarray(rows, dtype=np.float32)
+
+
+def edge_inputs():
+    f32 = np.finfo(np.float32)
+    values = [0.0, -0.0, 0.5, -0.5, f32.tiny, -f32.tiny, f32.max, f32.min, 1e30, -1e30, f32.eps]
+    return np.asarray([[value] * N_FEATURES for value in values], dtype=np.float32)
+
+
+def test_flat_forest_matches_sklearn_exactly(model):
+    flat = FlatForest.from_sklearn(model)
+    rng = np.random.default_rng(1)
+    inputs = [
+        rng.normal(scale=[10, 1, 0.1, 20, 2, 1, 2], size=(5000, N_FEATURES)).astype(np.float32),
+        rng.uniform(-1e6, 1e6, size=(1000, N_FEATURES)).astype(np.float32),
+        threshold_inputs(model, rng),
+        edge_inputs(),
+    ]
+    for X in inputs:
+        np.testing.assert_array_equal(flat.predict(X), model.predict(X))
+
+
+def test_float64_inputs_are_rounded_like_sklearn(model):
+    """Giá trị float64 không biểu diễn được bằng float32 vẫn rơi vào cùng nhánh như sklearn."""
+    flat = FlatForest.from_sklearn(model)
+    tree = getattr(model, "estimators_", [model])[0].tree_
+    thresholds = tree.threshold[tree.children_left != -1][:300]
+    X = np.zeros((len(thresholds) * 2, N_FEATURES))
+    features = tree.feature[tree.children_left != -1][:300]
+    rows = np.arange(len(thresholds))
+    X[rows, features] = thresholds + 1e-12
+    X[rows + len(thresholds), features] = thresholds - 1e-12
+
+    np.testing.assert_array_equal(flat.predict(X), model.predict(X))
+
+
+def test_saved_flat_forest_predicts_the_same(model, tmp_path):
+    flat = FlatForest.from_sklearn(model)
+    flat.save(tmp_path / "flat.joblib")
+    loaded = FlatForest.load(tmp_path / "flat.joblib", mmap_mode="r")
+    X = np.random.default_rng(2).normal(size=(500, N_FEATURES)).astype(np.float32)
+
+    np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+
+
+def test_flat_forest_matches_sklearn_on_insurance_data(tmp_path):
+    """Đặc trưng thật (mã hóa sex/smoker/region, BMI) qua load_dataset, ngưỡng thật của mô hình đã huấn luyện."""
+    X, y = load_dataset(DATA_PATH, cache_dir=str(tmp_path / 'cache'))
+    X_train, X_test, y_train, y_test = split_dataset(X, y)
+    models = [
+        joblib.load(f"{APP_DIR}/model/decision_tree_model.pkl"),
+        DecisionTreeRegressor(random_state=42).fit(X_train, y_train),
+        RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=1).fit(X_train, y_train),
+    ]
+    for model in models:
+        flat = FlatForest.from_sklearn(model)
+        for rows in (X, X_test):
+            assert np.array_equal(flat.predict(rows.to_numpy()), model.predict(rows))
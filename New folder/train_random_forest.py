@@ -1,70 +1,39 @@
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
-import pickle
-import os
+import argparse
+import sys
+from training import load_dataset, split_dataset
+from training.models import evaluate, save_model, sequential
 
 # Define paths
 DATA_PATH = 'data/insurance.csv'
-MODEL_PATH = 'model/random_forest_model.pkl'
 
-# Ensure model directory exists
-os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+parser = argparse.ArgumentParser(description="Train the random forest model and publish it to the model registry.")
+parser.add_argument('--candidate', action='store_true',
+                    help="publish as a shadow-scored candidate instead of serving it immediately")
+args = parser.parse_args()
 
-# Load dataset
+# Load dataset (encoded features are cached as .npy next to the CSV)
 try:
-    df = pd.read_csv(DATA_PATH)
+    X, y = load_dataset(DATA_PATH)
 except FileNotFoundError:
     print(f"Error: {DATA_PATH} not found.")
-    exit(1)
-
-# Preprocess data
-# Map categorical variables
-df['sex'] = df['sex'].map({'male': 0, 'female': 1})
-df['smoker'] = df['smoker'].map({'no': 0, 'yes': 1})
-df['region'] = df['region'].map({'southwest': 0, 'southeast': 1, 'northwest': 2, 'northeast': 3})
-
-# Calculate BMI if not present
-if 'bmi' not in df.columns and 'height' in df.columns and 'weight' in df.columns:
-    df['bmi'] = df['weight'] / (df['height'] ** 2)
-
-# Select features and target
-features = ['age', 'sex', 'bmi', 'children', 'smoker', 'region']
-X = df[features]
-y = df['charges']
+    sys.exit(1)
 
 # Split data
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+X_train, X_test, y_train, y_test = split_dataset(X, y)
 
 # Initialize and train model
-model = RandomForestRegressor(n_estimators=100, random_state=42)
+model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
 model.fit(X_train, y_train)
-
-# Make predictions
-train_pred = model.predict(X_train)
-test_pred = model.predict(X_test)
+sequential(model)  # song song chỉ khi fit; predict một luồng để kết quả lặp lại được từng bit
 
 # Calculate metrics
-metrics = {
-    'train_r2': r2_score(y_train, train_pred),
-    'test_r2': r2_score(y_test, test_pred),
-    'train_mae': mean_absolute_error(y_train, train_pred),
-    'test_mae': mean_absolute_error(y_test, test_pred),
-    'train_rmse': np.sqrt(mean_squared_error(y_train, train_pred)),
-    'test_rmse': np.sqrt(mean_squared_error(y_test, test_pred))
-}
+metrics = evaluate(model, X_train, y_train, X_test, y_test)
 
 # Print metrics
 print("Random Forest Model Metrics:")
 for key, value in metrics.items():
     print(f"{key}: {value:.4f}")
 
-# Save model
-try:
-    with open(MODEL_PATH, 'wb') as f:
-        pickle.dump(model, f)
-    print(f"Model saved to {MODEL_PATH}")
-except Exception as e:
-    print(f"Error saving model: {e}")
\ No newline at end of file
+# Save model, flat arrays and metrics, then publish to the model registry
+save_model('random_forest', model, X, metrics, pointer='CANDIDATE' if args.candidate else 'CURRENT')
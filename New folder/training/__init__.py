@@ -0,0 +1,4 @@
+"""Tiền xử lý dùng chung và tìm siêu tham số cho các script huấn luyện."""
+from training.features import FEATURE_COLUMNS, load_dataset, load_features, split_dataset
+
+__all__ = ["FEATURE_COLUMNS", "load_dataset", "load_features", "split_dataset"]
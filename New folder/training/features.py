@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import numpy as np
+from lookup_table import file_sha256
+
+DATA_PATH = 'data/insurance.csv'
+CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", 'data/cache')
+CACHE_VERSION = 2  # đổi khi định dạng bộ đệm thay đổi
+CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "500000"))
+FEATURE_COLUMNS = ['age', 'sex', 'bmi', 'children', 'smoker', 'region']
+TARGET_COLUMN = 'charges'
+
+CATEGORY_MAPS = {
+    'sex': {'male': 0, 'female': 1},
+    'smoker': {'no': 0, 'yes': 1},
+    'region': {'southwest': 0, 'southeast': 1, 'northwest': 2, 'northeast': 3},
+}
+# Mỗi cột một tệp .npy với kiểu gọn: cột nguyên int8, BMI float32 (cây của sklearn vốn ép đặc
+# trưng về float32 nên mô hình huấn luyện từ bộ đệm giống hệt khi huấn luyện từ CSV), nhãn float64
+COLUMN_DTYPES = {
+    'age': np.int8,
+    'sex': np.int8,
+    'bmi': np.float32,
+    'children': np.int8,
+    'smoker': np.int8,
+    'region': np.int8,
+    TARGET_COLUMN: np.float64,
+}
+# Kiểu khi đọc CSV; BMI, chiều cao, cân nặng đọc float64 rồi mới làm tròn để khớp cách tính cũ
+CSV_DTYPES = {
+    'age': 'int16',
+    'sex': 'category',
+    'bmi': 'float64',
+    'children': 'int16',
+    'smoker': 'category',
+    'region': 'category',
+    'height': 'float64',
+    'weight': 'float64',
+    TARGET_COLUMN: 'float64',
+}
+
+
+def count_rows(csv_path, block_size=1 << 24):
+    """Đếm dòng dữ liệu (trừ header) bằng cách quét byte, không parse CSV."""
+    newlines = 0
+    last = b'\n'
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            newlines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        newlines += 1
+    return max(0, newlines - 1)
+
+
+def encode_chunk(df):
+    """Mã hóa một khối DataFrame đọc từ CSV thành các cột theo COLUMN_DTYPES."""
+    for column, mapping in CATEGORY_MAPS.items():
+        df[column] = df[column].map(mapping)
+    # Calculate BMI if not present
+    if 'bmi' not in df.columns and 'height' in df.columns and 'weight' in df.columns:
+        df['bmi'] = df['weight'] / (df['height'] ** 2)
+    missing = df[FEATURE_COLUMNS + [TARGET_COLUMN]].isna().any()
+    if missing.any():
+        raise ValueError(f"Giá trị thiếu hoặc không mã hóa được ở cột: {', '.join(missing[missing].index)}")
+    return {column: df[column].to_numpy(dtype=dtype) for column, dtype in COLUMN_DTYPES.items()}
+
+
+def ingest_csv(csv_path, directory, chunk_rows=CHUNK_ROWS):
+    """Đọc CSV theo từng khối chunk_rows dòng và ghi thẳng vào các tệp .npy theo cột.
+
+    Bộ nhớ dùng chỉ phụ thuộc chunk_rows, không phụ thuộc kích thước tệp.
+    """
+    import pandas as pd
+
+    n_rows = count_rows(csv_path)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [column for column in CSV_DTYPES if column in header]
+    tmp_dir = f"{directory}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    # Ghi nối tiếp vào tệp (header .npy ghi trước với số dòng đã đếm) thay vì memmap, để các trang
+    # đã ghi không bị tính vào RSS của tiến trình
+    files = {}
+    for column, dtype in COLUMN_DTYPES.items():
+        f = files[column] = open(os.path.join(tmp_dir, f"{column}.npy"), 'wb')
+        np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                 'fortran_order': False, 'shape': (n_rows,)})
+    written = 0
+    try:
+        reader = pd.read_csv(csv_path, usecols=usecols, dtype={c: CSV_DTYPES[c] for c in usecols}, chunksize=chunk_rows)
+        for chunk in reader:
+            encoded = encode_chunk(chunk)
+            written += len(chunk)
+            if written > n_rows:
+                raise ValueError(f"{csv_path}: nhiều dòng hơn số dòng đã đếm ({n_rows})")
+            for column, values in encoded.items():
+                files[column].write(values.tobytes())
+    finally:
+        for f in files.values():
+            f.close()
+    if written != n_rows:
+        # Dòng trống bị pandas bỏ qua: ghi lại với số dòng thật
+        for column in COLUMN_DTYPES:
+            path = os.path.join(tmp_dir, f"{column}.npy")
+            with open(path, 'rb') as f:
+                f.seek(-written * np.dtype(COLUMN_DTYPES[column]).itemsize, os.SEEK_END)
+                values = np.fromfile(f, dtype=COLUMN_DTYPES[column])
+            np.save(path, values)
+    with open(os.path.join(tmp_dir, 'columns.json'), 'w', encoding='utf-8') as f:
+        json.dump({'source': csv_path, 'rows': written,
+                   'dtypes': {column: np.dtype(dtype).name for column, dtype in COLUMN_DTYPES.items()}}, f)
+    try:
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # Tiến trình khác đã ghi xong cùng bộ đệm
+        shutil.rmtree(tmp_dir)
+
+
+def cache_dir_for(csv_path, cache_dir=CACHE_DIR):
+    """Thư mục bộ đệm theo sha256 của CSV: đổi nội dung CSV thì bộ đệm cũ tự bị bỏ qua."""
+    return os.path.join(cache_dir, f"{file_sha256(csv_path)[:16]}-v{CACHE_VERSION}")
+
+
+def open_columns(csv_path=DATA_PATH, cache_dir=CACHE_DIR, mmap_mode='r'):
+    """Trả về {cột: mảng} từ bộ đệm theo cột (tạo nếu chưa có); mặc định ánh xạ từ đĩa."""
+    directory = cache_dir_for(csv_path, cache_dir)
+    if not os.path.exists(os.path.join(directory, 'columns.json')):
+        ingest_csv(csv_path, directory)
+    return {column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode=mmap_mode)
+            for column in COLUMN_DTYPES}
+
+
+def column_paths(csv_path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Đường dẫn tệp .npy của từng cột (tạo bộ đệm nếu chưa có)."""
+    open_columns(csv_path, cache_dir)
+    directory = cache_dir_for(csv_path, cache_dir)
+    return {column: os.path.join(directory, f"{column}.npy") for column in COLUMN_DTYPES}
+
+
+def load_features(csv_path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Trả về (X float32 theo FEATURE_COLUMNS, y float64) nạp hẳn vào bộ nhớ."""
+    columns = open_columns(csv_path, cache_dir)
+    X = np.empty((len(columns[TARGET_COLUMN]), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for i, column in enumerate(FEATURE_COLUMNS):
+        X[:, i] = columns[column]
+    return X, np.array(columns[TARGET_COLUMN])
+
+
+def load_dataset(csv_path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Như load_features nhưng trả về DataFrame/Series để mô hình giữ tên đặc trưng."""
+    import pandas as pd
+
+    X, y = load_features(csv_path, cache_dir)
+    return pd.DataFrame(X, columns=FEATURE_COLUMNS), pd.Series(y, name=TARGET_COLUMN)
+
+
+def split_dataset(X, y, test_size=0.2, random_state=42):
+    """Cách chia train/test chung của mọi script huấn luyện."""
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(X, y, test_size=test_size, random_state=random_state)
@@ -0,0 +1,73 @@
+import json
+import os
+import numpy as np
+from training.features import FEATURE_COLUMNS
+
+MODEL_DIR = 'model'
+# Đường dẫn mà server (app.py) và export_models.py đọc
+MODEL_PATHS = {
+    'random_forest': ('model/random_forest_model.pkl', 'model/random_forest_flat.joblib'),
+    'decision_tree': ('model/decision_tree_model.pkl', 'model/decision_tree_flat.joblib'),
+}
+
+
+def sequential(model):
+    """Đặt n_jobs=1 cho mô hình đã huấn luyện: song song chỉ dùng khi fit.
+
+    Với n_jobs > 1, predict của rừng sklearn cộng dự đoán từng cây dưới khóa theo thứ tự không cố
+    định nên kết quả không lặp lại được từng bit, và không thể đối chiếu với FlatForest.
+    """
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=1)
+    return model
+
+
+def evaluate(model, X_train, y_train, X_test, y_test):
+    from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
+
+    train_pred = model.predict(X_train)
+    test_pred = model.predict(X_test)
+    return {
+        'train_r2': r2_score(y_train, train_pred),
+        'test_r2': r2_score(y_test, test_pred),
+        'train_mae': mean_absolute_error(y_train, train_pred),
+        'test_mae': mean_absolute_error(y_test, test_pred),
+        'train_rmse': np.sqrt(mean_squared_error(y_train, train_pred)),
+        'test_rmse': np.sqrt(mean_squared_error(y_test, test_pred)),
+    }
+
+
+def save_model(name, model, X, metrics, pointer='CURRENT', extra=None):
+    """Lưu mô hình sklearn, mảng phẳng (đã đối chiếu trên X), chỉ số và phát hành vào kho mô hình.
+
+    pointer = 'CANDIDATE' để chấm điểm shadow trước, None để không phát hành.
+    """
+    import joblib
+    from model_registry import MODEL_REGISTRY_DIR, publish
+    from tree_engine import FlatForest, verify_against_sklearn
+
+    model_path, flat_path = MODEL_PATHS[name]
+    sequential(model)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    joblib.dump(model, model_path)
+    print(f"Model saved to {model_path}")
+
+    metrics_path = os.path.join(MODEL_DIR, f"{name}_metrics.json")
+    with open(metrics_path, 'w', encoding='utf-8') as f:
+        json.dump({'metrics': {k: float(v) for k, v in metrics.items()}, **(extra or {})}, f, indent=2, default=str)
+    print(f"Metrics saved to {metrics_path}")
+
+    # Export flat arrays for the server's inference engine
+    flat_model = FlatForest.from_sklearn(model)
+    identical, max_diff = verify_against_sklearn(model, flat_model, X)
+    if not identical:
+        print(f"Error: flat model differs from sklearn (max diff {max_diff}), not saved.")
+        return None
+    flat_model.save(flat_path)
+    print(f"Flat model saved to {flat_path}")
+    if pointer is None:
+        return None
+    # Running servers pick up the new version without a restart
+    version = publish(name, model, flat_model, FEATURE_COLUMNS, metrics, pointer=pointer)
+    print(f"Published {name} version {version} to {MODEL_REGISTRY_DIR} as {pointer}")
+    return version
@@ -0,0 +1,253 @@
+"""Huấn luyện random forest trên tập dữ liệu lớn hơn bộ nhớ, trong một ngân sách RAM cố định.
+
+CSV được nạp một lần vào bộ đệm theo cột (training.features.ingest_csv). Mỗi cây của rừng
+được fit trong một tiến trình worker trên một mẫu bootstrap rút từ đĩa: worker đọc tuần tự
+từng khối của mỗi cột và chỉ giữ các dòng được chọn, nên bộ nhớ của worker tỉ lệ với cỡ mẫu
+chứ không với số dòng. Các cây sau đó được gộp thành một RandomForestRegressor bình thường
+(phục vụ được qua FlatForest/kho mô hình như mô hình huấn luyện trong bộ nhớ). Tập kiểm tra
+là ~10% số dòng chọn bằng băm chỉ số dòng, được đánh giá theo khối.
+Chạy: python -m training.out_of_core --data data/big.csv --memory-budget-mb 1024
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from training.features import CACHE_DIR, DATA_PATH, FEATURE_COLUMNS, TARGET_COLUMN, column_paths
+
+HOLDOUT_FRACTION = 0.1
+BLOCK_ROWS = 1 << 20  # số dòng đọc mỗi lần khi quét một cột
+EVAL_BATCH_ROWS = 50000  # FlatForest cấp phát (số cây x số dòng) nên đánh giá theo lô nhỏ
+# Ước lượng bộ nhớ cho mỗi dòng của mẫu: X float32 + y, chỉ số mẫu và mảng tạm của bộ chia cây
+BYTES_PER_SAMPLE_ROW = 160
+# Bộ nhớ nền của một worker (Python, numpy, sklearn) và khối đọc đĩa
+WORKER_BASE_BYTES = 160 * 1024 * 1024
+
+
+def holdout_mask(indices, fraction=HOLDOUT_FRACTION):
+    """Dòng thuộc tập kiểm tra hay không, tất định theo chỉ số dòng (băm Fibonacci 64-bit)."""
+    mixed = np.asarray(indices, dtype=np.uint64) * np.uint64(11400714819323198485)
+    return (mixed >> np.uint64(40)) < np.uint64(int(fraction * (1 << 24)))
+
+
+def sample_rows_for_budget(budget_bytes, workers):
+    """Số dòng mẫu tối đa của mỗi cây sao cho `workers` worker chạy đồng thời vừa ngân sách."""
+    rows = (budget_bytes // workers - WORKER_BASE_BYTES) // BYTES_PER_SAMPLE_ROW
+    if rows < 1000:
+        raise ValueError(f"ngân sách {budget_bytes / 2**20:.0f} MB quá nhỏ cho {workers} worker; "
+                         f"cần ít nhất {(WORKER_BASE_BYTES + 1000 * BYTES_PER_SAMPLE_ROW) * workers / 2**20:.0f} MB")
+    return int(rows)
+
+
+def _open_npy(path):
+    """Mở tệp .npy để đọc tuần tự; trả về (tệp, dtype, số dòng) với con trỏ ở đầu dữ liệu."""
+    f = open(path, 'rb')
+    major, _ = np.lib.format.read_magic(f)
+    read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+    shape, _, dtype = read_header(f)
+    return f, dtype, shape[0]
+
+
+def gather_rows(paths, indices, columns, out):
+    """Đọc các dòng `indices` (đã sắp xếp) của từng cột vào các cột của `out`, từng khối một."""
+    for position, column in enumerate(columns):
+        f, dtype, n_rows = _open_npy(paths[column])
+        with f:
+            bounds = np.searchsorted(indices, np.arange(0, n_rows + BLOCK_ROWS, BLOCK_ROWS))
+            for block, start in enumerate(range(0, n_rows, BLOCK_ROWS)):
+                lo, hi = bounds[block], bounds[block + 1]
+                count = min(BLOCK_ROWS, n_rows - start)
+                if lo == hi:
+                    f.seek(count * dtype.itemsize, os.SEEK_CUR)
+                    continue
+                values = np.fromfile(f, dtype=dtype, count=count)
+                out[lo:hi, position] = values[indices[lo:hi] - start]
+
+
+def iter_blocks(paths, columns):
+    """Duyệt tuần tự các cột theo khối BLOCK_ROWS dòng; sinh (dòng bắt đầu, {cột: mảng})."""
+    files = {column: _open_npy(paths[column]) for column in columns}
+    try:
+        n_rows = next(iter(files.values()))[2]
+        for start in range(0, n_rows, BLOCK_ROWS):
+            count = min(BLOCK_ROWS, n_rows - start)
+            yield start, {column: np.fromfile(f, dtype=dtype, count=count) for column, (f, dtype, _) in files.items()}
+    finally:
+        for f, _, _ in files.values():
+            f.close()
+
+
+def bootstrap_indices(n_rows, sample_rows, seed):
+    """Chỉ số bootstrap (rút có hoàn lại) trong phần dữ liệu huấn luyện, đã sắp xếp."""
+    rng = np.random.default_rng(seed)
+    train_fraction = 1 - HOLDOUT_FRACTION
+    # Rút dư một chút để sau khi bỏ dòng kiểm tra vẫn đủ sample_rows
+    draw = int(sample_rows / train_fraction * 1.05) + 100
+    indices = rng.integers(0, n_rows, size=draw)
+    indices = indices[~holdout_mask(indices)][:sample_rows]
+    indices.sort()
+    return indices
+
+
+# Trạng thái của mỗi tiến trình worker, nạp một lần trong initializer
+_worker = {}
+
+
+def _init_worker(paths, n_rows):
+    _worker['paths'], _worker['n_rows'] = paths, n_rows
+
+
+def _fit_tree(index, seed, sample_rows, tree_params):
+    from sklearn.tree import DecisionTreeRegressor
+
+    start = time.perf_counter()
+    indices = bootstrap_indices(_worker['n_rows'], sample_rows, seed)
+    # Cây của sklearn cần X float32 thứ tự Fortran; tạo sẵn để fit không phải sao chép
+    X = np.empty((len(indices), len(FEATURE_COLUMNS)), dtype=np.float32, order='F')
+    y = np.empty((len(indices), 1), dtype=np.float64)
+    gather_rows(_worker['paths'], indices, FEATURE_COLUMNS, X)
+    gather_rows(_worker['paths'], indices, [TARGET_COLUMN], y)
+    del indices
+    read_seconds = time.perf_counter() - start
+    tree = DecisionTreeRegressor(random_state=seed, **tree_params).fit(X, y.ravel())
+    return index, tree, read_seconds, time.perf_counter() - start
+
+
+def merge_trees(trees, params):
+    """Gộp các cây đã fit thành một RandomForestRegressor dùng được như mô hình bình thường."""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.tree import DecisionTreeRegressor
+
+    forest = RandomForestRegressor(n_estimators=len(trees), **params)
+    forest.estimators_ = list(trees)
+    forest.estimator_ = DecisionTreeRegressor(**params)
+    forest.n_outputs_ = 1
+    forest.n_features_in_ = len(FEATURE_COLUMNS)
+    forest.feature_names_in_ = np.array(FEATURE_COLUMNS, dtype=object)
+    return forest
+
+
+def fit_forest(paths, n_rows, n_estimators, sample_rows, workers, tree_params, seed=42, progress=None):
+    """Fit song song n_estimators cây trên các mẫu bootstrap đọc từ đĩa; trả về (rừng, thống kê)."""
+    trees = [None] * n_estimators
+    read_seconds = fit_seconds = 0.0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(paths, n_rows)) as executor:
+        futures = [executor.submit(_fit_tree, i, seed + i, sample_rows, tree_params) for i in range(n_estimators)]
+        for done, future in enumerate(as_completed(futures), 1):
+            index, tree, read, total = future.result()
+            trees[index] = tree
+            read_seconds += read
+            fit_seconds += total
+            if progress:
+                progress(done, n_estimators)
+    return merge_trees(trees, tree_params), {'read_seconds': read_seconds, 'fit_seconds': fit_seconds}
+
+
+def evaluate_holdout(forest, paths):
+    """RMSE/MAE/R² trên tập kiểm tra, duyệt dữ liệu theo khối để bộ nhớ không phụ thuộc số dòng."""
+    from tree_engine import FlatForest
+
+    flat = FlatForest.from_sklearn(forest)
+    count = 0
+    sum_sq = sum_abs = sum_y = sum_y2 = 0.0
+    for start, block in iter_blocks(paths, FEATURE_COLUMNS + [TARGET_COLUMN]):
+        mask = holdout_mask(np.arange(start, start + len(block[TARGET_COLUMN])))
+        if not mask.any():
+            continue
+        X = np.column_stack([block[column][mask] for column in FEATURE_COLUMNS]).astype(np.float32)
+        y = block[TARGET_COLUMN][mask]
+        for lo in range(0, len(y), EVAL_BATCH_ROWS):
+            batch = slice(lo, lo + EVAL_BATCH_ROWS)
+            error = flat.predict(X[batch]) - y[batch]
+            sum_sq += float(np.dot(error, error))
+            sum_abs += float(np.abs(error).sum())
+        count += len(y)
+        sum_y += float(y.sum())
+        sum_y2 += float(np.dot(y, y))
+    total_variance = sum_y2 - sum_y * sum_y / count
+    return {
+        'holdout_rows': count,
+        'holdout_rmse': float(np.sqrt(sum_sq / count)),
+        'holdout_mae': sum_abs / count,
+        'holdout_r2': 1 - sum_sq / total_variance,
+    }
+
+
+def peak_rss_mb():
+    """RSS đỉnh của tiến trình hiện tại và của các worker đã kết thúc (MB)."""
+    import resource
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train a random forest on a dataset larger than memory.")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--memory-budget-mb', type=int, default=1024,
+                        help="total memory for all workers; sets the per-tree bootstrap sample size")
+    parser.add_argument('--sample-rows', type=int, help="rows per tree (default: as many as the budget allows)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-depth', type=int, default=12)
+    parser.add_argument('--min-samples-leaf', type=int, default=20)
+    parser.add_argument('--max-features', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ingest-only', action='store_true', help="build the columnar cache and exit")
+    parser.add_argument('--candidate', action='store_true',
+                        help="publish as a shadow-scored candidate instead of serving it")
+    parser.add_argument('--no-publish', action='store_true', help="save to model/ but not to the model registry")
+    parser.add_argument('--no-save', action='store_true', help="train and evaluate only")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = column_paths(args.data, args.cache_dir)
+    n_rows = len(np.load(paths[TARGET_COLUMN], mmap_mode='r'))
+    size = sum(os.path.getsize(path) for path in paths.values())
+    print(f"Columnar cache: {n_rows} rows, {size / 2**20:.1f} MB ({time.perf_counter() - start:.1f}s)")
+    if args.ingest_only:
+        raise SystemExit(0)
+
+    budget_rows = sample_rows_for_budget(args.memory_budget_mb * 2**20, args.workers)
+    train_rows = int(n_rows * (1 - HOLDOUT_FRACTION))
+    sample_rows = min(args.sample_rows or budget_rows, budget_rows, train_rows)
+    tree_params = {'max_depth': args.max_depth, 'min_samples_leaf': args.min_samples_leaf,
+                   'max_features': args.max_features}
+    print(f"Fitting {args.n_estimators} trees on {sample_rows} bootstrap rows each, "
+          f"{args.workers} worker(s), budget {args.memory_budget_mb} MB")
+
+    fit_start = time.perf_counter()
+    forest, timing = fit_forest(
+        paths, n_rows, args.n_estimators, sample_rows, args.workers, tree_params, args.seed,
+        progress=lambda done, total: print(f"  {done}/{total} trees", end='\r', flush=True),
+    )
+    wall = time.perf_counter() - fit_start
+    print(f"Fitted in {wall:.1f}s wall-clock ({timing['read_seconds']:.1f}s reading, "
+          f"{timing['fit_seconds']:.1f}s total in workers)")
+
+    metrics = evaluate_holdout(forest, paths)
+    own, children = peak_rss_mb()
+    print(f"Peak RSS: {own:.0f} MB main process, {children:.0f} MB largest worker")
+    for key, value in metrics.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+
+    if not args.no_save:
+        import pandas as pd
+        from training.models import save_model
+
+        # Kiểm tra mô hình phẳng trên một mẫu nhỏ của tập kiểm tra
+        rows = np.arange(min(n_rows, BLOCK_ROWS))
+        rows = rows[holdout_mask(rows)][:1000]
+        X_check = np.empty((len(rows), len(FEATURE_COLUMNS)), dtype=np.float32)
+        gather_rows(paths, rows, FEATURE_COLUMNS, X_check)
+        save_model(
+            'random_forest', forest, pd.DataFrame(X_check, columns=FEATURE_COLUMNS), metrics,
+            pointer=None if args.no_publish else ('CANDIDATE' if args.candidate else 'CURRENT'),
+            extra={
+                'params': dict(tree_params, n_estimators=args.n_estimators, sample_rows=sample_rows),
+                'out_of_core': {'rows': n_rows, 'workers': args.workers, 'memory_budget_mb': args.memory_budget_mb,
+                                'wall_seconds': wall, 'peak_rss_mb': {'main': own, 'worker': children}},
+            },
+        )
@@ -0,0 +1,160 @@
+"""Tìm siêu tham số bằng cross-validation, chạy song song trên mọi lõi CPU.
+
+Mỗi (ứng viên, fold) là một tác vụ của pool tiến trình; worker đọc ma trận đặc trưng đã mã hóa
+từ bộ đệm .npy thay vì parse lại CSV. Mô hình tốt nhất được huấn luyện lại trên tập train,
+đánh giá trên tập test rồi lưu vào model/ cùng chỉ số (và phát hành vào kho mô hình).
+Chạy: python -m training.search --model random_forest --folds 5
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from training.features import CACHE_DIR, DATA_PATH, load_features, split_dataset
+
+SEARCH_SPACES = {
+    'random_forest': {
+        'n_estimators': [100, 200, 400],
+        'max_depth': [None, 6, 10],
+        'min_samples_leaf': [1, 2, 4],
+        'max_features': [1.0, 0.5],
+    },
+    'decision_tree': {
+        'max_depth': [None, 3, 4, 5, 6, 8, 10],
+        'min_samples_leaf': [1, 5, 10, 20, 40],
+    },
+}
+
+
+def make_estimator(name, params, n_jobs=1):
+    if name == 'random_forest':
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(random_state=42, n_jobs=n_jobs, **params)
+    from sklearn.tree import DecisionTreeRegressor
+    return DecisionTreeRegressor(random_state=42, **params)
+
+
+def candidates(name, max_candidates=None, seed=42):
+    space = SEARCH_SPACES[name]
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    if max_candidates is not None and max_candidates < len(grid):
+        grid = random.Random(seed).sample(grid, max_candidates)
+    return grid
+
+
+# Trạng thái của mỗi tiến trình worker, nạp một lần trong initializer
+_worker = {}
+
+
+def _init_worker(csv_path, cache_dir, folds):
+    from sklearn.model_selection import KFold
+
+    X, y = load_features(csv_path, cache_dir)
+    X_train, _, y_train, _ = split_dataset(X, y)
+    _worker['X'], _worker['y'] = X_train, y_train
+    _worker['folds'] = list(KFold(n_splits=folds, shuffle=True, random_state=42).split(X_train))
+
+
+def _score(name, index, fold, params):
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    train_idx, val_idx = _worker['folds'][fold]
+    X, y = _worker['X'], _worker['y']
+    start = time.perf_counter()
+    started_at = time.time()
+    model = make_estimator(name, params).fit(X[train_idx], y[train_idx])
+    pred = model.predict(X[val_idx])
+    return {
+        'index': index,
+        'fold': fold,
+        'rmse': float(np.sqrt(mean_squared_error(y[val_idx], pred))),
+        'mae': float(mean_absolute_error(y[val_idx], pred)),
+        'r2': float(r2_score(y[val_idx], pred)),
+        'seconds': time.perf_counter() - start,
+        'started_at': started_at,
+        'finished_at': time.time(),
+    }
+
+
+def run_search(name, grid, folds, workers, csv_path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Trả về kết quả từng ứng viên, sắp theo RMSE trung bình tăng dần."""
+    results = [{'params': params, 'folds': []} for params in grid]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(csv_path, cache_dir, folds)) as executor:
+        futures = [executor.submit(_score, name, index, fold, params)
+                   for index, params in enumerate(grid) for fold in range(folds)]
+        for future in as_completed(futures):
+            score = future.result()
+            results[score['index']]['folds'].append(score)
+    for result in results:
+        fold_scores = result.pop('folds')
+        rmse = [score['rmse'] for score in fold_scores]
+        result.update({
+            'cv_rmse': statistics.mean(rmse),
+            'cv_rmse_std': statistics.stdev(rmse) if len(rmse) > 1 else 0.0,
+            'cv_mae': statistics.mean(score['mae'] for score in fold_scores),
+            'cv_r2': statistics.mean(score['r2'] for score in fold_scores),
+            # Thời gian thực từ lúc fold đầu bắt đầu tới lúc fold cuối xong, và tổng thời gian fit
+            'wall_seconds': max(s['finished_at'] for s in fold_scores) - min(s['started_at'] for s in fold_scores),
+            'fit_seconds': sum(score['seconds'] for score in fold_scores),
+        })
+    return sorted(results, key=lambda result: result['cv_rmse'])
+
+
+def format_params(params):
+    return ", ".join(f"{key}={value}" for key, value in params.items())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search across all cores.")
+    parser.add_argument('--model', choices=sorted(SEARCH_SPACES), default='random_forest')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-candidates', type=int, help="evaluate a random subset of the grid")
+    parser.add_argument('--top', type=int, default=10, help="number of candidates to print")
+    parser.add_argument('--candidate', action='store_true',
+                        help="publish the best model as a shadow-scored candidate instead of serving it")
+    parser.add_argument('--no-publish', action='store_true', help="save to model/ but not to the model registry")
+    args = parser.parse_args()
+
+    # Tạo bộ đệm đặc trưng trước để các worker chỉ việc đọc .npy
+    X, y = load_features(args.data)
+    grid = candidates(args.model, args.max_candidates)
+    print(f"{args.model}: {len(grid)} candidates x {args.folds} folds on {args.workers} worker(s)")
+
+    start = time.perf_counter()
+    results = run_search(args.model, grid, args.folds, args.workers, args.data)
+    wall = time.perf_counter() - start
+    fit_total = sum(result['fit_seconds'] for result in results)
+    print(f"Search finished in {wall:.1f}s wall-clock ({fit_total:.1f}s of fitting, "
+          f"{fit_total / wall:.1f}x parallel speed-up)")
+    print(f"{'rank':>4}  {'cv_rmse':>9}  {'± std':>7}  {'cv_r2':>6}  {'wall s':>7}  {'fit s':>6}  params")
+    for rank, result in enumerate(results[:args.top], 1):
+        print(f"{rank:4d}  {result['cv_rmse']:9.1f}  {result['cv_rmse_std']:7.1f}  {result['cv_r2']:6.3f}  "
+              f"{result['wall_seconds']:7.2f}  {result['fit_seconds']:6.2f}  {format_params(result['params'])}")
+
+    # Huấn luyện lại ứng viên tốt nhất trên toàn bộ tập train và đánh giá trên tập test
+    from training import load_dataset
+    from training.models import evaluate, save_model, sequential
+
+    best = results[0]
+    X, y = load_dataset(args.data)
+    X_train, X_test, y_train, y_test = split_dataset(X, y)
+    model = sequential(make_estimator(args.model, best['params'], n_jobs=-1).fit(X_train, y_train))
+    metrics = evaluate(model, X_train, y_train, X_test, y_test)
+    metrics.update(cv_rmse=best['cv_rmse'], cv_rmse_std=best['cv_rmse_std'])
+    print(f"Best: {format_params(best['params'])}")
+    for key, value in metrics.items():
+        print(f"{key}: {value:.4f}")
+    save_model(
+        args.model, model, X, metrics,
+        pointer=None if args.no_publish else ('CANDIDATE' if args.candidate else 'CURRENT'),
+        extra={
+            'params': best['params'],
+            'search': {'folds': args.folds, 'workers': args.workers, 'wall_seconds': wall, 'results': results},
+        },
+    )
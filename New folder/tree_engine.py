@@ -0,0 +1,139 @@
+import numpy as np
+
+
+def floor_float32(values):
+    """Làm tròn xuống float32: với mọi x float32, `x > t` tương đương `x > floor_float32(t)`."""
+    values = np.asarray(values, dtype=np.float64)
+    floored = values.astype(np.float32)
+    rounded_up = floored.astype(np.float64) > values
+    floored[rounded_up] = np.nextafter(floored[rounded_up], np.float32(-np.inf))
+    return floored
+
+
+class FlatForest:
+    """Cây quyết định / rừng ngẫu nhiên được làm phẳng thành các mảng NumPy liên tục.
+
+    Tất cả các cây được nối vào chung một dãy nút. Nút lá trỏ về chính nó nên có thể
+    duyệt đồng thời mọi cây và mọi dòng theo từng tầng, không cần sklearn hay pandas.
+    Kết quả giống hệt sklearn: đầu vào được ép về float32 và so sánh `x <= threshold`
+    như trong `sklearn.tree._tree`, còn rừng cộng dồn dự đoán từng cây theo đúng thứ tự.
+
+    Mọi mảng (kể cả children, is_leaf) được lưu trong tệp joblib không nén nên có thể
+    nạp bằng mmap_mode='r': các tiến trình phục vụ dùng chung trang bộ nhớ chỉ đọc.
+    Kiểu dữ liệu của mảng không cố định: bản nén của compress_forest.py dùng ngưỡng và giá trị
+    float32, chỉ số nút int16/int32, và được nạp, dự đoán theo cùng một đường.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features, feature_names=None,
+                 children=None, is_leaf=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        # children[2 * i] là con trái, children[2 * i + 1] là con phải của nút i
+        self.children = np.stack([left, right], axis=1).ravel() if children is None else children
+        self.is_leaf = left == np.arange(len(left), dtype=left.dtype) if is_leaf is None else is_leaf
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Làm phẳng một DecisionTreeRegressor hoặc RandomForestRegressor đã huấn luyện."""
+        estimators = getattr(model, "estimators_", [model])
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count, dtype=np.int32) + offset
+            is_leaf = tree.children_left == -1
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset).astype(np.int32))
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+            feature_names=getattr(model, "feature_names_in_", None),
+        )
+
+    def to_dict(self):
+        # left/right không được lưu: chúng là các lát cắt của children
+        return {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "value": self.value,
+            "roots": self.roots,
+            "max_depth": self.max_depth,
+            "n_features": self.n_features,
+            "feature_names": self.feature_names,
+            "children": self.children,
+            "is_leaf": self.is_leaf,
+        }
+
+    def save(self, path):
+        import joblib  # nhập khi cần để app khởi động nhanh
+        joblib.dump(self.to_dict(), path)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """mmap_mode='r' ánh xạ các mảng từ tệp thay vì đọc vào bộ nhớ riêng của tiến trình."""
+        import joblib
+        arrays = joblib.load(path, mmap_mode=mmap_mode)
+        if "left" not in arrays:
+            arrays["left"], arrays["right"] = arrays["children"][0::2], arrays["children"][1::2]
+        return cls(**arrays)
+
+    def apply(self, X):
+        """Trả về chỉ số nút lá cho mỗi (cây, dòng), dạng mảng (n_trees, n_rows)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Cần {self.n_features} đặc trưng, nhận được {X.shape[1]}")
+        n_rows = X.shape[0]
+        X_flat = X.ravel()
+        row_offsets = np.arange(0, n_rows * self.n_features, self.n_features)
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            go_right = X_flat.take(row_offsets + self.feature.take(nodes)) > self.threshold.take(nodes)
+            # Tính chỉ số bằng intp: 2 * nodes tràn số nếu chỉ số nút là int16
+            nodes = self.children.take(np.multiply(nodes, 2, dtype=np.intp) + go_right)
+            if self.is_leaf.take(nodes).all():
+                break
+        return nodes
+
+    def predict(self, X):
+        leaf_values = self.value[self.apply(X)]
+        if self.n_trees == 1:
+            return leaf_values[0].astype(np.float64)
+        # Cộng dồn tuần tự như RandomForestRegressor.predict để kết quả trùng khớp từng bit
+        predictions = np.zeros(leaf_values.shape[1], dtype=np.float64)
+        for tree_values in leaf_values:
+            predictions += tree_values
+        predictions /= self.n_trees
+        return predictions
+
+
+def verify_against_sklearn(model, flat_model, X):
+    """Trả về (trùng khớp, sai số lớn nhất) giữa sklearn và FlatForest trên X."""
+    expected = model.predict(X)
+    actual = flat_model.predict(np.asarray(X))
+    return bool(np.array_equal(expected, actual)), float(np.max(np.abs(expected - actual)))